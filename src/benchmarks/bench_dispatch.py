@@ -0,0 +1,50 @@
+"""Load-test the email dispatcher with stubbed model and Gmail backends.
+
+Each simulated agent run makes ``--turns`` model calls of ``--llm-latency`` seconds
+and sends one reply through the fake Gmail service.
+Run from ``src``: ``python -m benchmarks.bench_dispatch``
+"""
+import argparse
+import time
+from concurrent.futures import wait
+
+from benchmarks.fake_gmail import FakeGmailService
+from services.mailer.dispatcher import EmailDispatcher
+
+
+def make_handler(gmail: FakeGmailService, turns: int, llm_latency: float):
+    def handle(email):
+        for _ in range(turns):
+            time.sleep(llm_latency)
+        gmail.users().messages().send(userId='me', body={'raw': email['id']}).execute()
+    return handle
+
+
+def run(concurrency: int, emails: int, senders: int, turns: int, llm_latency: float) -> float:
+    gmail = FakeGmailService(latency=0.01)
+    dispatcher = EmailDispatcher(make_handler(gmail, turns, llm_latency), max_workers=concurrency)
+    batch = [{'id': str(i), 'sender_email': f"customer{i % senders}@example.com"} for i in range(emails)]
+    start = time.perf_counter()
+    wait(dispatcher.dispatch(batch))
+    elapsed = time.perf_counter() - start
+    dispatcher.shutdown()
+    return emails / elapsed * 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--emails', type=int, default=64)
+    parser.add_argument('--senders', type=int, default=32)
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'emails/min':>11}")
+    for concurrency in args.concurrency:
+        rate = run(concurrency, args.emails, args.senders, args.turns, args.llm_latency)
+        print(f"{concurrency:>11} {rate:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""End-to-end throughput of process_emails with every external service replaced locally.
+
+Gmail is the in-process fake, the LLM is a scripted chat model driving the real
+LangGraph agent, and prices come from the fake pricing API on a local port.
+Each run pushes N order emails through fetch, the work queue, the agent, pricing,
+invoice rendering and send, then reports throughput, latency and peak RSS.
+Run from ``src``: ``python -m benchmarks.bench_e2e``
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+
+from benchmarks.fake_gmail import FakeGmailService
+from models.product_types import APPLE_PRODUCT_PRICES
+
+PORT = 3012
+CUSTOMERS = [f"customer{i}@example.com" for i in range(200)]
+SIZES = (10, 100, 1000)
+
+
+def configure_environment(state_dir: str, port: int = PORT) -> None:
+    """Point every piece of persistent state at a scratch directory before the mailer is imported."""
+    os.environ.update({
+        'CHECKPOINT_DB_PATH': os.path.join(state_dir, 'checkpoints.sqlite'),
+        'WORK_QUEUE_PATH': os.path.join(state_dir, 'work_queue.sqlite'),
+        'GMAIL_SYNC_STATE_PATH': os.path.join(state_dir, 'gmail_sync.json'),
+        'RESPONSE_CACHE_PATH': os.path.join(state_dir, 'response_cache.sqlite'),
+        'ALLOWED_CUSTOMERS': ','.join(CUSTOMERS),
+        'PRICING_API_URL': f"http://127.0.0.1:{port}",
+        'METRICS_ENABLED': '1',
+        # The fake Gmail does not throttle, so the outbox should not either
+        'GMAIL_SEND_RATE': '10000',
+        'GMAIL_SEND_BURST': '10000',
+    })
+
+
+def add_orders(gmail: FakeGmailService, count: int, rng: random.Random) -> None:
+    products = list(APPLE_PRODUCT_PRICES)
+    for i in range(count):
+        lines = [f"{rng.randint(1, 3)} {product}" for product in rng.sample(products, rng.randint(1, 3))]
+        gmail.add_message(f"Customer {i} <{rng.choice(CUSTOMERS)}>", f"Order #{i}",
+                          "Please confirm my order:\n" + '\n'.join(lines))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(samples, pct: float) -> float:
+    return statistics.quantiles(samples, n=100)[pct - 1] if len(samples) > 1 else samples[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Seconds per scripted model call')
+    parser.add_argument('--gmail-latency', type=float, default=0.0, help='Seconds per fake Gmail round-trip')
+    parser.add_argument('--no-fast-path', action='store_true', help='Send every order through the agent')
+    args = parser.parse_args()
+
+    configure_environment(tempfile.mkdtemp(prefix='bench_e2e_'))
+    # Imported after configure_environment so module-level settings pick up the scratch paths
+    # pylint: disable=import-outside-toplevel
+    import mailer
+    from benchmarks.bench_pricing import start_api
+    from benchmarks.fake_chat_model import ScriptedChatModel
+    from services.mailer import metrics
+    from services.mailer.dispatcher import EmailDispatcher
+    from services.mailer.utils.get_gmail_service import use_gmail_service
+
+    server = start_api(PORT)
+    gmail = FakeGmailService(latency=args.gmail_latency)
+    use_gmail_service(gmail)
+    chat_model = ScriptedChatModel(latency=args.llm_latency)
+    mailer.use_chat_model(chat_model, fast_path=not args.no_fast_path)
+    rng = random.Random(42)
+
+    # Latency runs from the start of the poll, i.e. from when the email was first seen
+    latencies = []
+    start = 0.0
+
+    def timed_handler(email):
+        try:
+            return mailer.handle_queued_email(email)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    mailer.dispatcher = EmailDispatcher(timed_handler, max_workers=mailer.dispatcher.max_workers)
+
+    print(f"{'emails':>7} {'emails/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'llm calls':>10} {'sent':>6} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        add_orders(gmail, size, rng)
+        llm_calls, sent = chat_model.calls, len(gmail.sent)
+        latencies.clear()
+        start = time.perf_counter()
+        futures = mailer.process_emails()
+        wait(futures)
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for f in futures if f.exception() is not None)
+        latencies_ms = [s * 1000 for s in latencies] or [0.0]
+        print(f"{size:>7} {len(futures) / elapsed:>9.1f} {percentile(latencies_ms, 50):>8.1f} "
+              f"{percentile(latencies_ms, 99):>8.1f} {chat_model.calls - llm_calls:>10} "
+              f"{len(gmail.sent) - sent:>6} {peak_rss_mb():>12.1f}"
+              + (f"  ({failed} failed)" if failed else ''))
+
+    print(f"\nLLM tokens: {metrics.LLM_TOKENS.value(type='input'):.0f} in, "
+          f"{metrics.LLM_TOKENS.value(type='output'):.0f} out")
+    mailer.dispatcher.shutdown()
+    use_gmail_service(None)
+    server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
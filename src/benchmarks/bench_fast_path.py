@@ -0,0 +1,88 @@
+"""Compare LLM calls and latency per order between the ReAct agent and the order fast path.
+
+Orders are handled one at a time through mailer.handle_email with fake Gmail, the
+fake pricing API and a scripted chat model that sleeps ``--llm-latency`` per call.
+A share of the emails ask a question, which the fast path hands back to the agent.
+Run from ``src``: ``python -m benchmarks.bench_fast_path``
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.bench_e2e import CUSTOMERS, configure_environment, percentile
+from models.product_types import APPLE_PRODUCT_PRICES
+
+PORT = 3013
+
+
+def make_orders(count: int, rng: random.Random, question_ratio: float, prefix: str) -> List[Dict]:
+    products = list(APPLE_PRODUCT_PRICES)
+    emails = []
+    for i in range(count):
+        sender = rng.choice(CUSTOMERS)
+        lines = [f"{rng.randint(1, 3)} {product}" for product in rng.sample(products, rng.randint(1, 5))]
+        question = "\nCan you deliver before Friday?" if rng.random() < question_ratio else ''
+        emails.append({
+            'id': f"{prefix}-{i:05d}",
+            'subject': f"Order #{i}",
+            'from': f"Customer {i} <{sender}>",
+            'sender_email': sender,
+            'body': "Please confirm my order:\n" + '\n'.join(lines) + question,
+        })
+    return emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Seconds per scripted model call')
+    parser.add_argument('--question-ratio', type=float, default=0.1,
+                        help='Share of emails that need the agent')
+    args = parser.parse_args()
+
+    configure_environment(tempfile.mkdtemp(prefix='bench_fast_path_'), PORT)
+    # pylint: disable=import-outside-toplevel
+    import mailer
+    from benchmarks.bench_pricing import start_api
+    from benchmarks.fake_chat_model import ScriptedChatModel
+    from benchmarks.fake_gmail import FakeGmailService
+    from services.mailer import metrics
+    from services.mailer.outbox import get_outbox
+    from services.mailer.utils.get_gmail_service import use_gmail_service
+
+    server = start_api(PORT)
+    gmail = FakeGmailService()
+    use_gmail_service(gmail)
+
+    modes = {
+        'agent, item-by-item pricing': (ScriptedChatModel(latency=args.llm_latency, bulk_pricing=False), False),
+        'agent, bulk pricing': (ScriptedChatModel(latency=args.llm_latency), False),
+        'fast path + agent fallback': (ScriptedChatModel(latency=args.llm_latency), True),
+    }
+    print(f"{args.orders} orders, {args.llm_latency * 1000:.0f} ms per LLM call, "
+          f"{args.question_ratio:.0%} need the agent")
+    print(f"{'mode':<30} {'LLM calls/order':>16} {'p50 ms':>8} {'p99 ms':>8} {'fast':>5} {'agent':>6}")
+    for index, (name, (chat_model, use_fast_path)) in enumerate(modes.items()):
+        mailer.use_chat_model(chat_model, fast_path=use_fast_path)
+        fast_before, agent_before = metrics.ORDER_PATHS.value(path='fast'), metrics.ORDER_PATHS.value(path='agent')
+        latencies = []
+        for email in make_orders(args.orders, random.Random(42), args.question_ratio, f"mode{index}"):
+            start = time.perf_counter()
+            mailer.handle_email(email)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<30} {chat_model.calls / args.orders:>16.2f} {statistics.median(latencies):>8.1f} "
+              f"{percentile(latencies, 99):>8.1f} "
+              f"{metrics.ORDER_PATHS.value(path='fast') - fast_before:>5.0f} "
+              f"{metrics.ORDER_PATHS.value(path='agent') - agent_before:>6.0f}")
+
+    # Let queued replies reach the fake before it is removed
+    get_outbox().shutdown()
+    use_gmail_service(None)
+    server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
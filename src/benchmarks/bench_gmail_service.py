@@ -0,0 +1,60 @@
+"""Measure per-call overhead of get_gmail_service before and after client caching.
+
+Uses a throwaway token that is valid for an hour, so no network access is needed.
+Run from ``src``: ``python -m benchmarks.bench_gmail_service``
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TOKEN_DIR = tempfile.mkdtemp()
+os.environ['GMAIL_TOKEN_PATH'] = os.path.join(TOKEN_DIR, 'token.json')
+
+# pylint: disable=wrong-import-position
+from googleapiclient.discovery import build
+from google.oauth2.credentials import Credentials
+from services.mailer.utils.get_gmail_service import SCOPES, TOKEN_PATH, get_gmail_service
+
+
+def write_token() -> None:
+    with open(TOKEN_PATH, 'w', encoding='utf-8') as f:
+        json.dump({
+            'token': 'fake-access-token',
+            'refresh_token': 'fake-refresh-token',
+            'client_id': 'bench.apps.googleusercontent.com',
+            'client_secret': 'bench-secret',
+            'scopes': SCOPES,
+            'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat() + 'Z',
+        }, f)
+
+
+def uncached_service():
+    """The original implementation: read token.json and build a client on every call."""
+    creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+    return build('gmail', 'v1', credentials=creds)
+
+
+def measure(fn, calls: int) -> float:
+    fn()  # warm-up, also populates caches for the cached path
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200)
+    args = parser.parse_args()
+
+    write_token()
+    for name, fn in (('uncached', uncached_service), ('cached', get_gmail_service)):
+        per_call = measure(fn, args.calls)
+        print(f"{name:>9}: {per_call * 1e6:10.1f} us/call")
+
+
+if __name__ == '__main__':
+    main()
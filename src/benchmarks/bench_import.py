@@ -0,0 +1,70 @@
+"""Measure cold-start import time of the mailer with ``python -X importtime``.
+
+Each run imports the module in a fresh interpreter, so nothing is cached in
+``sys.modules``. Reports the median total and the top-level packages that spent the
+most time importing in the median run. With ``--max-ms`` it exits non-zero when the median exceeds the
+budget, so CI can catch a heavy import creeping back in.
+Run from ``src``: ``python -m benchmarks.bench_import``
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, Set, Tuple
+
+# Dependencies the mailer should only load once it handles an email
+HEAVY = ('langchain_anthropic', 'langgraph', 'googleapiclient.discovery', 'reportlab', 'requests')
+
+
+def import_time(module: str) -> Tuple[float, Dict[str, float], Set[str]]:
+    """Import module in a fresh interpreter.
+
+    Returns total ms, self ms summed per top-level package, and the names of all
+    loaded modules.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+    )
+    total = 0.0
+    packages: Dict[str, float] = defaultdict(float)
+    loaded: Set[str] = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        loaded.add(module)
+        packages[module.split('.')[0]] += int(self_us) / 1000
+        # Only outermost imports count towards the total so nested modules are not added twice
+        if not name.startswith('  '):
+            total += int(cumulative) / 1000
+    return total, packages, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default='mailer')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, help='Fail if the median import time exceeds this')
+    args = parser.parse_args()
+
+    runs = sorted((import_time(args.module) for _ in range(args.runs)), key=lambda run: run[0])
+    median_total, packages, loaded = runs[len(runs) // 2]
+    print(f"import {args.module}: median {median_total:.1f} ms over {args.runs} runs "
+          f"(min {runs[0][0]:.1f}, max {runs[-1][0]:.1f})")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30} {ms:>8.1f} ms")
+
+    heavy = [name for name in HEAVY if name in loaded]
+    print(f"heavy dependencies loaded: {', '.join(heavy) or 'none'}")
+    if args.max_ms is not None and median_total > args.max_ms:
+        print(f"median import time {median_total:.1f} ms exceeds the {args.max_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
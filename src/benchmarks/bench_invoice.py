@@ -0,0 +1,93 @@
+"""Benchmark invoice rendering.
+
+Compares in-memory rendering with the old write/read/remove file round-trip
+(syscall counts come from /proc/self/io, Linux only), then reports render time,
+peak memory and page count for large orders.
+Run from ``src``: ``python -m benchmarks.bench_invoice``
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+from services.mailer.utils.invoice.generate_invoice import OrderDetails, OrderItem, create_invoice_pdf
+
+ORDER = OrderDetails(
+    customer_name="Bench Customer",
+    items=[OrderItem(description="MacBook Pro 14", quantity=2, price=1599.00)],
+)
+
+
+def read_io_counters():
+    try:
+        with open('/proc/self/io', encoding='utf-8') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['syscr']) + int(fields['syscw'])
+    except (FileNotFoundError, KeyError):
+        return None
+
+
+def in_memory():
+    return create_invoice_pdf(ORDER)
+
+
+def via_file(directory: str):
+    # What send_email used to do: write the PDF to disk, read it back, then delete it
+    path = os.path.join(directory, f"invoice_{time.time_ns()}.pdf")
+    with open(path, 'wb') as f:
+        f.write(create_invoice_pdf(ORDER))
+    with open(path, 'rb') as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+def measure(fn, count: int):
+    fn()
+    syscalls_before = read_io_counters()
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    elapsed = time.perf_counter() - start
+    syscalls_after = read_io_counters()
+    per_invoice = None if syscalls_before is None else (syscalls_after - syscalls_before) / count
+    return count / elapsed, per_invoice
+
+
+def render_large(items: int):
+    order = OrderDetails(
+        customer_name="Bench Wholesale Ltd",
+        items=[OrderItem(description=f"Accessory #{i}", quantity=i % 7 + 1, price=19.99) for i in range(items)],
+    )
+    tracemalloc.start()
+    start = time.perf_counter()
+    pdf = create_invoice_pdf(order)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(re.findall(rb'/Type\s*/Page(?!s)', pdf)), len(pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--items', type=int, nargs='+', default=[10, 1000, 10000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'path':>10} {'invoices/s':>11} {'read+write syscalls/invoice':>28}")
+        for name, fn in (('file', lambda: via_file(directory)), ('in-memory', in_memory)):
+            rate, syscalls = measure(fn, args.count)
+            syscalls = 'n/a' if syscalls is None else f"{syscalls:.1f}"
+            print(f"{name:>10} {rate:>11.1f} {syscalls:>28}")
+
+    print(f"\n{'items':>6} {'seconds':>8} {'peak MiB':>9} {'pages':>6} {'PDF KiB':>8}")
+    for items in args.items:
+        elapsed, peak, pages, size = render_large(items)
+        print(f"{items:>6} {elapsed:>8.3f} {peak / 2**20:>9.1f} {pages:>6} {size / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Throughput of the multi-mailbox supervisor as worker processes are added.
+
+Every worker process serves its shard of mailboxes against per-mailbox fake
+Gmail inboxes, a scripted chat model sleeping ``--llm-latency`` per call and the
+fake pricing API. Progress is read from the mailboxes' work queues on disk.
+Reports steady-state emails/sec (10% to 90% of completions) per worker count,
+then two scenarios:
+
+- one flooded mailbox on a single worker, with and without the per-mailbox quantum
+- a worker of the largest pool killed mid-run, whose mailboxes move to the others
+
+Run from ``src``: ``python -m benchmarks.bench_mailboxes``
+"""
+import argparse
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from benchmarks.bench_e2e import CUSTOMERS, add_orders, configure_environment
+
+PORT = 3014
+TIMEOUT = 300
+
+
+class FakeMailboxes:
+    """Stand-in Gmail client that routes each call to the current mailbox's own fake inbox.
+
+    An inbox is filled on first use from a seed derived from the mailbox name, so a
+    worker that takes over a mailbox sees the same message ids as the one before.
+    """
+
+    def __init__(self, orders: Dict[str, int], latency: float):
+        self._orders = orders
+        self._latency = latency
+        self._inboxes = {}
+        self._lock = threading.Lock()
+
+    def _inbox(self):
+        # pylint: disable=import-outside-toplevel
+        from benchmarks.fake_gmail import FakeGmailService
+        from services.mailer.mailboxes import current_mailbox
+
+        name = current_mailbox().name
+        with self._lock:
+            if name not in self._inboxes:
+                inbox = FakeGmailService(latency=self._latency)
+                add_orders(inbox, self._orders[name], random.Random(name))
+                self._inboxes[name] = inbox
+            return self._inboxes[name]
+
+    def __getattr__(self, name):
+        return getattr(self._inbox(), name)
+
+
+def bench_worker(slot: int, control, orders: Dict[str, int], llm_latency: float, gmail_latency: float,
+                 quantum: int) -> None:
+    """Worker process entry point: fakes in place of Gmail and Claude, then the real shard loop."""
+    # pylint: disable=import-outside-toplevel
+    import mailer
+    from benchmarks.fake_chat_model import ScriptedChatModel
+    from services.mailer.utils.get_gmail_service import use_gmail_service
+
+    # Keep the per-email log lines of every worker out of the report
+    sys.stdout = open(os.devnull, 'w')  # pylint: disable=consider-using-with,unspecified-encoding
+    use_gmail_service(FakeMailboxes(orders, gmail_latency))
+    mailer.use_chat_model(ScriptedChatModel(latency=llm_latency))
+    mailer.run_shard_worker(slot, control, check_interval=0.05, max_interval=0.5, quantum=quantum)
+
+
+def run(workers: int, orders: Dict[str, int], args, quantum: int, kill_at: Optional[float] = None) -> Dict:
+    """Serve all mailboxes until every order is done; returns throughput and per-mailbox finish times."""
+    # pylint: disable=import-outside-toplevel
+    from services.mailer.mailboxes import Mailbox
+    from services.mailer.supervisor import Supervisor
+    from services.mailer.work_queue import DONE, WorkQueue
+
+    state_dir = tempfile.mkdtemp(prefix='bench_mailboxes_')
+    mailboxes = [Mailbox(name=name, token_path=os.path.join(state_dir, name, 'token.json'),
+                         state_dir=os.path.join(state_dir, name), allowed_customers=tuple(CUSTOMERS))
+                 for name in orders]
+    queues = {mailbox.name: WorkQueue(mailbox.work_queue_path) for mailbox in mailboxes}
+    total = sum(orders.values())
+
+    supervisor = Supervisor(mailboxes, bench_worker, workers=workers,
+                            args=(orders, args.llm_latency, args.gmail_latency, quantum))
+    start = time.perf_counter()
+    supervisor.start()
+    timeline = []
+    finished = {}
+    killed = False
+    try:
+        while len(finished) < len(orders) and time.perf_counter() - start < TIMEOUT:
+            time.sleep(0.05)
+            now = time.perf_counter() - start
+            done = {name: queue.counts()[DONE] for name, queue in queues.items()}
+            timeline.append((now, sum(done.values())))
+            for name, count in done.items():
+                if count >= orders[name] and name not in finished:
+                    finished[name] = now
+            if kill_at is not None and not killed and sum(done.values()) >= kill_at * total:
+                pid = supervisor.pids()[0]
+                os.kill(pid, signal.SIGKILL)
+                killed = True
+                print(f"  killed worker 0 (pid {pid}) at {now:.1f}s; it served {supervisor.assignment()[0]}")
+            if supervisor.check():
+                print(f"  mailboxes now served as {supervisor.assignment()}")
+    finally:
+        supervisor.stop()
+
+    done_total = timeline[-1][1] if timeline else 0
+    t10 = next(t for t, count in timeline if count >= 0.1 * total)
+    t90 = next((t for t, count in timeline if count >= 0.9 * total), timeline[-1][0])
+    return {
+        'rate': 0.8 * total / (t90 - t10) if t90 > t10 else 0.0,
+        'first': next((t for t, count in timeline if count > 0), 0.0),
+        'elapsed': timeline[-1][0],
+        'done': done_total,
+        'total': total,
+        'finished': finished,
+        'restarts': supervisor.restarts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--mailboxes', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=60, help='Orders per mailbox')
+    parser.add_argument('--llm-latency', type=float, default=0.1, help='Seconds per scripted model call')
+    parser.add_argument('--gmail-latency', type=float, default=0.01, help='Seconds per fake Gmail round-trip')
+    parser.add_argument('--concurrency', type=int, default=4, help='Agent runs in parallel per worker')
+    parser.add_argument('--flood', type=int, default=10, help='The flooded mailbox gets this many times the orders')
+    args = parser.parse_args()
+
+    configure_environment(tempfile.mkdtemp(prefix='bench_mailboxes_'), PORT)
+    # Workers inherit these; short leases let a killed worker's emails be picked up quickly
+    os.environ.update({'MAX_CONCURRENCY': str(args.concurrency), 'WORK_QUEUE_LEASE_SECONDS': '3',
+                       'METRICS_ENABLED': '0'})
+    # pylint: disable=import-outside-toplevel
+    from benchmarks.bench_pricing import start_api
+    from services.mailer.settings import settings
+
+    server = start_api(PORT)
+    names = [f"shop{i:02d}" for i in range(args.mailboxes)]
+    orders = {name: args.orders for name in names}
+    print(f"{args.mailboxes} mailboxes x {args.orders} orders, {args.llm_latency * 1000:.0f} ms per LLM call, "
+          f"{args.concurrency} agent runs per worker, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'emails/s':>9} {'speedup':>8} {'first s':>8} {'total s':>8} {'done':>9}")
+    baseline = None
+    for workers in args.workers:
+        result = run(workers, orders, args, settings.mailbox_quantum)
+        baseline = baseline or result['rate'] / workers
+        print(f"{workers:>7} {result['rate']:>9.1f} {result['rate'] / baseline:>7.2f}x {result['first']:>8.1f} "
+              f"{result['elapsed']:>8.1f} {result['done']:>4}/{result['total']:<4}")
+
+    workers = max(args.workers)
+    flooded = dict(orders, **{names[0]: args.orders * args.flood})
+    print(f"\n{names[0]} flooded with {args.orders * args.flood} orders, 1 worker; "
+          "seconds until the other mailboxes / the flooded one are done")
+    for label, quantum in ((f"quantum {settings.mailbox_quantum}", settings.mailbox_quantum),
+                           ('no quantum', 1 << 30)):
+        result = run(1, flooded, args, quantum)
+        others = max(t for name, t in result['finished'].items() if name != names[0]) \
+            if len(result['finished']) > 1 else float('nan')
+        print(f"  {label:<12} others {others:6.1f}s   flooded {result['finished'].get(names[0], float('nan')):6.1f}s")
+
+    print(f"\nworker 0 of {workers} killed at 30% of the orders")
+    result = run(workers, orders, args, settings.mailbox_quantum, kill_at=0.3)
+    print(f"  {result['done']}/{result['total']} orders done in {result['elapsed']:.1f}s, "
+          f"{result['restarts']} workers restarted")
+    server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
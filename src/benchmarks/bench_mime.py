@@ -0,0 +1,115 @@
+"""Measure body extraction time and prompt size over a corpus of real-world-shaped emails.
+
+Each message is run through extract_body on its Gmail ``format='full'`` payload and,
+for comparison, through a stdlib parse of the ``format='raw'`` message.
+Run from ``src``: ``python -m benchmarks.bench_mime``
+"""
+import argparse
+import email
+import email.policy
+import os
+import timeit
+from email.message import EmailMessage
+from typing import Dict
+
+from benchmarks.fake_gmail import FakeGmailService
+from services.mailer.utils.mime_body import decode_base64url, extract_body
+
+ORDER = "Hi,\n\nPlease send us 2 iphone_15_pro and 1 macbook_air_13.\nShip to our Berlin office.\n\nThanks,\nAnna"
+SIGNATURE = "\n\n-- \nAnna Schmidt\nProcurement | Example GmbH\n+49 30 1234567\nwww.example.com\n"
+HTML_ORDER = ("<html><head><style>p {margin:0}</style></head><body><div dir=\"ltr\"><p>Hi,</p>"
+              "<p>Please send us <b>2 iphone_15_pro</b> and 1 macbook_air_13.</p><p>Thanks,<br>Anna</p></div>"
+              "<div class=\"gmail_quote\">On Mon, Jan 6, 2025 at 9:00 AM Shop wrote:<blockquote>"
+              + "<p>Our catalogue has changed, see the table below.</p>" * 40 + "</blockquote></div></body></html>")
+
+
+def plain() -> EmailMessage:
+    msg = EmailMessage()
+    msg.set_content(ORDER + SIGNATURE)
+    return msg
+
+
+def alternative() -> EmailMessage:
+    msg = plain()
+    msg.add_alternative(HTML_ORDER, subtype='html')
+    return msg
+
+
+def html_only() -> EmailMessage:
+    msg = EmailMessage()
+    msg.set_content(HTML_ORDER, subtype='html')
+    return msg
+
+
+def long_thread() -> EmailMessage:
+    history = ''.join(f"\nOn Mon, Jan {day}, 2025 at 9:00 AM Shop <shop@example.com> wrote:\n"
+                      + '\n'.join(f"> {'> ' * depth}Earlier message line {n}" for n in range(15))
+                      for day, depth in zip(range(1, 9), range(8)))
+    msg = EmailMessage()
+    msg.set_content(ORDER + SIGNATURE + history)
+    return msg
+
+
+def with_attachment() -> EmailMessage:
+    msg = alternative()
+    msg.add_attachment(os.urandom(2 * 1024 * 1024), maintype='application', subtype='pdf', filename='po-4711.pdf')
+    msg.add_attachment(os.urandom(300 * 1024), maintype='image', subtype='png', filename='logo.png')
+    return msg
+
+
+def latin1() -> EmailMessage:
+    msg = EmailMessage()
+    msg.set_content("Grüße aus Köln!\n" + ORDER, charset='iso-8859-1', cte='quoted-printable')
+    return msg
+
+
+def large_order() -> EmailMessage:
+    msg = EmailMessage()
+    lines = '\n'.join(f"{n % 5 + 1} ipad_air - cost centre {n:04d}" for n in range(400))
+    msg.set_content("Please confirm this order:\n" + lines + SIGNATURE)
+    return msg
+
+
+CORPUS = {
+    'plain + signature': plain,
+    'multipart/alternative': alternative,
+    'html only, quoted': html_only,
+    'reply thread, 8 levels': long_thread,
+    'alt + 2.3 MB attachments': with_attachment,
+    'iso-8859-1': latin1,
+    '400-line order': large_order,
+}
+
+
+def stdlib_body(message: Dict) -> str:
+    parsed = email.message_from_bytes(decode_base64url(message['raw']), policy=email.policy.default)
+    body = parsed.get_body(('plain', 'html'))
+    return body.get_content() if body is not None else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    gmail = FakeGmailService()
+    print(f"{'message':<26} {'raw KB':>8} {'snippet':>8} {'stdlib chars':>13} {'extracted':>10} "
+          f"{'stdlib µs':>10} {'extract µs':>11}")
+    for name, build in CORPUS.items():
+        msg = build()
+        msg['From'] = 'Anna Schmidt <anna@example.com>'
+        msg['Subject'] = 'Order'
+        message_id = gmail.add_mime_message(msg)
+        full = gmail.get_message(message_id, 'full', None)
+        raw = gmail.get_message(message_id, 'raw', None)
+
+        number = max(1, args.number // 20) if len(raw['raw']) > 1_000_000 else args.number
+        stdlib_us = timeit.timeit(lambda: stdlib_body(raw), number=number) / number * 1e6
+        extract_us = timeit.timeit(lambda: extract_body(full['payload']), number=args.number) / args.number * 1e6
+        print(f"{name:<26} {len(raw['raw']) * 3 / 4 / 1024:>8.1f} {len(full['snippet']):>8} "
+              f"{len(stdlib_body(raw)):>13} {len(extract_body(full['payload']) or ''):>10} "
+              f"{stdlib_us:>10.1f} {extract_us:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
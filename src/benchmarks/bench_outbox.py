@@ -0,0 +1,105 @@
+"""Compare inline replies with the rate-limited outbox against a throttling fake Gmail.
+
+The fake answers 429 once more than ``--send-limit`` sends arrive within a second and
+fails ``--error-rate`` of the rest with 503. Every reply carries a rendered invoice.
+Reports how long the caller (the agent) is blocked, total time, deliveries, lost
+replies and delivery latency.
+Run from ``src``: ``python -m benchmarks.bench_outbox``
+"""
+import argparse
+import base64
+import statistics
+import time
+from concurrent.futures import wait
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from googleapiclient.errors import HttpError
+
+from benchmarks.bench_e2e import percentile
+from benchmarks.fake_gmail import FakeGmailService
+from services.mailer.outbox import Outbox
+from services.mailer.utils.invoice.generate_invoice import OrderDetails, OrderItem, create_invoice_pdf
+
+ORDER = OrderDetails(
+    customer_name="Bench Customer",
+    items=[OrderItem(description=f"Item {n}", quantity=n, price=99.0 * n) for n in range(1, 6)],
+)
+
+
+def build_reply(index: int) -> dict:
+    message = MIMEMultipart()
+    message['to'] = f"customer{index}@example.com"
+    message['subject'] = f"Re: Order #{index}"
+    message.attach(MIMEText('Thank you for your order. Your invoice is attached.', 'plain'))
+    invoice = MIMEApplication(create_invoice_pdf(ORDER), _subtype='pdf')
+    invoice.add_header('Content-Disposition', 'attachment', filename='invoice.pdf')
+    message.attach(invoice)
+    return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')}
+
+
+def run_inline(gmail: FakeGmailService, replies: int):
+    # What send_email used to do: build and send on the agent's thread, no retry
+    lost = 0
+    start = time.perf_counter()
+    for index in range(replies):
+        try:
+            gmail.users().messages().send(userId='me', body=build_reply(index)).execute()
+        except HttpError:
+            lost += 1
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, lost, []
+
+
+def run_outbox(gmail: FakeGmailService, replies: int, rate: float, burst: int, workers: int):
+    outbox = Outbox(send=lambda body: gmail.users().messages().send(userId='me', body=body).execute(),
+                    workers=workers, rate=rate, burst=burst, max_attempts=8, base_backoff=0.2)
+    latencies = []
+    start = time.perf_counter()
+    futures = []
+    for index in range(replies):
+        submitted = time.perf_counter()
+        future = outbox.submit(lambda index=index: build_reply(index), description=f"reply {index}")
+        future.add_done_callback(lambda _, submitted=submitted: latencies.append(time.perf_counter() - submitted))
+        futures.append(future)
+    blocked = time.perf_counter() - start
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    outbox.shutdown()
+    return blocked, elapsed, sum(1 for f in futures if f.exception() is not None), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--replies', type=int, default=100)
+    parser.add_argument('--send-limit', type=int, default=10, help='Sends per second the fake accepts')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='Share of sends failing with 503')
+    parser.add_argument('--gmail-latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    modes = {
+        'inline, no retry': lambda gmail: run_inline(gmail, args.replies),
+        f"outbox {args.send_limit * 0.8:g}/s": lambda gmail: run_outbox(
+            gmail, args.replies, args.send_limit * 0.8, args.send_limit // 2, args.workers),
+        f"outbox {args.send_limit * 2:g}/s (over limit)": lambda gmail: run_outbox(
+            gmail, args.replies, args.send_limit * 2, args.send_limit * 2, args.workers),
+    }
+    print(f"{args.replies} replies, fake Gmail accepts {args.send_limit}/s, {args.error_rate:.0%} 503s, "
+          f"{args.gmail_latency * 1000:.0f} ms per call")
+    print(f"{'mode':<28} {'blocked s':>10} {'total s':>8} {'sent':>5} {'lost':>5} {'429s':>5} {'503s':>5} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for name, run in modes.items():
+        gmail = FakeGmailService(latency=args.gmail_latency, send_limit=args.send_limit,
+                                 send_error_rate=args.error_rate)
+        blocked, elapsed, lost, latencies = run(gmail)
+        latencies_ms = [s * 1000 for s in latencies]
+        p50 = f"{statistics.median(latencies_ms):8.0f}" if latencies_ms else f"{'-':>8}"
+        p99 = f"{percentile(latencies_ms, 99):8.0f}" if latencies_ms else f"{'-':>8}"
+        print(f"{name:<28} {blocked:>10.2f} {elapsed:>8.2f} {len(gmail.sent):>5} {lost:>5} "
+              f"{gmail.throttled:>5} {gmail.send_errors:>5} {p50} {p99}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark order pricing latency against a locally started fake pricing API.
+
+Compares the original one-connection-per-request lookups with the pooled client
+on a cold and a warm cache, plus the async bulk path.
+Run from ``src``: ``python -m benchmarks.bench_pricing``
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from fake_pricing_api import app
+from models.product_types import APPLE_PRODUCT_PRICES
+from services.mailer.utils.pricing_client import PricingClient
+
+PORT = 3011
+
+
+def start_api(port: int = PORT) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def legacy_order(base_url: str, product_ids):
+    # Equivalent of the original bare requests.get: no session, fresh connection each time
+    return {p: httpx.get(f"{base_url}/price/{p}").json()['price'] for p in product_ids}
+
+
+def timed(fn, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    server = start_api()
+    base_url = f"http://127.0.0.1:{PORT}"
+    products = list(APPLE_PRODUCT_PRICES)
+    order = [products[i % len(products)] for i in range(args.items)]
+    client = PricingClient(base_url=base_url)
+
+    def cold():
+        client.invalidate()
+        client.get_prices(order)
+
+    def cold_async():
+        client.invalidate()
+        asyncio.run(client.aget_prices(order))
+
+    print(f"Order with {args.items} line items, median of {args.rounds} rounds")
+    print(f"  legacy (new connection per item): {timed(lambda: legacy_order(base_url, order), args.rounds):8.2f} ms")
+    print(f"  pooled client, cold cache:        {timed(cold, args.rounds):8.2f} ms")
+    print(f"  async bulk, cold cache:           {timed(cold_async, args.rounds):8.2f} ms")
+    print(f"  pooled client, warm cache:        {timed(lambda: client.get_prices(order), args.rounds):8.2f} ms")
+    client.close()
+    server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
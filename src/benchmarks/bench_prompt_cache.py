@@ -0,0 +1,157 @@
+"""Input tokens, time to first token and cost per email with and without prompt caching.
+
+Customer emails (orders, price questions and "what do you sell" inquiries from a
+few recurring customers, so their conversations grow) run through the real agent
+and ChatAnthropic against a local Messages API double (benchmarks.fake_anthropic).
+The first configuration records the double's responses and the second replays
+them, so both see the same model output and differ only in the request. Every
+cached request is checked for breakpoints on the tool definitions, the system
+prompt and the last message. Cost uses Claude Sonnet list prices.
+
+Then the token budget is applied to a read_emails result of ``--inbox`` long
+emails to show what reaches the model.
+Run from ``src``: ``python -m benchmarks.bench_prompt_cache``
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.bench_e2e import configure_environment
+from models.product_types import APPLE_PRODUCT_PRICES
+
+PORT = 3016
+ANTHROPIC_PORT = 3017
+# USD per million tokens
+INPUT_PRICE, CACHE_WRITE_PRICE, CACHE_READ_PRICE, OUTPUT_PRICE = 3.0, 3.75, 0.30, 15.0
+
+
+def make_emails(count: int, customers: int, rng: random.Random) -> List[Dict]:
+    products = list(APPLE_PRODUCT_PRICES)
+    emails = []
+    for i in range(count):
+        sender = f"customer{rng.randrange(customers)}@example.com"
+        kind = rng.random()
+        if kind < 0.5:
+            lines = [f"{rng.randint(1, 3)} {product}" for product in rng.sample(products, rng.randint(1, 3))]
+            subject, body = f"Order #{i}", "Please confirm my order:\n" + '\n'.join(lines)
+        elif kind < 0.75:
+            subject, body = "Price question", f"How much is the {rng.choice(products)}?"
+        else:
+            subject, body = "Question", "What do you sell?"
+        emails.append({'id': f"msg-{i:05d}", 'subject': subject, 'from': f"Customer <{sender}>",
+                       'sender_email': sender, 'body': body})
+    return emails
+
+
+def check_breakpoints(payload: Dict) -> None:
+    """Raise unless the tools, the system prompt and the last message each carry a cache breakpoint."""
+    last_content = payload['messages'][-1]['content']
+    last_blocks = [] if isinstance(last_content, str) else last_content
+    found = {
+        'tools': bool(payload.get('tools')) and 'cache_control' in payload['tools'][-1],
+        'system': isinstance(payload.get('system'), list) and 'cache_control' in payload['system'][-1],
+        'last message': any('cache_control' in block for block in last_blocks),
+    }
+    missing = [name for name, ok in found.items() if not ok]
+    if missing:
+        raise AssertionError(f"No cache breakpoint on: {', '.join(missing)}")
+
+
+def bench_token_budget(inbox: int) -> None:
+    # pylint: disable=import-outside-toplevel
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from langchain_core.messages.utils import count_tokens_approximately
+    from services.mailer.token_budget import INPUT_TOKEN_BUDGET, TOOL_OUTPUT_MAX_TOKENS, fit_token_budget
+
+    rng = random.Random(7)
+    emails = [{'id': f"msg-{i:05d}", 'subject': f"Order #{i}", 'from': f"Customer {i} <c{i}@example.com>",
+               'sender_email': f"c{i}@example.com",
+               'body': ' '.join(rng.choice(['please', 'confirm', 'order', 'iphone', 'thanks', 'delivery'])
+                                for _ in range(600))}
+              for i in range(inbox)]
+    messages = [HumanMessage(content="Check the inbox"),
+                AIMessage(content='', tool_calls=[{'name': 'read_emails', 'args': {}, 'id': 'call_read'}]),
+                ToolMessage(content=json.dumps(emails), tool_call_id='call_read', name='read_emails')]
+    start = time.perf_counter()
+    fitted = fit_token_budget(messages)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"\nread_emails with {inbox} emails: {count_tokens_approximately(messages)} tokens -> "
+          f"{count_tokens_approximately(fitted)} tokens in the model call "
+          f"(TOOL_OUTPUT_MAX_TOKENS={TOOL_OUTPUT_MAX_TOKENS}, INPUT_TOKEN_BUDGET={INPUT_TOKEN_BUDGET}), "
+          f"trimmed in {elapsed:.1f} ms")
+    print(f"  ends with: {fitted[-1].content.splitlines()[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=30)
+    parser.add_argument('--customers', type=int, default=5)
+    parser.add_argument('--base-latency', type=float, default=0.05, help='Simulated seconds before prefill')
+    parser.add_argument('--inbox', type=int, default=100, help='Emails in the read_emails budget example')
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix='bench_prompt_cache_')
+    configure_environment(state_dir, PORT)
+    # Every model call should reach the double
+    os.environ.update({'RESPONSE_CACHE': '0', 'ORDER_FAST_PATH': '0'})
+    # pylint: disable=import-outside-toplevel
+    import mailer
+    from benchmarks.bench_pricing import start_api
+    from benchmarks.fake_anthropic import FakeAnthropicAPI, Recording
+    from benchmarks.fake_gmail import FakeGmailService
+    from services.mailer import token_budget
+    from services.mailer.mailboxes import Mailbox, use_mailbox
+    from services.mailer.outbox import Outbox, get_outbox, wait_for_deliveries
+    from services.mailer.utils.get_gmail_service import use_gmail_service
+
+    server = start_api(PORT)
+    api = FakeAnthropicAPI(Recording(os.path.join(state_dir, 'recording.jsonl')), base_latency=args.base_latency)
+    api_server = api.start(ANTHROPIC_PORT)
+    use_gmail_service(FakeGmailService())
+    emails = make_emails(args.emails, args.customers, random.Random(42))
+
+    print(f"{args.emails} emails from {args.customers} customers through the agent")
+    print(f"{'mode':<18} {'calls':>6} {'input/email':>12} {'cached':>7} {'written':>8} {'uncached':>9} "
+          f"{'ttft ms':>8} {'$/1k emails':>12} {'replayed':>9}")
+    for index, caching in enumerate((False, True)):
+        token_budget.PROMPT_CACHING = caching
+        mailer.use_chat_model(mailer.create_chat_model(anthropic_api_url=f"http://127.0.0.1:{ANTHROPIC_PORT}",
+                                                       api_key='test', max_retries=0), fast_path=False)
+        first_request, replayed_before = len(api.requests), api.recording.replayed
+        # A mailbox per mode gives each its own, initially empty, conversations
+        mailbox = Mailbox(name=f"mode{index}", token_path=os.path.join(state_dir, 'token.json'),
+                          state_dir=os.path.join(state_dir, f"mode{index}"))
+        with use_mailbox(mailbox):
+            for email in emails:
+                with Outbox.track() as deliveries:
+                    mailer.handle_email(email)
+                wait_for_deliveries(deliveries)
+        requests = api.requests[first_request:]
+        if caching:
+            for payload in api.payloads[first_request:]:
+                check_breakpoints(payload)
+        uncached = sum(r[1] for r in requests)
+        read = sum(r[2] for r in requests)
+        written = sum(r[3] for r in requests)
+        total = uncached + read + written
+        cost = (uncached * INPUT_PRICE + written * CACHE_WRITE_PRICE + read * CACHE_READ_PRICE) / 1e6
+        print(f"{'prompt caching' if caching else 'no prompt caching':<18} {len(requests):>6} "
+              f"{total / len(emails):>12.0f} {read / total:>7.0%} {written / total:>8.0%} {uncached / total:>9.0%} "
+              f"{statistics.mean(r[0] for r in requests) * 1000:>8.0f} {cost / len(emails) * 1000:>12.2f} "
+              f"{api.recording.replayed - replayed_before:>4}/{len(requests):<4}")
+    print("(input cost only; output tokens are the same in both modes)")
+
+    bench_token_budget(args.inbox)
+    get_outbox().shutdown()
+    use_gmail_service(None)
+    server.should_exit = True
+    api_server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Compare per-message and batched Gmail fetching against the fake Gmail service.
+
+Run from ``src``: ``python -m benchmarks.bench_read_emails``
+"""
+import argparse
+import functools
+import os
+import tempfile
+import time
+
+CUSTOMER = 'customer@example.com'
+os.environ['ALLOWED_CUSTOMERS'] = CUSTOMER
+
+# pylint: disable=wrong-import-position
+from benchmarks.fake_gmail import FakeGmailService
+from services.mailer.tools.read_mail import fetch_unread_emails
+
+LEGACY_ALLOWED_CUSTOMERS = CUSTOMER.split(',')
+
+
+def legacy_fetch(service):
+    """The original read_emails loop: one get and one modify per message."""
+    messages_api = service.users().messages()
+    request = messages_api.list(userId='me', labelIds=['INBOX', 'UNREAD'])
+    messages = []
+    while request is not None:
+        results = request.execute()
+        messages.extend(results.get('messages', []))
+        request = messages_api.list_next(request, results)
+
+    emails = []
+    for message in messages:
+        msg = messages_api.get(userId='me', id=message['id']).execute()
+        headers = msg['payload']['headers']
+        sender = next(h['value'] for h in headers if h['name'] == 'From')
+        sender_email = sender.split('<')[-1].split('>')[0] if '<' in sender else sender
+        if sender_email not in LEGACY_ALLOWED_CUSTOMERS:
+            continue
+        messages_api.modify(userId='me', id=message['id'], body={'removeLabelIds': ['UNREAD']}).execute()
+        emails.append(message['id'])
+    return emails
+
+
+def build_inbox(count: int, latency: float) -> FakeGmailService:
+    service = FakeGmailService(latency=latency)
+    for i in range(count):
+        # Every fifth message comes from a sender outside the allowlist
+        sender = 'stranger@example.com' if i % 5 == 0 else f"Customer <{CUSTOMER}>"
+        service.add_message(sender, f"Order #{i}", f"Please send 1 iphone_15 (order {i}).")
+    return service
+
+
+def run(fetch, count: int, latency: float):
+    service = build_inbox(count, latency)
+    start = time.perf_counter()
+    fetch(service)
+    return service.round_trips, time.perf_counter() - start
+
+
+def steady_state(backlog: int, new_per_poll: int, polls: int, latency: float, incremental: bool):
+    """Poll repeatedly over an inbox whose unauthorized backlog stays unread forever."""
+    service = FakeGmailService(latency=latency)
+    for i in range(backlog):
+        service.add_message('stranger@example.com', f"Spam #{i}", 'Buy now!')
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_path = os.path.join(state_dir, 'gmail_sync.json')
+        # Prime the history id so the measured polls are all steady-state
+        fetch_unread_emails(service, incremental=incremental, state_path=state_path)
+        service.reset_counters()
+        start = time.perf_counter()
+        for poll in range(polls):
+            for i in range(new_per_poll):
+                service.add_message(CUSTOMER, f"Order {poll}-{i}", 'Please send 1 ipad_air.')
+            fetch_unread_emails(service, incremental=incremental, state_path=state_path)
+        return service.round_trips / polls, service.batched_calls / polls, (time.perf_counter() - start) / polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--latency', type=float, default=0.005, help='Simulated seconds per HTTP round-trip')
+    parser.add_argument('--backlog', type=int, default=1000, help='Unread messages from unauthorized senders')
+    parser.add_argument('--new-per-poll', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'messages':>8} {'path':>8} {'round-trips':>12} {'seconds':>9}")
+    for count in args.sizes:
+        for name, fetch in (('legacy', legacy_fetch),
+                            ('batched', functools.partial(fetch_unread_emails, incremental=False))):
+            round_trips, elapsed = run(fetch, count, args.latency)
+            print(f"{count:>8} {name:>8} {round_trips:>12} {elapsed:>9.3f}")
+
+    print(f"\nSteady state: {args.backlog} unauthorized unread, {args.new_per_poll} new per poll")
+    print(f"{'mode':>12} {'round-trips':>12} {'batched gets':>13} {'sec/poll':>9}")
+    for name, incremental in (('full', False), ('incremental', True)):
+        round_trips, gets, elapsed = steady_state(args.backlog, args.new_per_poll, 5, args.latency, incremental)
+        print(f"{name:>12} {round_trips:>12.1f} {gets:>13.1f} {elapsed:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Model calls, latency and tokens saved by the response cache on repeated inquiries.
+
+A mix of "what do you sell" inquiries, price questions about a few products and
+orders, each from a different customer, goes through mailer.handle_email with fake
+Gmail, the fake pricing API and a scripted chat model sleeping ``--llm-latency``
+per call. The same emails run without the cache, with an empty cache, and again
+with the cache reopened from disk as after a restart. Every run checks that each
+reply went to its own customer under their own name and that every order was
+invoiced by a live model call.
+Run from ``src``: ``python -m benchmarks.bench_response_cache``
+"""
+import argparse
+import base64
+import email as email_parser
+from email import policy
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.bench_e2e import configure_environment, percentile
+from models.product_types import APPLE_PRODUCT_PRICES
+
+PORT = 3015
+INQUIRIES = ["What do you sell?", "what do you  sell?", "Hi,\nwhat do you sell?\n"]
+ASKED_PRODUCTS = ['iphone_15_pro', 'macbook_pro_14', 'airpods_pro']
+
+
+def make_emails(count: int, rng: random.Random, order_ratio: float, prefix: str) -> List[Dict]:
+    products = list(APPLE_PRODUCT_PRICES)
+    emails = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < order_ratio:
+            lines = [f"{rng.randint(1, 3)} {product}" for product in rng.sample(products, rng.randint(1, 3))]
+            subject, body = f"Order #{i}", "Please confirm my order:\n" + '\n'.join(lines)
+        elif kind < (1 + order_ratio) / 2:
+            subject, body = "Question", rng.choice(INQUIRIES)
+        else:
+            subject, body = "Price question", f"How much is the {rng.choice(ASKED_PRODUCTS)}?"
+        # Each email comes from a new customer, whose conversation starts empty
+        sender = f"{prefix}{i}@example.com"
+        emails.append({'id': f"{prefix}-{i:05d}", 'subject': subject, 'from': f"Customer {prefix}{i} <{sender}>",
+                       'sender_email': sender, 'body': body})
+    return emails
+
+
+def check_replies(sent: List[str], emails: List[Dict]) -> int:
+    """Raise if a reply went to the wrong customer or greets someone else; returns the number of replies."""
+    names = {e['sender_email']: e['from'].split('<')[0].strip() for e in emails}
+    for raw in sent:
+        message = email_parser.message_from_bytes(base64.urlsafe_b64decode(raw), policy=policy.default)
+        to = message['To']
+        if to not in names:
+            raise AssertionError(f"Reply sent to unknown address {to}")
+        body = next(part for part in message.walk() if part.get_content_type() == 'text/plain').get_content()
+        if 'Dear' in body and f"Dear {names[to]}," not in body:
+            raise AssertionError(f"Reply to {to} does not greet {names[to]}: {body[:60]!r}")
+    return len(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Seconds per scripted model call')
+    parser.add_argument('--order-ratio', type=float, default=0.3, help='Share of emails that place an order')
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix='bench_response_cache_')
+    configure_environment(state_dir, PORT)
+    # pylint: disable=import-outside-toplevel
+    import mailer
+    from benchmarks.bench_pricing import start_api
+    from benchmarks.fake_chat_model import ScriptedChatModel
+    from benchmarks.fake_gmail import FakeGmailService
+    from services.mailer import metrics
+    from services.mailer.outbox import Outbox, get_outbox, wait_for_deliveries
+    from services.mailer.response_cache import ResponseCache, cache_stats
+    from services.mailer.utils.get_gmail_service import use_gmail_service
+
+    server = start_api(PORT)
+    cache_path = os.path.join(state_dir, 'bench_cache.sqlite')
+    modes = {
+        'no cache': lambda: None,
+        'empty cache': lambda: ResponseCache(cache_path),
+        'cache after restart': lambda: ResponseCache(cache_path),
+    }
+    print(f"{args.emails} emails, {args.order_ratio:.0%} orders, {args.llm_latency * 1000:.0f} ms per LLM call")
+    print(f"{'mode':<20} {'LLM calls':>9} {'hit rate':>9} {'p50 ms':>7} {'p99 ms':>7} {'total s':>8} "
+          f"{'saved s':>8} {'saved tokens':>13} {'invoices':>9}")
+    for index, (name, make_cache) in enumerate(modes.items()):
+        gmail = FakeGmailService()
+        use_gmail_service(gmail)
+        chat_model = ScriptedChatModel(latency=args.llm_latency, cache=make_cache())
+        mailer.use_chat_model(chat_model)
+        emails = make_emails(args.emails, random.Random(42), args.order_ratio, f"m{index}c")
+        orders = sum(1 for e in emails if e['subject'].startswith('Order'))
+        before, invoices_before = cache_stats(), metrics.INVOICES.value()
+        latencies = []
+        start = time.perf_counter()
+        for email in emails:
+            started = time.perf_counter()
+            with Outbox.track() as deliveries:
+                mailer.handle_email(email)
+            wait_for_deliveries(deliveries)
+            latencies.append((time.perf_counter() - started) * 1000)
+        elapsed = time.perf_counter() - start
+        after = cache_stats()
+        invoices = metrics.INVOICES.value() - invoices_before
+        check_replies(gmail.sent, emails)
+        if invoices != orders:
+            raise AssertionError(f"{name}: {invoices:.0f} invoices for {orders} orders")
+        hits, lookups = after['hits'] - before['hits'], after['lookups'] - before['lookups']
+        saved_tokens = sum(after[k] - before[k] for k in ('saved_input_tokens', 'saved_output_tokens'))
+        print(f"{name:<20} {chat_model.calls:>9} {hits / lookups if lookups else 0.0:>9.0%} "
+              f"{statistics.median(latencies):>7.1f} {percentile(latencies, 99):>7.1f} {elapsed:>8.1f} "
+              f"{after['saved_seconds'] - before['saved_seconds']:>8.1f} {saved_tokens:>13.0f} "
+              f"{invoices:>5.0f}/{orders:<3}")
+
+    get_outbox().shutdown()
+    use_gmail_service(None)
+    server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
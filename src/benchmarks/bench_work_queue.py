@@ -0,0 +1,63 @@
+"""Benchmark enqueue and dequeue throughput of the durable work queue.
+
+Run from ``src``: ``python -m benchmarks.bench_work_queue``
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from services.mailer.work_queue import WorkQueue
+
+
+def make_emails(count: int, offset: int = 0):
+    # Emails of one sender are never worked on by two processes at once, so spread them out
+    return [{'id': f"{offset + i:016x}", 'subject': f"Order #{i}", 'from': f"customer{i % 500}@example.com",
+             'sender_email': f"customer{i % 500}@example.com", 'body': 'Please send 1 iphone_15.'}
+            for i in range(count)]
+
+
+def drain(path: str) -> int:
+    queue = WorkQueue(path)
+    handled = 0
+    while True:
+        email = queue.claim()
+        if email is None:
+            return handled
+        queue.complete(email['id'])
+        handled += 1
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+    n = args.messages
+
+    with tempfile.TemporaryDirectory() as directory:
+        queue = WorkQueue(os.path.join(directory, 'single.sqlite'))
+        _, elapsed = timed(lambda: [queue.enqueue(e['id'], e) for e in make_emails(n)])
+        print(f"enqueue one by one:     {n / elapsed:>10.0f} msg/s")
+
+        for processes in args.processes:
+            path = os.path.join(directory, f"drain_{processes}.sqlite")
+            queue = WorkQueue(path)
+            _, elapsed = timed(lambda: queue.enqueue_many(make_emails(n)))
+            if processes == args.processes[0]:
+                print(f"enqueue_many (1 txn):   {n / elapsed:>10.0f} msg/s")
+            with multiprocessing.Pool(processes) as pool:
+                counts, elapsed = timed(lambda: pool.map(drain, [path] * processes))
+            print(f"claim+complete, {processes} proc: {sum(counts) / elapsed:>10.0f} msg/s "
+                  f"(per process: {counts}, counts: {queue.counts()})")
+
+
+if __name__ == '__main__':
+    main()
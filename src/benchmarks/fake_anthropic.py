@@ -0,0 +1,216 @@
+"""Local stand-in for the Anthropic Messages API that replays recorded responses.
+
+ChatAnthropic talks to it over HTTP through ``anthropic_api_url``, so the request
+payload, including every cache_control breakpoint, is exactly what Claude would
+receive. Responses come from a recording keyed by the customer email and the step
+of the agent run; steps missing from the recording are answered by the scripted
+chat model and added to it, so a recording made with one configuration is replayed
+unchanged for another.
+
+Usage is accounted the way Anthropic's prompt cache does: a prefix ending at a
+breakpoint is written to the cache if it is at least ``min_cache_tokens`` long and
+read back by later requests that share it, also when their breakpoint sits up to
+20 blocks further on. Time to first token is simulated from the tokens that are
+not read from the cache. Token counts are approximate (4 characters per token).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from benchmarks.fake_chat_model import ScriptedChatModel
+
+CHARS_PER_TOKEN = 4
+# Anthropic looks for an earlier cache entry this many blocks back from each breakpoint
+LOOKBACK_BLOCKS = 20
+
+
+def _block_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+
+
+class PromptCache:
+    """Anthropic-style prompt cache accounting for (uncached, cache_read, cache_creation) input tokens."""
+
+    def __init__(self, ttl: float = 300.0, min_cache_tokens: int = 1024):
+        self.ttl = ttl
+        self.min_cache_tokens = min_cache_tokens
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _blocks(payload: Dict) -> List[Dict]:
+        """Tools, system and messages in the order Anthropic caches them."""
+        blocks = list(payload.get('tools') or [])
+        system = payload.get('system') or []
+        blocks.extend([{'type': 'text', 'text': system}] if isinstance(system, str) else system)
+        for message in payload.get('messages', []):
+            content = message['content']
+            if isinstance(content, str):
+                content = [{'type': 'text', 'text': content}]
+            blocks.extend({**block, 'role': message['role']} for block in content)
+        return blocks
+
+    def account(self, payload: Dict) -> Tuple[int, int, int]:
+        blocks = self._blocks(payload)
+        digest = hashlib.sha256()
+        prefixes, totals, total = [], [], 0
+        for block in blocks:
+            canonical = json.dumps({k: v for k, v in block.items() if k != 'cache_control'}, sort_keys=True)
+            digest.update(canonical.encode('utf-8'))
+            prefixes.append(digest.copy().hexdigest())
+            total += max(1, len(canonical) // CHARS_PER_TOKEN)
+            totals.append(total)
+        breakpoints = [i for i, block in enumerate(blocks) if block.get('cache_control')]
+
+        now = time.monotonic()
+        with self._lock:
+            hit = -1
+            for i in breakpoints:
+                for j in range(i, max(-1, i - LOOKBACK_BLOCKS), -1):
+                    if self._expires.get(prefixes[j], 0) > now:
+                        hit = max(hit, j)
+                        break
+            if hit >= 0:
+                self._expires[prefixes[hit]] = now + self.ttl
+            read = totals[hit] if hit >= 0 else 0
+            written_to = hit
+            for i in breakpoints:
+                if i > hit and totals[i] >= self.min_cache_tokens:
+                    self._expires[prefixes[i]] = now + self.ttl
+                    written_to = max(written_to, i)
+        written = totals[written_to] - read if written_to >= 0 else 0
+        return total - read - written, read, written
+
+
+def to_langchain_messages(payload: Dict) -> List[BaseMessage]:
+    """Messages API messages as LangChain messages (the system prompt is left out)."""
+    messages: List[BaseMessage] = []
+    for message in payload.get('messages', []):
+        content = message['content']
+        if message['role'] == 'assistant':
+            blocks = [{'type': 'text', 'text': content}] if isinstance(content, str) else content
+            messages.append(AIMessage(
+                content=''.join(b.get('text', '') for b in blocks if b.get('type') == 'text'),
+                tool_calls=[{'name': b['name'], 'args': b['input'], 'id': b['id']}
+                            for b in blocks if b.get('type') == 'tool_use']))
+            continue
+        if isinstance(content, str):
+            messages.append(HumanMessage(content=content))
+            continue
+        for block in content:
+            if block.get('type') == 'tool_result':
+                messages.append(ToolMessage(content=_block_text(block.get('content', '')),
+                                            tool_call_id=block['tool_use_id']))
+            elif block.get('type') == 'text':
+                messages.append(HumanMessage(content=block['text']))
+    return messages
+
+
+def step_key(payload: Dict) -> str:
+    """The customer email being answered and how many model calls of its run came before."""
+    messages = payload.get('messages', [])
+    start = max((i for i, m in enumerate(messages) if m['role'] == 'user' and (
+        isinstance(m['content'], str) or any(b.get('type') == 'text' for b in m['content']))), default=0)
+    email = _block_text(messages[start]['content']) if messages else ''
+    steps = sum(1 for m in messages[start:] if m['role'] == 'assistant')
+    return hashlib.sha256(f"{email}\0{steps}".encode('utf-8')).hexdigest()
+
+
+class Recording:
+    """Responses (content blocks without ids, stop reason) by step key, appended to a JSONL file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.responses: Dict[str, Dict] = {}
+        self.replayed = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.responses[entry['key']] = entry['response']
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            response = self.responses.get(key)
+            if response is not None:
+                self.replayed += 1
+            return response
+
+    def add(self, key: str, response: Dict) -> None:
+        with self._lock:
+            self.responses[key] = response
+            self.recorded += 1
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'response': response}) + '\n')
+
+
+def scripted_response(payload: Dict) -> Dict:
+    """What the scripted chat model answers to this request, as Messages API content."""
+    message = ScriptedChatModel().invoke(to_langchain_messages(payload))
+    content = [{'type': 'text', 'text': message.content}] if message.content else []
+    content.extend({'type': 'tool_use', 'name': call['name'], 'input': call['args']} for call in message.tool_calls)
+    return {'content': content, 'stop_reason': 'tool_use' if message.tool_calls else 'end_turn'}
+
+
+class FakeAnthropicAPI:
+    """Messages API double; ``requests`` keeps (simulated ttft, uncached, read, written) per call."""
+
+    def __init__(self, recording: Recording, cache: Optional[PromptCache] = None, base_latency: float = 0.2,
+                 seconds_per_1k_tokens: float = 0.05, cached_speedup: float = 10.0):
+        self.recording = recording
+        self.cache = cache or PromptCache()
+        self.base_latency = base_latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.cached_speedup = cached_speedup
+        self.requests: List[Tuple[float, int, int, int]] = []
+        self.payloads: List[Dict] = []
+        self.app = FastAPI()
+        self.app.post('/v1/messages')(self.messages)
+
+    async def messages(self, request: Request) -> Dict:
+        payload = await request.json()
+        key = step_key(payload)
+        response = self.recording.get(key)
+        if response is None:
+            response = scripted_response(payload)
+            self.recording.add(key, response)
+        uncached, read, written = self.cache.account(payload)
+        ttft = self.base_latency + (uncached + written + read / self.cached_speedup) / 1000 * self.seconds_per_1k_tokens
+        self.requests.append((ttft, uncached, read, written))
+        self.payloads.append(payload)
+        await asyncio.sleep(ttft)
+        content = [dict(block, id=f"toolu_{uuid.uuid4().hex[:24]}") if block['type'] == 'tool_use' else block
+                   for block in response['content']]
+        output_tokens = max(1, len(json.dumps(content)) // CHARS_PER_TOKEN)
+        return {
+            'id': f"msg_{uuid.uuid4().hex[:24]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': payload.get('model'),
+            'content': content,
+            'stop_reason': response['stop_reason'],
+            'stop_sequence': None,
+            'usage': {'input_tokens': uncached, 'cache_read_input_tokens': read,
+                      'cache_creation_input_tokens': written, 'output_tokens': output_tokens},
+        }
+
+    def start(self, port: int) -> uvicorn.Server:
+        server = uvicorn.Server(uvicorn.Config(self.app, host='127.0.0.1', port=port, log_level='warning'))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        return server
@@ -0,0 +1,155 @@
+"""Scripted chat model that drives create_react_agent like a well-behaved Claude would.
+
+For each customer email it prices the ordered products (in one bulk tool call or
+one call per item), sends the reply with an invoice, then finishes. It also answers
+the order fast path's structured extraction call; emails containing a question
+are flagged as needing clarification. Emails without an order get a plain reply:
+price questions after a price lookup, "what do you sell" after get_api_info.
+Every call sleeps ``latency``
+seconds and reports approximate token usage so metrics behave as in production.
+"""
+import json
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from models.product_types import APPLE_PRODUCT_PRICES
+
+ORDER_LINE = re.compile(r'(\d+)\s*x?\s*(' + '|'.join(sorted(APPLE_PRODUCT_PRICES, key=len, reverse=True)) + r')')
+PRODUCT = re.compile('|'.join(sorted(APPLE_PRODUCT_PRICES, key=len, reverse=True)))
+
+
+def parse_order_lines(text: str) -> Dict[str, int]:
+    """Map product ids mentioned as "<qty> <product_id>" to quantities."""
+    quantities: Dict[str, int] = {}
+    for quantity, product_id in ORDER_LINE.findall(text):
+        quantities[product_id] = quantities.get(product_id, 0) + int(quantity)
+    return quantities
+
+
+def _text(message: BaseMessage) -> str:
+    """Message content as text, also when it is a list of content blocks (e.g. with a cache breakpoint)."""
+    if isinstance(message.content, str):
+        return message.content
+    return ''.join(block.get('text', '') if isinstance(block, dict) else str(block) for block in message.content)
+
+
+def _tokens(messages: List[BaseMessage]) -> int:
+    return sum(len(_text(m)) for m in messages) // 4
+
+
+def _tool_call(name: str, args: Dict) -> AIMessage:
+    return AIMessage(content='', tool_calls=[{'name': name, 'args': args, 'id': f"call_{uuid.uuid4().hex[:12]}"}])
+
+
+def _email_text(email: Dict) -> str:
+    return email.get('body', '')
+
+
+class ScriptedChatModel(BaseChatModel):
+    latency: float = 0.0
+    calls: int = 0
+    # Price every product in one get_product_prices call, or one get_product_price call per item
+    bulk_pricing: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return 'scripted-fake'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _extract(self, email: Dict) -> AIMessage:
+        text = _email_text(email)
+        quantities = parse_order_lines(text)
+        return _tool_call('ExtractedOrder', {
+            'is_order': bool(quantities),
+            'needs_clarification': '?' in text,
+            'customer_name': email['from'].split('<')[0].strip() or email['sender_email'],
+            'items': [{'product_id': p, 'quantity': q} for p, q in quantities.items()],
+        })
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        # The agent's system prompt travels outside the message list; only extraction sends one
+        if messages[0].type == 'system':
+            return self._extract(json.loads(_text(messages[-1])))
+
+        human_index = max(i for i, m in enumerate(messages) if m.type == 'human')
+        email = json.loads(_text(messages[human_index]).split('\n\n', 1)[1])
+        quantities = parse_order_lines(_email_text(email))
+
+        calls = {call['id']: call for m in messages[human_index + 1:] if m.type == 'ai' for call in m.tool_calls}
+        prices: Dict[str, Optional[float]] = {}
+        api_info = None
+        for m in messages[human_index + 1:]:
+            if m.type != 'tool':
+                continue
+            call = calls[m.tool_call_id]
+            if call['name'] == 'get_product_prices':
+                prices.update(json.loads(_text(m)))
+            elif call['name'] == 'get_product_price':
+                prices[call['args']['product_id']] = json.loads(_text(m))
+            elif call['name'] == 'get_api_info':
+                api_info = _text(m)
+            elif call['name'] == 'send_email':
+                action = 'Processed order from' if quantities else 'Replied to'
+                return AIMessage(content=f"{action} {email['sender_email']}.")
+        if not quantities:
+            return self._answer(email, prices, api_info)
+
+        unpriced = [p for p in quantities if p not in prices]
+        if unpriced:
+            if self.bulk_pricing:
+                return _tool_call('get_product_prices', {'product_ids': unpriced})
+            return _tool_call('get_product_price', {'product_id': unpriced[0]})
+
+        items = [{'description': product_id.replace('_', ' ').title(), 'quantity': quantity,
+                  'price': prices[product_id]}
+                 for product_id, quantity in quantities.items() if prices.get(product_id) is not None]
+        return _tool_call('send_email', {
+            'to': email['sender_email'],
+            'subject': f"Re: {email['subject']}",
+            'body': 'Thank you for your order. Your invoice is attached.',
+            'attach_invoice': True,
+            'order_details': {'customer_name': email['from'], 'items': items},
+            'reply_to_message_id': email['id'],
+        })
+
+    def _answer(self, email: Dict, prices: Dict[str, Optional[float]], api_info: Optional[str]) -> AIMessage:
+        """Reply to an email without an order: a price question or a "what do you sell" inquiry."""
+        text = _email_text(email)
+        products = list(dict.fromkeys(PRODUCT.findall(text)))
+        if products and any(p not in prices for p in products):
+            return _tool_call('get_product_prices', {'product_ids': products})
+        if products:
+            body = '\n'.join(f"{p.replace('_', ' ').title()}: ${prices[p]}" for p in products)
+        elif 'sell' in text.lower():
+            if api_info is None:
+                return _tool_call('get_api_info', {})
+            body = f"We sell Apple products; our catalogue is available through {len(api_info)} bytes of API info."
+        else:
+            return AIMessage(content="No order found in this email.")
+        name = email['from'].split('<')[0].strip()
+        return _tool_call('send_email', {
+            'to': email['sender_email'],
+            'subject': f"Re: {email['subject']}",
+            'body': f"Dear {name},\n\n{body}\n\nKind regards",
+            'reply_to_message_id': email['id'],
+        })
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        message = self._respond(messages)
+        input_tokens = _tokens(messages)
+        output_tokens = len(json.dumps(message.tool_calls)) // 4 + len(str(message.content)) // 4
+        message.usage_metadata = {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                                  'total_tokens': input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,312 @@
+"""In-process stand-in for the subset of the Gmail API used by the mailer.
+
+Every top-level ``execute()`` and every batch ``execute()`` counts as one
+HTTP round-trip and sleeps for ``latency`` seconds, so benchmarks can compare
+call patterns without touching the network.
+"""
+import base64
+import itertools
+import random
+import threading
+import time
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+PAGE_SIZE = 100
+
+
+def _http_error(status: int, reason: str, headers: Optional[Dict] = None) -> HttpError:
+    resp = httplib2.Response(dict(headers or {}, status=status))
+    resp.reason = reason
+    return HttpError(resp, reason.encode('utf-8'))
+
+
+def _to_payload(part) -> Dict:
+    """Convert an email.message part into Gmail's ``payload`` structure."""
+    payload = {
+        'mimeType': part.get_content_type(),
+        'headers': [{'name': k, 'value': v} for k, v in part.items()],
+    }
+    if part.is_multipart():
+        payload['body'] = {'size': 0}
+        payload['parts'] = [_to_payload(p) for p in part.get_payload()]
+    else:
+        data = part.get_payload(decode=True) or b''
+        payload['filename'] = part.get_filename() or ''
+        if payload['filename']:
+            # Like Gmail, attachment bodies are only referenced and fetched separately
+            payload['body'] = {'size': len(data), 'attachmentId': f"att-{len(data):x}"}
+        else:
+            payload['body'] = {
+                'size': len(data),
+                'data': base64.urlsafe_b64encode(data).decode('ascii'),
+            }
+    return payload
+
+
+class FakeRequest:
+    def __init__(self, gmail: 'FakeGmailService', handler: Callable, **kwargs):
+        self._gmail = gmail
+        self._handler = handler
+        self.kwargs = kwargs
+
+    def run(self):
+        return self._handler(**self.kwargs)
+
+    def execute(self, http=None, num_retries=0):
+        self._gmail.round_trip()
+        return self.run()
+
+
+class FakeBatch:
+    def __init__(self, gmail: 'FakeGmailService', callback: Optional[Callable] = None):
+        self._gmail = gmail
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request: FakeRequest, callback: Optional[Callable] = None, request_id: Optional[str] = None):
+        if request_id is None:
+            request_id = str(len(self._requests) + 1)
+        self._requests.append((request_id, request, callback or self._callback))
+
+    def execute(self, http=None):
+        self._gmail.round_trip()
+        self._gmail.batched_calls += len(self._requests)
+        for request_id, request, callback in self._requests:
+            try:
+                response, exception = request.run(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class _Messages:
+    def __init__(self, gmail: 'FakeGmailService'):
+        self._gmail = gmail
+
+    def list(self, userId: str, labelIds: Optional[List[str]] = None, pageToken: Optional[str] = None,
+             maxResults: int = PAGE_SIZE, **_):
+        return FakeRequest(self._gmail, self._gmail.list_messages,
+                           labelIds=labelIds or [], pageToken=pageToken, maxResults=maxResults)
+
+    def list_next(self, previous_request: FakeRequest, previous_response: Dict):
+        page_token = previous_response.get('nextPageToken')
+        if not page_token:
+            return None
+        kwargs = dict(previous_request.kwargs, pageToken=page_token)
+        return FakeRequest(self._gmail, self._gmail.list_messages, **kwargs)
+
+    def get(self, userId: str, id: str, format: str = 'full', metadataHeaders: Optional[List[str]] = None, **_):
+        # pylint: disable=redefined-builtin
+        return FakeRequest(self._gmail, self._gmail.get_message,
+                           message_id=id, fmt=format, metadata_headers=metadataHeaders)
+
+    def modify(self, userId: str, id: str, body: Dict):
+        # pylint: disable=redefined-builtin
+        return FakeRequest(self._gmail, self._gmail.modify_messages, ids=[id],
+                           add=body.get('addLabelIds', []), remove=body.get('removeLabelIds', []))
+
+    def batchModify(self, userId: str, body: Dict):
+        # pylint: disable=invalid-name
+        return FakeRequest(self._gmail, self._gmail.modify_messages, ids=body['ids'],
+                           add=body.get('addLabelIds', []), remove=body.get('removeLabelIds', []))
+
+    def send(self, userId: str, body: Dict):
+        return FakeRequest(self._gmail, self._gmail.send_message, raw=body['raw'])
+
+
+class _History:
+    def __init__(self, gmail: 'FakeGmailService'):
+        self._gmail = gmail
+
+    def list(self, userId: str, startHistoryId: str, labelId: Optional[str] = None, pageToken: Optional[str] = None,
+             maxResults: int = PAGE_SIZE, **_):
+        # pylint: disable=invalid-name
+        return FakeRequest(self._gmail, self._gmail.list_history, start_history_id=int(startHistoryId),
+                           label_id=labelId, pageToken=pageToken, maxResults=maxResults)
+
+    def list_next(self, previous_request: FakeRequest, previous_response: Dict):
+        page_token = previous_response.get('nextPageToken')
+        if not page_token:
+            return None
+        kwargs = dict(previous_request.kwargs, pageToken=page_token)
+        return FakeRequest(self._gmail, self._gmail.list_history, **kwargs)
+
+
+class _Users:
+    def __init__(self, gmail: 'FakeGmailService'):
+        self._gmail = gmail
+        self._messages = _Messages(gmail)
+        self._history = _History(gmail)
+
+    def messages(self):
+        return self._messages
+
+    def history(self):
+        return self._history
+
+    def getProfile(self, userId: str):
+        # pylint: disable=invalid-name
+        return FakeRequest(self._gmail, self._gmail.get_profile)
+
+
+class FakeGmailService:
+    """Thread-safe fake exposing ``users().messages()``, ``users().history()`` and batch requests."""
+
+    def __init__(self, latency: float = 0.0, send_limit: Optional[int] = None, send_error_rate: float = 0.0):
+        self.latency = latency
+        # Throttling injection: more than send_limit sends within one second get a 429,
+        # and send_error_rate of the remaining sends fail with a 503
+        self.send_limit = send_limit
+        self.send_error_rate = send_error_rate
+        self.throttled = 0
+        self.send_errors = 0
+        self._send_times: List[float] = []
+        self._random = random.Random(0)
+        self.round_trips = 0
+        self.batched_calls = 0
+        self.messages: Dict[str, Dict] = {}
+        self.sent: List[str] = []
+        self.history_id = 1
+        self.oldest_history_id = 1
+        self.history: List[Dict] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._users = _Users(self)
+
+    # --- Resource-like surface -------------------------------------------------
+
+    def users(self):
+        return self._users
+
+    def new_batch_http_request(self, callback: Optional[Callable] = None):
+        return FakeBatch(self, callback)
+
+    # --- Inbox setup -----------------------------------------------------------
+
+    def add_message(self, sender: str, subject: str, body: str, labels: Optional[List[str]] = None) -> str:
+        msg = EmailMessage()
+        msg['From'] = sender
+        msg['To'] = 'shop@example.com'
+        msg['Subject'] = subject
+        msg.set_content(body)
+        return self.add_mime_message(msg, labels)
+
+    def add_mime_message(self, msg: EmailMessage, labels: Optional[List[str]] = None) -> str:
+        with self._lock:
+            message_id = f"{next(self._ids):016x}"
+            body = msg.get_body(('plain',))
+            snippet = body.get_content()[:200] if body is not None else ''
+            self.messages[message_id] = {
+                'id': message_id,
+                'threadId': message_id,
+                'labelIds': list(labels or ['INBOX', 'UNREAD']),
+                'snippet': snippet,
+                'payload': _to_payload(msg),
+                'raw': base64.urlsafe_b64encode(msg.as_bytes()).decode('ascii'),
+            }
+            self.history_id += 1
+            self.history.append({
+                'id': str(self.history_id),
+                'messagesAdded': [{'message': {'id': message_id, 'threadId': message_id,
+                                               'labelIds': list(self.messages[message_id]['labelIds'])}}],
+            })
+            return message_id
+
+    def expire_history(self) -> None:
+        """Drop all history records so older startHistoryIds return 404."""
+        with self._lock:
+            self.history.clear()
+            self.oldest_history_id = self.history_id
+
+    def reset_counters(self) -> None:
+        self.round_trips = 0
+        self.batched_calls = 0
+        self.throttled = 0
+        self.send_errors = 0
+
+    # --- Handlers --------------------------------------------------------------
+
+    def round_trip(self) -> None:
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def list_messages(self, labelIds: List[str], pageToken: Optional[str], maxResults: int) -> Dict:
+        # pylint: disable=invalid-name
+        with self._lock:
+            matching = [m['id'] for m in self.messages.values()
+                        if all(label in m['labelIds'] for label in labelIds)]
+        start = int(pageToken or 0)
+        page = matching[start:start + maxResults]
+        response = {'messages': [{'id': i, 'threadId': i} for i in page],
+                    'resultSizeEstimate': len(matching)}
+        if start + maxResults < len(matching):
+            response['nextPageToken'] = str(start + maxResults)
+        return response
+
+    def get_profile(self) -> Dict:
+        with self._lock:
+            return {'emailAddress': 'shop@example.com', 'messagesTotal': len(self.messages),
+                    'historyId': str(self.history_id)}
+
+    def list_history(self, start_history_id: int, label_id: Optional[str], pageToken: Optional[str],
+                     maxResults: int) -> Dict:
+        # pylint: disable=invalid-name
+        with self._lock:
+            if start_history_id < self.oldest_history_id:
+                raise _http_error(404, 'Requested entity was not found.')
+            records = [r for r in self.history if int(r['id']) > start_history_id]
+            if label_id is not None:
+                records = [r for r in records
+                           if any(label_id in a['message']['labelIds'] for a in r['messagesAdded'])]
+            start = int(pageToken or 0)
+            response = {'history': records[start:start + maxResults], 'historyId': str(self.history_id)}
+            if start + maxResults < len(records):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+
+    def get_message(self, message_id: str, fmt: str, metadata_headers: Optional[List[str]]) -> Dict:
+        with self._lock:
+            stored = self.messages.get(message_id)
+            if stored is None:
+                raise _http_error(404, 'Requested entity was not found.')
+            message = {k: stored[k] for k in ('id', 'threadId', 'labelIds', 'snippet')}
+            if fmt == 'raw':
+                message['raw'] = stored['raw']
+            elif fmt == 'metadata':
+                wanted = set(metadata_headers or [])
+                headers = [h for h in stored['payload']['headers'] if not wanted or h['name'] in wanted]
+                message['payload'] = {'mimeType': stored['payload']['mimeType'], 'headers': headers}
+            else:
+                message['payload'] = stored['payload']
+            return message
+
+    def modify_messages(self, ids: List[str], add: List[str], remove: List[str]) -> Dict:
+        with self._lock:
+            self.history_id += 1
+            for message_id in ids:
+                labels = self.messages[message_id]['labelIds']
+                labels[:] = [label for label in labels if label not in remove]
+                labels.extend(label for label in add if label not in labels)
+        return {}
+
+    def send_message(self, raw: str) -> Dict:
+        with self._lock:
+            if self.send_limit is not None:
+                now = time.monotonic()
+                self._send_times = [t for t in self._send_times if t > now - 1]
+                if len(self._send_times) >= self.send_limit:
+                    self.throttled += 1
+                    raise _http_error(429, 'User-rate limit exceeded', {'retry-after': '1'})
+                self._send_times.append(now)
+            if self.send_error_rate and self._random.random() < self.send_error_rate:
+                self.send_errors += 1
+                raise _http_error(503, 'Backend Error')
+            self.sent.append(raw)
+            return {'id': f"sent-{len(self.sent)}", 'labelIds': ['SENT']}
@@ -0,0 +1,75 @@
+"""Local stand-in for Pub/Sub push delivery of Gmail notifications.
+
+With ``--url`` it posts notifications to a running mailer's receiver. Without it,
+it starts a PushReceiver in-process and measures notification-to-wake latency.
+Run from ``src``: ``python -m benchmarks.fake_push``
+"""
+import argparse
+import base64
+import json
+import statistics
+import threading
+import time
+import urllib.request
+
+from services.mailer.push_receiver import PushReceiver
+
+
+def post_notification(url: str, history_id: int, email_address: str = 'shop@example.com') -> int:
+    """POST a Pub/Sub push envelope carrying a Gmail notification and return the HTTP status."""
+    data = json.dumps({'emailAddress': email_address, 'historyId': history_id}).encode('utf-8')
+    envelope = {
+        'message': {'data': base64.b64encode(data).decode('ascii'), 'messageId': str(history_id)},
+        'subscription': 'projects/local/subscriptions/gmail-push',
+    }
+    request = urllib.request.Request(url, data=json.dumps(envelope).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def measure_wake_latency(count: int, fallback_interval: float):
+    receiver = PushReceiver(port=0).start()
+    url = f"http://127.0.0.1:{receiver.port}/"
+    woken = threading.Event()
+    latencies = []
+    sent_at = [0.0]
+
+    def worker():
+        # Same wait the mailer loop does between polls
+        while len(latencies) < count:
+            if receiver.wait(fallback_interval):
+                latencies.append(time.perf_counter() - sent_at[0])
+                woken.set()
+
+    threading.Thread(target=worker, daemon=True).start()
+    for history_id in range(count):
+        woken.clear()
+        sent_at[0] = time.perf_counter()
+        post_notification(url, history_id)
+        woken.wait(fallback_interval)
+    receiver.stop()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', type=str, default=None, help='Receiver URL of a running mailer')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between notifications with --url')
+    args = parser.parse_args()
+
+    if args.url:
+        for history_id in range(args.count):
+            print(f"notification {history_id}: HTTP {post_notification(args.url, history_id)}")
+            time.sleep(args.interval)
+        return
+
+    latencies = measure_wake_latency(args.count, fallback_interval=300)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies)} notifications, wake latency p50 {quantiles[49] * 1000:.2f} ms, "
+          f"p99 {quantiles[98] * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Load-test the fake pricing API's single and batch endpoints.
+
+Starts the API in-process and reports requests/sec and latency percentiles.
+Run from ``src``: ``python -m benchmarks.load_pricing_api``
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.bench_pricing import PORT, start_api
+from models.product_types import APPLE_PRODUCT_PRICES
+
+PRODUCTS = list(APPLE_PRODUCT_PRICES)
+
+
+async def load(send, requests: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits) as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await send(client, i)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, latencies
+
+
+def single(client, i):
+    return client.get(f"/price/{PRODUCTS[i % len(PRODUCTS)]}")
+
+
+def batch(client, _):
+    return client.post("/prices", json={"product_ids": PRODUCTS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    server = start_api()
+    print(f"{'path':>22} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    paths = (
+        ('GET /price/{id}', single),
+        (f"POST /prices ({len(PRODUCTS)} ids)", batch),
+    )
+    for name, send in paths:
+        rate, latencies = asyncio.run(load(send, args.requests, args.concurrency))
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{name:>22} {rate:>9.0f} {quantiles[49] * 1000:>8.2f} {quantiles[98] * 1000:>8.2f}")
+    server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,86 @@
-from fastapi import FastAPI
-from typing import List, Dict
+import hashlib
+import json
+from typing import List, Dict, Optional, get_args
+from fastapi import FastAPI, Header, Response
 import uvicorn
 from pydantic import BaseModel
 from models.product_types import AppleProduct, APPLE_PRODUCT_PRICES
 
 app = FastAPI(title="Apple Products Pricing API")
 
+# Prices never change while the server runs, so clients may reuse responses for a while
+CACHE_CONTROL = "public, max-age=300"
+
 class PriceResponse(BaseModel):
     product_id: AppleProduct
     price: float
     currency: str = "USD"
 
+class PricesRequest(BaseModel):
+    product_ids: List[str]
+
+class PricesResponse(BaseModel):
+    prices: List[PriceResponse]
+    unknown: List[str]
+
 class ApiInfoResponse(BaseModel):
     available_products: List[str]
     endpoints: Dict[str, str]
     version: str = "1.0.0"
 
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def _serialize(model: BaseModel) -> bytes:
+    return model.model_dump_json().encode("utf-8")
+
+
+# Responses are built and serialized once at startup from the fixed price table
+PRICE_BODIES: Dict[str, bytes] = {
+    product_id: _serialize(PriceResponse(product_id=product_id, price=price))
+    for product_id, price in APPLE_PRODUCT_PRICES.items()
+}
+PRICE_ETAGS: Dict[str, str] = {product_id: _etag(body) for product_id, body in PRICE_BODIES.items()}
+API_INFO_BODY = _serialize(ApiInfoResponse(
+    available_products=list(get_args(AppleProduct)),
+    endpoints={
+        "get_price": "/price/{product_id}",
+        "get_prices": "POST /prices",
+        "get_api_info": "/api-info"
+    }
+))
+API_INFO_ETAG = _etag(API_INFO_BODY)
+
+
+def _cached_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.get("/api-info", response_model=ApiInfoResponse)
-async def get_api_info():
+async def get_api_info(if_none_match: Optional[str] = Header(default=None)):
     """Get information about available APIs and their endpoints."""
-    return ApiInfoResponse(
-        available_products=list(AppleProduct.__members__.keys()),
-        endpoints={
-            "get_price": "/price/{product_id}",
-            "get_api_info": "/api-info"
-        }
-    )
+    return _cached_response(API_INFO_BODY, API_INFO_ETAG, if_none_match)
 
 @app.get("/price/{product_id}", response_model=PriceResponse)
-async def get_price(product_id: AppleProduct):
-    return PriceResponse(
-        product_id=product_id,
-        price=APPLE_PRODUCT_PRICES[product_id]
-    )
+async def get_price(product_id: str, if_none_match: Optional[str] = Header(default=None)):
+    body = PRICE_BODIES.get(product_id)
+    if body is None:
+        return Response(status_code=404, content=b'{"detail":"Unknown product"}', media_type="application/json")
+    return _cached_response(body, PRICE_ETAGS[product_id], if_none_match)
+
+@app.post("/prices", response_model=PricesResponse)
+async def get_prices(request: PricesRequest, if_none_match: Optional[str] = Header(default=None)):
+    """Get prices for several products in one request; unknown ids are listed separately."""
+    known = [p for p in dict.fromkeys(request.product_ids) if p in PRICE_BODIES]
+    unknown = [p for p in dict.fromkeys(request.product_ids) if p not in PRICE_BODIES]
+    body = b'{"prices":[' + b",".join(PRICE_BODIES[p] for p in known) + b'],"unknown":' \
+        + json.dumps(unknown).encode("utf-8") + b"}"
+    return _cached_response(body, _etag(body), if_none_match)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=3001)
@@ -1,23 +1,30 @@
+import argparse
+import json
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from datetime import datetime
-from dotenv import load_dotenv
-
-from langchain_anthropic import ChatAnthropic
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
-from services.mailer.tools.read_mail import read_emails
-from services.mailer.tools.send_mail import send_email
-from services.mailer.tools.get_product_price import get_product_price, get_api_info
-
-load_dotenv()
-
-# Initialize the agent
-tools = [read_emails, get_product_price, get_api_info, send_email]
-model = ChatAnthropic(
-    model="claude-3-5-sonnet-latest",
-    temperature=0,
-    model_kwargs={
-        "system": """You are an AI assistant that handles customer service emails.
+from typing import Any, Dict, List, Optional
+
+from services.mailer import metrics
+from services.mailer.dispatcher import EmailDispatcher
+from services.mailer.mailboxes import Mailbox, current_mailbox, load_mailboxes, use_mailbox
+from services.mailer.outbox import Outbox, wait_for_deliveries
+from services.mailer.push_receiver import AdaptiveBackoff, PushReceiver, register_watch
+from services.mailer.settings import settings
+from services.mailer.supervisor import Supervisor, latest_assignment
+from services.mailer.tools.read_mail import fetch_unread_emails
+from services.mailer.utils.get_gmail_service import get_gmail_service
+from services.mailer.work_queue import FAILED, get_work_queue
+
+# langchain, langgraph and the agent's tools take most of the startup time, so the
+# agent, the fast path and the checkpoint store are built on first use. A poll that
+# finds no customer email never loads them.
+# pylint: disable=import-outside-toplevel
+
+CHAT_MODEL = "claude-3-5-sonnet-latest"
+SYSTEM_PROMPT = """You are an AI assistant that handles customer service emails.
         Your responsibilities include:
         1. Reading and understanding customer inquiries
         2. Processing orders and confirming details
@@ -36,42 +43,442 @@ model = ChatAnthropic(
             ]
         }
 
+        When replying to a customer email, always pass that email's "id" as reply_to_message_id to send_email.
+
         Always maintain a professional tone and ensure all order details are correct before processing."""
-    }
-)
 
-# Initialize memory to persist state between graph runs
-checkpointer = MemorySaver()
+# Evict idle conversation threads at most this often
+EVICTION_INTERVAL = 3600
+# Gmail watches expire after 7 days; renew daily
+WATCH_RENEWAL_INTERVAL = 24 * 3600
+# A failed watch registration is retried after this long, doubling up to the maximum
+WATCH_RETRY_MIN_INTERVAL = 60
+WATCH_RETRY_MAX_INTERVAL = 3600
+
+# Well-formed orders are extracted with one structured-output call and invoiced without the agent
+fast_path_enabled = settings.order_fast_path
+
+_lock = threading.Lock()
+_chat_model = None
+_fast_path = None
+_metrics_callback = None
+# Conversations are stored per mailbox, so each mailbox has its own checkpointer and compiled agent
+_agents: Dict[str, Any] = {}
+_checkpoints: Dict[str, Any] = {}
+
+
+def mailbox_key() -> str:
+    mailbox = current_mailbox()
+    return '' if mailbox is None else mailbox.name
+
+
+def get_checkpoints():
+    """Store persisting bounded per-customer conversations of the current mailbox."""
+    key = mailbox_key()
+    with _lock:
+        if key not in _checkpoints:
+            from services.mailer.checkpoint import CheckpointStore
+            mailbox = current_mailbox()
+            _checkpoints[key] = CheckpointStore() if mailbox is None else CheckpointStore(mailbox.checkpoint_db_path)
+        return _checkpoints[key]
+
+
+def get_metrics_callback():
+    """Callback recording LLM and tool call latencies and token usage for every agent run."""
+    global _metrics_callback  # pylint: disable=global-statement
+    with _lock:
+        if _metrics_callback is None:
+            from services.mailer.agent_metrics import MetricsCallbackHandler
+            _metrics_callback = MetricsCallbackHandler()
+        return _metrics_callback
+
+
+def agent_tools() -> List:
+    """Emails are fetched before the agent runs, so it has no read tool."""
+    from services.mailer.tools.get_product_price import get_api_info, get_product_price, get_product_prices
+    from services.mailer.tools.send_mail import send_email
+    return [get_product_price, get_product_prices, get_api_info, send_email]
+
+
+def build_agent(chat_model):
+    """Compile the ReAct agent around chat_model with the shared tools and the mailbox's checkpointer.
+
+    The tool definitions end in a prompt-cache breakpoint, and every model call goes
+    through the token budget first.
+    """
+    from langgraph.prebuilt import create_react_agent
+    from services.mailer.token_budget import PROMPT_CACHING, budget_history, with_cache_breakpoint
+    tools = with_cache_breakpoint(agent_tools()) if PROMPT_CACHING else agent_tools()
+    return create_react_agent(chat_model, tools, checkpointer=get_checkpoints().saver,
+                              pre_model_hook=budget_history)
+
+
+def build_fast_path(chat_model):
+    from services.mailer.order_extraction import OrderFastPath
+    return OrderFastPath(chat_model, callbacks=[get_metrics_callback()], on_confirmed=record_fast_path_reply)
+
 
-app = create_react_agent(model, tools, checkpointer=checkpointer)
+def create_chat_model(**kwargs):
+    """Claude with the agent's system prompt; kwargs override the ChatAnthropic arguments.
 
-def process_emails():
-    """Main function to process incoming emails."""
+    With PROMPT_CACHING the system prompt is a cache breakpoint, so Anthropic reads
+    it and the tool definitions from its prompt cache instead of processing them on
+    every call.
+    """
+    from langchain_anthropic import ChatAnthropic
+    from services.mailer.response_cache import get_response_cache
+    from services.mailer.token_budget import PROMPT_CACHING, cache_breakpoint
+    system = cache_breakpoint(SYSTEM_PROMPT) if PROMPT_CACHING else SYSTEM_PROMPT
+    return ChatAnthropic(**{'model': CHAT_MODEL, 'temperature': 0, 'model_kwargs': {"system": system},
+                            'cache': get_response_cache(), **kwargs})
+
+
+def get_chat_model():
+    """The agent's chat model, created on first use."""
+    global _chat_model  # pylint: disable=global-statement
+    if _chat_model is None:
+        chat_model = create_chat_model()
+        with _lock:
+            _chat_model = _chat_model or chat_model
+    return _chat_model
+
+
+def get_agent():
+    """The agent for the current mailbox, compiled on first use."""
+    key = mailbox_key()
+    if key not in _agents:
+        agent = build_agent(get_chat_model())
+        with _lock:
+            _agents.setdefault(key, agent)
+    return _agents[key]
+
+
+def get_fast_path():
+    """The order fast path, or None if ORDER_FAST_PATH is off."""
+    global _fast_path  # pylint: disable=global-statement
+    if not fast_path_enabled:
+        return None
+    if _fast_path is None:
+        from langchain_anthropic import ChatAnthropic
+        from services.mailer.response_cache import get_response_cache
+        fast_path = build_fast_path(ChatAnthropic(model=CHAT_MODEL, temperature=0, cache=get_response_cache()))
+        with _lock:
+            _fast_path = _fast_path or fast_path
+    return _fast_path
+
+
+def use_chat_model(chat_model, fast_path: bool = True) -> None:
+    """Run the agent and fast path on chat_model instead of Claude, e.g. a scripted benchmark model."""
+    global _chat_model, _fast_path, fast_path_enabled  # pylint: disable=global-statement
+    with _lock:
+        _chat_model = chat_model
+        _agents.clear()
+    _fast_path = build_fast_path(chat_model) if fast_path else None
+    fast_path_enabled = fast_path
+
+
+def format_email_prompt(email: Dict) -> str:
+    """Build the agent task for one already-filtered customer email."""
+    return (
+        "Process the following new customer email. Reply to it and send an invoice "
+        "if it confirms an order.\n\n" + json.dumps(email, indent=2)
+    )
+
+
+def thread_id_for(email: Dict) -> str:
+    """Each customer gets their own conversation so follow-ups keep their context."""
+    return f"customer:{email['sender_email']}"
+
+
+def record_fast_path_reply(email: Dict, reply: str) -> None:
+    """Add a fast-path exchange to the customer's conversation so follow-ups see the order.
+
+    The messages are keyed by the email id, so recording the same email again replaces them.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+    thread_id = thread_id_for(email)
     try:
-        final_state = app.invoke(
-            {"messages": [{"role": "user", "content": "Please check for new emails and process any orders or inquiries."}]},
-            config={"configurable": {"thread_id": "email_processor"}}
+        get_agent().update_state(
+            {"configurable": {"thread_id": thread_id}},
+            {"messages": [HumanMessage(format_email_prompt(email), id=f"email:{email['id']}"),
+                          AIMessage(reply, id=f"reply:{email['id']}")]},
+            as_node='agent'
         )
-        print(f"[{datetime.now()}] {final_state['messages'][-1].content}")
-        return final_state["messages"][-1].content
     except Exception as e:
-        print(f"[{datetime.now()}] Error processing emails: {e}")
+        print(f"[{datetime.now()}] Could not record fast path reply to {email['id']} in {thread_id}: {e}")
+        return
+    get_checkpoints().touch(thread_id)
+
+
+def handle_email(email: Dict) -> str:
+    """Run the order fast path on a single email, falling back to the agent.
+
+    Model replies to earlier identical inquiries are reused from the response cache.
+    """
+    from services.mailer import response_cache
+    with metrics.trace(email['id']), response_cache.scope(email):
+        fast_path = get_fast_path()
+        if fast_path is not None:
+            result = fast_path.handle(email)
+            if result is not None:
+                metrics.ORDER_PATHS.inc(path='fast')
+                return result
+        metrics.ORDER_PATHS.inc(path='agent')
+        return run_agent(email)
+
+
+def run_agent(email: Dict) -> str:
+    """Run the agent on a single email."""
+    from services.mailer.token_budget import prompt_token_usage
+    thread_id = thread_id_for(email)
+    checkpoints = get_checkpoints()
+    with metrics.span('agent_run'):
+        final_state = get_agent().invoke(
+            {"messages": [{"role": "user", "content": format_email_prompt(email)}]},
+            config={"configurable": {"thread_id": thread_id}, "callbacks": [get_metrics_callback()]}
+        )
+    checkpoints.touch(thread_id)
+    usage = prompt_token_usage(final_state['messages'])
+    print(f"[{datetime.now()}] {final_state['messages'][-1].content}")
+    print(f"[{datetime.now()}] Prompt tokens: {usage['input']} ({usage['cache_read']} cached, "
+          f"{usage['cache_creation']} written to cache, {usage['uncached']} uncached), "
+          f"checkpoint size: {checkpoints.size_bytes()} bytes in {checkpoints.thread_count()} threads")
+    return final_state["messages"][-1].content
+
+
+def handle_queued_email(email: Dict) -> str:
+    """Process one claimed queue entry and record the outcome so failures are retried."""
+    try:
+        # Replies are delivered in the background; the email only counts as done once they went out
+        with Outbox.track(email['id']) as deliveries:
+            result = handle_email(email)
+        wait_for_deliveries(deliveries)
+    except Exception as e:
+        state = get_work_queue().fail(email['id'], str(e))
+        print(f"[{datetime.now()}] Email {email['id']} failed ({state}): {e}")
+        if state == FAILED:
+            metrics.EMAILS.inc(outcome='failed')
+        raise
+    if get_work_queue().complete(email['id']):
+        metrics.EMAILS.inc(outcome='done')
+    return result
+
+
+def dispatch_key(email: Dict) -> str:
+    """Emails of one customer to one mailbox run one at a time, as they share a conversation."""
+    return f"{mailbox_key()}:{email['sender_email']}"
+
+
+# Fetched emails are stored in the work queue before Gmail marks them read, and removed only once handled
+dispatcher = EmailDispatcher(handle_queued_email, max_workers=settings.max_concurrency, key=dispatch_key)
+
+
+def drain_queue(limit: Optional[int] = None) -> List[Future]:
+    """Claim ready queue entries (at most limit) and hand them to the worker pool."""
+    work_queue = get_work_queue()
+    futures = []
+    while limit is None or len(futures) < limit:
+        email = work_queue.claim()
+        if email is None:
+            break
+        futures.append(dispatcher.submit(email))
+    return futures
+
+
+def fetch_emails() -> int:
+    """Move new customer emails of the current mailbox into its work queue; returns how many arrived."""
+    try:
+        emails = fetch_unread_emails(get_gmail_service(), persist=get_work_queue().enqueue_many)
+    except Exception as e:
+        print(f"[{datetime.now()}] Error reading emails: {e}")
+        return 0
+    metrics.EMAILS.inc(len(emails), outcome='fetched')
+    return len(emails)
+
+
+def process_emails() -> List[Future]:
+    """Main function to process incoming emails.
+
+    Fetching and allowlist filtering happen here without the LLM. New customer
+    emails are committed to the durable work queue before being marked read, then
+    every ready entry (including retries) is handed to its own agent run on the
+    dispatcher's worker pool. Blocks only while the pool is saturated.
+    """
+    fetch_emails()
+    metrics.POLLS.inc()
+    futures = drain_queue()
+    if not futures:
+        metrics.LLM_CALLS_AVOIDED.inc()
+        print(f"[{datetime.now()}] No new customer emails, skipped agent "
+              f"({metrics.LLM_CALLS_AVOIDED.value():.0f} LLM calls avoided)")
+    return futures
+
+
+def run_queue_worker(check_interval: float = 5, max_interval: float = 60):
+    """Only drain the work queue; run any number of these next to one fetching processor."""
+    print(f"[{datetime.now()}] Starting queue worker...")
+    start_metrics_server()
+    backoff = AdaptiveBackoff(check_interval, max_interval)
+    while True:
+        try:
+            dispatched = drain_queue()
+        except Exception as e:
+            print(f"[{datetime.now()}] Error in queue worker: {e}")
+            dispatched = []
+        time.sleep(backoff.reset() if dispatched else backoff.next())
+
+
+def run_shard_worker(slot: int, control, check_interval: float = 5, max_interval: float = 60,
+                     quantum: int = settings.mailbox_quantum):
+    """Serve the mailboxes a Supervisor assigns to this worker process.
+
+    Mailboxes take turns. Each one polls Gmail on its own backoff and never has more
+    than quantum emails claimed at a time, so a flooded inbox cannot take over the
+    worker pool while other mailboxes wait.
+    """
+    print(f"[{datetime.now()}] Starting mailbox worker {slot}...")
+    if metrics.METRICS_PORT:
+        # Each worker process serves its own metrics next to the supervisor's port
+        metrics.start_metrics_server(metrics.METRICS_PORT + 1 + slot)
+    mailboxes: List[Mailbox] = []
+    backoffs: Dict[str, AdaptiveBackoff] = {}
+    next_poll: Dict[str, float] = {}
+    in_flight: Dict[str, List[Future]] = defaultdict(list)
+    last_eviction = time.monotonic()
+    idle = check_interval
+    while True:
+        # Idle time is spent waiting on the control queue, so new assignments apply at once
+        assigned = latest_assignment(control, mailboxes, timeout=idle)
+        if assigned is None:
+            break
+        if assigned != mailboxes:
+            print(f"[{datetime.now()}] Mailbox worker {slot} now serves: "
+                  f"{', '.join(mailbox.name for mailbox in assigned) or 'nothing'}")
+            mailboxes = assigned
+        evict = time.monotonic() - last_eviction >= EVICTION_INTERVAL
+        for mailbox in mailboxes:
+            with use_mailbox(mailbox):
+                try:
+                    if time.monotonic() >= next_poll.get(mailbox.name, 0.0):
+                        backoff = backoffs.setdefault(mailbox.name, AdaptiveBackoff(check_interval, max_interval))
+                        delay = backoff.reset() if fetch_emails() else backoff.next()
+                        next_poll[mailbox.name] = time.monotonic() + delay
+                    pending = [future for future in in_flight[mailbox.name] if not future.done()]
+                    in_flight[mailbox.name] = pending + drain_queue(limit=quantum - len(pending))
+                    if evict:
+                        get_checkpoints().evict_idle(settings.thread_idle_seconds)
+                except Exception as e:
+                    print(f"[{datetime.now()}] Error serving mailbox {mailbox.name}: {e}")
+        if evict:
+            last_eviction = time.monotonic()
+
+        # Sleep until an email finishes, freeing part of its mailbox's quantum, or the next poll is due
+        pending = [future for futures in in_flight.values() for future in futures if not future.done()]
+        due = min((next_poll[m.name] for m in mailboxes if m.name in next_poll),
+                  default=time.monotonic() + check_interval)
+        idle = max(0.0, due - time.monotonic())
+        if pending:
+            wait(pending, timeout=idle, return_when=FIRST_COMPLETED)
+            idle = 0.0
+    print(f"[{datetime.now()}] Mailbox worker {slot} stopping")
+    dispatcher.shutdown()
+
+
+def run_supervisor(mailboxes_path: str, workers: int, check_interval: float = 5, max_interval: float = 60):
+    """Serve every mailbox in mailboxes_path, sharded across worker processes."""
+    mailboxes = load_mailboxes(mailboxes_path)
+    print(f"[{datetime.now()}] Starting supervisor for {len(mailboxes)} mailboxes...")
+    Supervisor(mailboxes, run_shard_worker, workers=workers, args=(check_interval, max_interval)).run()
+
+
+def start_metrics_server():
+    """Expose Prometheus metrics if METRICS_PORT is configured."""
+    if metrics.METRICS_PORT:
+        metrics.start_metrics_server(metrics.METRICS_PORT)
+
+
+def start_push_receiver():
+    """Start the push notification receiver if PUSH_RECEIVER_PORT is configured."""
+    if not settings.push_receiver_port:
         return None
+    return PushReceiver(
+        host=settings.push_receiver_host,
+        port=settings.push_receiver_port,
+        token=settings.push_token,
+    ).start()
 
-def run_email_processor(check_interval: int = 5):
-    """Run the email processor as a continuous job."""
+
+def run_email_processor(check_interval: float = 5, max_interval: float = 60):
+    """Run the email processor as a continuous job.
+
+    With a push receiver, each Gmail notification triggers a fetch immediately and
+    polling only acts as a slow safety net. Without one, or while the Gmail watch
+    cannot be registered, the poll interval backs off from check_interval to
+    max_interval while the inbox stays quiet.
+    """
     print(f"[{datetime.now()}] Starting email processor job...")
-    print("Checking for new emails every", check_interval, "seconds")
-    
+    start_metrics_server()
+    receiver = start_push_receiver()
+    topic = settings.gmail_pubsub_topic
+    backoff = AdaptiveBackoff(check_interval, settings.push_fallback_interval if receiver else max_interval)
+    print(f"Checking for new emails every {check_interval}-{backoff.max_interval} seconds"
+          + (" and on push notifications" if receiver else ""))
+
+    last_eviction = time.monotonic()
+    watch_backoff = AdaptiveBackoff(WATCH_RETRY_MIN_INTERVAL, WATCH_RETRY_MAX_INTERVAL)
+    next_watch = 0.0
     while True:
+        # A failed watch registration must not stop polling; it is retried on its own backoff
+        if receiver is not None and topic and time.monotonic() >= next_watch:
+            try:
+                register_watch(get_gmail_service(), topic)
+                next_watch = time.monotonic() + WATCH_RENEWAL_INTERVAL
+                watch_backoff.reset()
+                backoff.max_interval = settings.push_fallback_interval
+            except Exception as e:
+                retry = watch_backoff.next()
+                next_watch = time.monotonic() + retry
+                # No notifications arrive without a watch, so poll as often as without a receiver
+                backoff.max_interval = max(check_interval, max_interval)
+                backoff.current = min(backoff.current, backoff.max_interval)
+                print(f"[{datetime.now()}] Could not register Gmail watch on {topic}, "
+                      f"polling meanwhile and retrying in {retry:.0f}s: {e}")
+        dispatched = []
         try:
-            process_emails()
+            dispatched = process_emails()
+            if time.monotonic() - last_eviction >= EVICTION_INTERVAL:
+                evicted = get_checkpoints().evict_idle(settings.thread_idle_seconds)
+                last_eviction = time.monotonic()
+                print(f"[{datetime.now()}] Evicted {evicted} idle conversation threads")
+                if settings.response_cache_enabled:
+                    from services.mailer.response_cache import cache_stats, format_cache_stats
+                    print(f"[{datetime.now()}] Response cache: {format_cache_stats(cache_stats())}")
             print(f"[{datetime.now()}] Email processor job completed successfully")
-            time.sleep(check_interval)
         except Exception as e:
             print(f"[{datetime.now()}] Error in job: {e}")
-            time.sleep(check_interval)
-        time.sleep(check_interval)
+
+        delay = backoff.reset() if dispatched else backoff.next()
+        if receiver is not None:
+            receiver.wait(delay)
+        else:
+            time.sleep(delay)
 
 if __name__ == "__main__":
-    run_email_processor()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Customer email processor")
+    parser.add_argument('--worker', action='store_true',
+                        help='Only process queued emails; do not fetch from Gmail')
+    parser.add_argument('--mailboxes', nargs='?', const=settings.mailboxes_path, metavar='PATH',
+                        help=f"Serve every mailbox listed in this JSON file (default {settings.mailboxes_path})")
+    parser.add_argument('--processes', type=int, default=settings.mailbox_workers,
+                        help='Worker processes to shard the mailboxes across')
+    args = parser.parse_args()
+    intervals = {
+        'check_interval': settings.check_interval,
+        'max_interval': settings.poll_max_interval,
+    }
+    if args.mailboxes:
+        run_supervisor(args.mailboxes, args.processes, **intervals)
+    elif args.worker:
+        run_queue_worker(**intervals)
+    else:
+        run_email_processor(**intervals)
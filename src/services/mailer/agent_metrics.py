@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from services.mailer import metrics
+from services.mailer.token_budget import cache_tokens
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Record every chat model call and tool call of an agent run as a metrics span.
+
+    Token counts are always recorded; latencies only when metrics are enabled.
+    Replies served by the response cache are recorded as ``llm_cache`` spans and
+    not counted as model calls.
+    """
+
+    def __init__(self):
+        self._started: Dict[UUID, Tuple[str, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, stage: str) -> None:
+        if metrics.ENABLED:
+            with self._lock:
+                self._started[run_id] = (stage, time.time(), time.perf_counter())
+
+    def _end(self, run_id: UUID, error: Optional[str] = None, stage: Optional[str] = None) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is not None:
+            started_stage, started_at, start = started
+            metrics.record_span(stage or started_stage, started_at, time.perf_counter() - start, error)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, 'llm')
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        cached = False
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                cached = cached or bool(getattr(message, 'response_metadata', {}).get('cache_hit'))
+                usage = getattr(message, 'usage_metadata', None)
+                if usage:
+                    read, written = cache_tokens(usage)
+                    metrics.LLM_TOKENS.inc(usage.get('input_tokens', 0), type='input')
+                    metrics.LLM_TOKENS.inc(usage.get('output_tokens', 0), type='output')
+                    metrics.LLM_TOKENS.inc(read, type='cache_read')
+                    metrics.LLM_TOKENS.inc(written, type='cache_creation')
+        if not cached:
+            metrics.LLM_CALLS.inc()
+        self._end(run_id, stage='llm_cache' if cached else None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        metrics.LLM_CALLS.inc()
+        self._end(run_id, type(error).__name__)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, f"tool:{(serialized or {}).get('name', kwargs.get('name', 'unknown'))}")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, type(error).__name__)
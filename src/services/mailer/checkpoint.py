@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import time
+from typing import Dict
+
+from langchain_core.messages import RemoveMessage, trim_messages
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from services.mailer.settings import settings
+
+CHECKPOINT_DB_PATH = settings.checkpoint_db_path
+# Messages kept per conversation thread; older turns are dropped from state
+MAX_HISTORY_MESSAGES = settings.max_history_messages
+# Threads with no activity for this long are deleted entirely
+THREAD_IDLE_SECONDS = settings.thread_idle_seconds
+
+
+def bound_history(state: Dict) -> Dict:
+    """pre_model_hook that keeps only the last MAX_HISTORY_MESSAGES messages.
+
+    The trimmed list replaces the stored messages, so both the checkpoint and the
+    prompt sent to the model stay bounded. Only earlier turns are dropped: the
+    latest human message and everything after it are always kept, even when the
+    current run alone is longer than the window. Trimming starts on a human message
+    so a tool result is never separated from the tool call that produced it.
+    """
+    messages = state['messages']
+    if len(messages) <= MAX_HISTORY_MESSAGES:
+        return {'llm_input_messages': messages}
+    start = max((i for i, message in enumerate(messages) if message.type == 'human'), default=0)
+    current, earlier = messages[start:], messages[:start]
+    budget = MAX_HISTORY_MESSAGES - len(current)
+    if budget > 0:
+        kept = trim_messages(
+            earlier,
+            strategy='last',
+            token_counter=len,
+            max_tokens=budget,
+            start_on='human',
+            include_system=True,
+        )
+    else:
+        kept = [message for message in earlier[:1] if message.type == 'system']
+    if len(kept) == len(earlier):
+        return {'llm_input_messages': messages}
+    trimmed = [*kept, *current]
+    # llm_input_messages persists in state, so it must be replaced here too or the
+    # model would see the input left over from the previous untrimmed call
+    return {'messages': [RemoveMessage(id=REMOVE_ALL_MESSAGES), *trimmed], 'llm_input_messages': trimmed}
+
+
+class CheckpointStore:
+    """SQLite-backed checkpointer that keeps one checkpoint per thread and evicts idle threads."""
+
+    def __init__(self, path: str = CHECKPOINT_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+        self.saver.setup()
+        with self.saver.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity ("
+                "thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+            )
+
+    def touch(self, thread_id: str) -> None:
+        """Record activity and drop all but the newest checkpoint of the thread."""
+        with self.saver.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (thread_id, time.time()),
+            )
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN ("
+                "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? GROUP BY checkpoint_ns)",
+                (thread_id, thread_id),
+            )
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN ("
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)",
+                (thread_id, thread_id),
+            )
+
+    def evict_idle(self, max_idle_seconds: float = THREAD_IDLE_SECONDS) -> int:
+        """Delete threads idle for longer than max_idle_seconds and return how many were removed."""
+        cutoff = time.time() - max_idle_seconds
+        with self.saver.cursor() as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE last_seen < ?", (cutoff,))
+            thread_ids = [row[0] for row in cur.fetchall()]
+            for thread_id in thread_ids:
+                cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+        return len(thread_ids)
+
+    def size_bytes(self) -> int:
+        """Total serialized size of all stored checkpoints and pending writes."""
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints")
+            checkpoints = cur.fetchone()[0]
+            cur.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes")
+            return checkpoints + cur.fetchone()[0]
+
+    def thread_count(self) -> int:
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(*) FROM thread_activity")
+            return cur.fetchone()[0]
@@ -0,0 +1,97 @@
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class EmailDispatcher:
+    """Fan emails out to a handler on a bounded thread pool.
+
+    At most ``max_workers`` emails run at once and at most ``max_pending`` more wait
+    in the queue; ``submit`` blocks once both are full, so a slow backend slows
+    ingestion down instead of letting the queue grow without bound. Emails that
+    share a key (by default the sender) are handled one at a time so they never
+    race on the same conversation thread.
+    """
+
+    def __init__(self, handler: Callable[[Dict], Any], max_workers: int = 4, max_pending: Optional[int] = None,
+                 key: Callable[[Dict], str] = lambda email: email['sender_email']):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self._handler = handler
+        self._key = key
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='email-worker')
+        self._slots = threading.BoundedSemaphore(max_workers + (max_workers if max_pending is None else max_pending))
+        # Emails waiting behind the running one of their key; a key is present only while one of its emails runs
+        self._waiting: Dict[str, Deque[Tuple[Dict, contextvars.Context, Future]]] = {}
+        self._waiting_lock = threading.Lock()
+        self.max_workers = max_workers
+
+    def _run(self, email: Dict) -> Any:
+        try:
+            return self._handler(email)
+        except Exception as e:
+            print(f"[{datetime.now()}] Error handling email {email.get('id')}: {e}")
+            raise
+
+    def _start(self, key: str, email: Dict, context: contextvars.Context, future: Future) -> None:
+        """Run email on the pool unless it was cancelled while waiting; the key's next email follows it."""
+        if not future.set_running_or_notify_cancel():
+            self._start_next(key)
+            return
+        try:
+            running = self._executor.submit(context.run, self._run, email)
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            # E.g. the pool was shut down; the email's future carries the error
+            future.set_exception(e)
+            self._start_next(key)
+            return
+        running.add_done_callback(lambda done: self._finish(key, done, future))
+
+    def _finish(self, key: str, done: Future, future: Future) -> None:
+        self._start_next(key)
+        if done.cancelled():
+            future.set_exception(CancelledError())
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+
+    def _start_next(self, key: str) -> None:
+        with self._waiting_lock:
+            waiting = self._waiting[key]
+            if not waiting:
+                del self._waiting[key]
+                return
+            entry = waiting.popleft()
+        self._start(key, *entry)
+
+    def submit(self, email: Dict, timeout: Optional[float] = None) -> Future:
+        """Queue one email, blocking while the pool is saturated.
+
+        An email whose key already has one running waits off the pool and is started
+        once that one finishes, so a burst from one customer never occupies more than
+        one worker. Raises TimeoutError if no slot frees up within ``timeout`` seconds.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Email dispatcher is saturated")
+        future: Future = Future()
+        future.add_done_callback(lambda _: self._slots.release())
+        key = self._key(email)
+        # The handler runs in a copy of the caller's context, e.g. the mailbox being served
+        context = contextvars.copy_context()
+        with self._waiting_lock:
+            if key in self._waiting:
+                self._waiting[key].append((email, context, future))
+                return future
+            self._waiting[key] = deque()
+        self._start(key, email, context, future)
+        return future
+
+    def dispatch(self, emails: List[Dict]) -> List[Future]:
+        return [self.submit(email) for email in emails]
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
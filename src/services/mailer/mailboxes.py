@@ -0,0 +1,83 @@
+import json
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.mailer.settings import settings
+
+MAILBOXES_PATH = settings.mailboxes_path
+# Each mailbox keeps its queue, sync state and checkpoints in its own directory here
+MAILBOX_STATE_DIR = settings.mailbox_state_dir
+# Default token location for a mailbox without an explicit token_path
+MAILBOX_CREDENTIALS_DIR = os.path.dirname(settings.gmail_token_path)
+
+_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+# The mailbox being served by the current thread, see use_mailbox
+_current: ContextVar[Optional['Mailbox']] = ContextVar('mailer_mailbox', default=None)
+
+
+@dataclass(frozen=True)
+class Mailbox:
+    """One shop mailbox with its own Gmail token and state namespace."""
+    name: str
+    token_path: str
+    state_dir: str
+    allowed_customers: Tuple[str, ...] = ()
+
+    @property
+    def sync_state_path(self) -> str:
+        return os.path.join(self.state_dir, 'gmail_sync.json')
+
+    @property
+    def work_queue_path(self) -> str:
+        return os.path.join(self.state_dir, 'work_queue.sqlite')
+
+    @property
+    def checkpoint_db_path(self) -> str:
+        return os.path.join(self.state_dir, 'checkpoints.sqlite')
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Mailbox':
+        name = data['name']
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid mailbox name {name!r}: use letters, digits, '.', '_' and '-'")
+        return cls(
+            name=name,
+            token_path=data.get('token_path') or os.path.join(MAILBOX_CREDENTIALS_DIR, name, 'token.json'),
+            state_dir=data.get('state_dir') or os.path.join(MAILBOX_STATE_DIR, name),
+            allowed_customers=tuple(data.get('allowed_customers', settings.allowed_customers)),
+        )
+
+
+def load_mailboxes(path: str = MAILBOXES_PATH) -> List[Mailbox]:
+    """Read the mailbox list, a JSON array of {"name", "token_path"?, "state_dir"?, "allowed_customers"?}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        mailboxes = [Mailbox.from_dict(entry) for entry in json.load(f)]
+    names = [mailbox.name for mailbox in mailboxes]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate mailbox names in {path}: {', '.join(duplicates)}")
+    return mailboxes
+
+
+def current_mailbox() -> Optional[Mailbox]:
+    """The mailbox being served, or None in single-mailbox mode."""
+    return _current.get()
+
+
+@contextmanager
+def use_mailbox(mailbox: Optional[Mailbox]) -> Iterator[Optional[Mailbox]]:
+    """Scope Gmail, the work queue, the outbox and checkpoints to mailbox within the block.
+
+    Work handed to the dispatcher or the outbox runs in a copy of the caller's
+    context, so it stays on the same mailbox.
+    """
+    token = _current.set(mailbox)
+    try:
+        yield mailbox
+    finally:
+        _current.reset(token)
@@ -0,0 +1,217 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+from services.mailer.settings import settings
+
+# Timing spans are recorded only when a metrics port or METRICS_ENABLED is set;
+# counters are always kept because they are as cheap as the prints they feed.
+METRICS_PORT = settings.metrics_port
+ENABLED = settings.metrics_enabled
+TRACE_PATH = settings.trace_path
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self._values.items()))
+        return '\n'.join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    bucket_label = f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(key, bucket_label)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return '\n'.join(lines)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('mailer_stage_seconds', 'Latency of pipeline stages, tool calls and LLM calls')
+ERRORS = REGISTRY.counter('mailer_errors_total', 'Errors raised inside a pipeline stage')
+EMAILS = REGISTRY.counter('mailer_emails_total', 'Customer emails by outcome (fetched, done, failed)')
+INVOICES = REGISTRY.counter('mailer_invoices_total', 'Invoices sent')
+LLM_CALLS = REGISTRY.counter('mailer_llm_calls_total', 'Chat model calls')
+LLM_CALLS_AVOIDED = REGISTRY.counter('mailer_llm_calls_avoided_total', 'Polls that skipped the agent')
+LLM_TOKENS = REGISTRY.counter('mailer_llm_tokens_total',
+                              'Chat model tokens by type (input, output, and the cache_read and '
+                              'cache_creation parts of input)')
+CONTEXT_TRIMMED_TOKENS = REGISTRY.counter('mailer_context_trimmed_tokens_total',
+                                          'Tool output tokens kept out of model calls by the token budget')
+POLLS = REGISTRY.counter('mailer_polls_total', 'Inbox polls')
+SENDS = REGISTRY.counter('mailer_sends_total', 'Outbound send attempts by outcome (sent, retry, failed)')
+ORDER_PATHS = REGISTRY.counter('mailer_order_path_total', 'Emails by handling path (fast, agent)')
+RESPONSE_CACHE = REGISTRY.counter('mailer_response_cache_total',
+                                  'Response cache lookups by kind (llm) and result (hit, miss, skipped)')
+CACHE_SAVED_SECONDS = REGISTRY.counter('mailer_response_cache_saved_seconds_total',
+                                       'Model latency avoided by response cache hits')
+CACHE_SAVED_TOKENS = REGISTRY.counter('mailer_response_cache_saved_tokens_total',
+                                      'Chat model tokens avoided by response cache hits by type (input, output)')
+
+
+# --- Per-email tracing ---------------------------------------------------------
+
+_current_trace: ContextVar[Optional[str]] = ContextVar('mailer_trace_id', default=None)
+_trace_lock = threading.Lock()
+_trace_file = None
+
+
+def _write_trace(record: Dict) -> None:
+    global _trace_file  # pylint: disable=global-statement
+    with _trace_lock:
+        if _trace_file is None:
+            _trace_file = open(TRACE_PATH, 'a', encoding='utf-8')
+        _trace_file.write(json.dumps(record) + '\n')
+        _trace_file.flush()
+
+
+@contextmanager
+def trace(trace_id: str):
+    """Attribute every span recorded inside this block (and its tool threads) to trace_id."""
+    token = _current_trace.set(trace_id)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+# --- Spans ---------------------------------------------------------------------
+
+def record_span(stage: str, started_at: float, duration: float, error: Optional[str] = None) -> None:
+    STAGE_SECONDS.observe(duration, stage=stage)
+    if error is not None:
+        ERRORS.inc(stage=stage)
+    trace_id = _current_trace.get()
+    if TRACE_PATH and trace_id is not None:
+        _write_trace({'trace_id': trace_id, 'stage': stage, 'start': started_at,
+                      'duration': round(duration, 6), 'error': error})
+
+
+@contextmanager
+def _span(stage: str):
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record_span(stage, started_at, time.perf_counter() - start, error)
+
+
+_DISABLED_SPAN = nullcontext()
+
+
+def span(stage: str):
+    """Time a block as one pipeline stage; a shared no-op when metrics are disabled."""
+    return _span(stage) if ENABLED else _DISABLED_SPAN
+
+
+# --- /metrics endpoint -----------------------------------------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"[{datetime.now()}] Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from models.product_types import APPLE_PRODUCT_PRICES
+from services.mailer import metrics
+from services.mailer.tools.send_mail import send_email
+from services.mailer.utils.pricing_client import pricing_client
+
+EXTRACTION_PROMPT = (
+    "Extract the order from a customer email for an Apple reseller. Product ids must be one of: "
+    + ', '.join(APPLE_PRODUCT_PRICES) + ". "
+    "Set is_order only if the email places or confirms a concrete order. Set needs_clarification "
+    "if any product or quantity is unclear, or the email also asks questions that need a written answer."
+)
+
+
+class ExtractedItem(BaseModel):
+    product_id: str = Field(description="Catalogue product id, e.g. iphone_15_pro")
+    quantity: int = Field(description="Number of units ordered")
+
+
+class ExtractedOrder(BaseModel):
+    """Order details extracted from one customer email."""
+    is_order: bool = Field(description="True if the email places or confirms a concrete order")
+    needs_clarification: bool = Field(description="True if products or quantities are ambiguous or "
+                                                  "the email needs more than an order confirmation")
+    customer_name: str = Field(description="The customer's full name")
+    items: List[ExtractedItem] = Field(default_factory=list)
+
+
+def product_description(product_id: str) -> str:
+    return product_id.replace('_', ' ').title()
+
+
+class OrderFastPath:
+    """Handle well-formed orders with one structured-output call instead of a ReAct loop.
+
+    The model only extracts the order; pricing is one bulk lookup and the reply and
+    invoice are built deterministically. Anything the extraction does not vouch for
+    returns None so the caller can fall back to the full agent. on_confirmed(email, reply)
+    is called with each confirmation sent, so it can be recorded in the customer's thread.
+    """
+
+    def __init__(self, chat_model, callbacks: Optional[List] = None,
+                 on_confirmed: Optional[Callable[[Dict, str], None]] = None):
+        self._extractor = chat_model.with_structured_output(ExtractedOrder)
+        self._callbacks = callbacks or []
+        self._on_confirmed = on_confirmed
+
+    def extract(self, email: Dict) -> Optional[ExtractedOrder]:
+        messages = [
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {"role": "user", "content": json.dumps(email, indent=2)},
+        ]
+        with metrics.span('order_extraction'):
+            return self._extractor.invoke(messages, config={"callbacks": self._callbacks})
+
+    def price(self, order: ExtractedOrder) -> Optional[Dict[str, float]]:
+        """Price every item in one call; None if any product is unknown or the order is malformed."""
+        product_ids = [item.product_id for item in order.items]
+        if not product_ids or any(item.quantity < 1 for item in order.items) \
+                or any(p not in APPLE_PRODUCT_PRICES for p in product_ids):
+            return None
+        prices = pricing_client.get_prices(product_ids)
+        if any(prices.get(p) is None for p in product_ids):
+            return None
+        return prices
+
+    def handle(self, email: Dict) -> Optional[str]:
+        """Confirm and invoice the order in email, or return None if the agent should take over."""
+        try:
+            order = self.extract(email)
+        except Exception as e:
+            print(f"[{datetime.now()}] Order extraction failed for {email['id']}, using agent: {e}")
+            return None
+        if order is None or not order.is_order or order.needs_clarification:
+            return None
+        prices = self.price(order)
+        if prices is None:
+            print(f"[{datetime.now()}] Order in {email['id']} has unknown items, using agent")
+            return None
+
+        items = [{'description': product_description(item.product_id), 'quantity': item.quantity,
+                  'price': prices[item.product_id]} for item in order.items]
+        lines = '\n'.join(f"- {item['quantity']} x {item['description']} at ${item['price']:.2f}" for item in items)
+        body = (f"Dear {order.customer_name},\n\nThank you for your order. We have confirmed the following "
+                f"items:\n\n{lines}\n\nYour invoice is attached.\n\nBest regards")
+        result = send_email.invoke({
+            'to': email['sender_email'],
+            'subject': f"Re: {email['subject']}",
+            'body': body,
+            'attach_invoice': True,
+            'order_details': {'customer_name': order.customer_name, 'items': items},
+            'reply_to_message_id': email['id'],
+        })
+        print(f"[{datetime.now()}] Fast path confirmed order {email['id']} ({len(items)} items): {result}")
+        if self._on_confirmed is not None:
+            self._on_confirmed(email, f"Sent this order confirmation to {email['sender_email']} "
+                                      f"with the invoice attached:\n\n{body}")
+        return f"Confirmed order with {len(items)} items for {order.customer_name}: {result}"
@@ -0,0 +1,214 @@
+import contextvars
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from services.mailer.mailboxes import current_mailbox
+from services.mailer.metrics import SENDS, span
+from services.mailer.settings import settings
+from services.mailer.utils.get_gmail_service import get_gmail_service
+
+# Sustained sends per second and burst size; Gmail throttles bursts per user well below its daily quota
+SEND_RATE = settings.gmail_send_rate
+SEND_BURST = settings.gmail_send_burst
+SEND_MAX_ATTEMPTS = settings.gmail_send_max_attempts
+OUTBOX_WORKERS = settings.outbox_workers
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Deliveries submitted while handling the current email, see Outbox.track
+_deliveries: ContextVar[Optional[List[Future]]] = ContextVar('mailer_deliveries', default=None)
+# Id of the email being handled, see delivery_key
+_replying_to: ContextVar[Optional[str]] = ContextVar('mailer_replying_to', default=None)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``pause`` makes every caller wait, e.g. after a 429."""
+
+    def __init__(self, rate: float, capacity: int):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+def _status(error: HttpError) -> int:
+    return int(getattr(error.resp, 'status', 0) or 0)
+
+
+def _retry_after(error: HttpError) -> Optional[float]:
+    try:
+        return float(error.resp.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _gmail_send(body: Dict) -> Dict:
+    return get_gmail_service().users().messages().send(userId='me', body=body).execute()
+
+
+class Outbox:
+    """Send outbound mail in the background under a shared rate limit.
+
+    ``submit`` takes a callable that builds the ``messages.send`` body, so expensive
+    work such as invoice rendering also happens off the caller's thread. Sends that
+    Gmail throttles (429) or fails (5xx) are retried with exponential backoff,
+    honouring Retry-After; the returned Future resolves to the sent message or
+    raises the final error.
+    """
+
+    def __init__(self, send: Callable[[Dict], Dict] = _gmail_send, workers: int = OUTBOX_WORKERS,
+                 rate: float = SEND_RATE, burst: int = SEND_BURST, max_attempts: int = SEND_MAX_ATTEMPTS,
+                 base_backoff: float = BASE_BACKOFF_SECONDS, max_backoff: float = MAX_BACKOFF_SECONDS):
+        self._send = send
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def submit(self, build: Callable[[], Dict], description: str = '',
+               on_done: Optional[Callable[[Optional[Dict]], None]] = None) -> Future:
+        """Queue a delivery. on_done gets the sent message, or None if it failed, before the Future resolves."""
+        # Run in a copy of the caller's context so spans keep the email's trace id
+        future = self._executor.submit(contextvars.copy_context().run, self._run, build, description, on_done)
+        deliveries = _deliveries.get()
+        if deliveries is not None:
+            deliveries.append(future)
+        return future
+
+    def _backoff(self, attempt: int, error: HttpError) -> float:
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        return delay
+
+    def _run(self, build: Callable[[], Dict], description: str,
+             on_done: Optional[Callable[[Optional[Dict]], None]]) -> Dict:
+        try:
+            result = self._deliver(build, description)
+        except BaseException:
+            if on_done is not None:
+                on_done(None)
+            raise
+        if on_done is not None:
+            on_done(result)
+        return result
+
+    def _deliver(self, build: Callable[[], Dict], description: str) -> Dict:
+        body = build()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.bucket.acquire()
+            try:
+                with span('gmail_send'):
+                    result = self._send(body)
+            except HttpError as e:
+                if _status(e) not in RETRYABLE_STATUSES or attempt == self.max_attempts:
+                    SENDS.inc(outcome='failed')
+                    print(f"[{datetime.now()}] Delivery of {description} failed after {attempt} attempts: {e}")
+                    raise
+                delay = self._backoff(attempt, e)
+                if _status(e) == 429:
+                    # Throttling is per user, so every worker backs off together
+                    self.bucket.pause(delay)
+                SENDS.inc(outcome='retry')
+                print(f"[{datetime.now()}] Gmail returned {_status(e)} for {description}, "
+                      f"retrying in {delay:.1f}s (attempt {attempt}/{self.max_attempts})")
+                time.sleep(delay)
+            else:
+                SENDS.inc(outcome='sent')
+                print(f"[{datetime.now()}] Delivered {description} (gmail id {result.get('id')}, "
+                      f"attempt {attempt})")
+                return dict(result, attempts=attempt)
+
+    @staticmethod
+    @contextmanager
+    def track(message_id: Optional[str] = None) -> Iterator[List[Future]]:
+        """Collect the deliveries submitted within the block, including from agent tool threads.
+
+        With the id of the email being handled, every reply sent within the block
+        gets a delivery key, see delivery_key.
+        """
+        deliveries: List[Future] = []
+        token = _deliveries.set(deliveries)
+        replying_to_token = _replying_to.set(message_id)
+        try:
+            yield deliveries
+        finally:
+            _replying_to.reset(replying_to_token)
+            _deliveries.reset(token)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+def delivery_key(to: str, subject: str, body: str, invoice: bool) -> Optional[str]:
+    """Idempotency key of a reply to the tracked email: its id and a hash of the reply.
+
+    A retried email is handled again from the start; a reply identical to one its
+    earlier attempt delivered gets the same key and is not sent twice, while any
+    other reply, such as the invoice after a plain answer, is. None outside Outbox.track.
+    """
+    message_id = _replying_to.get()
+    if message_id is None:
+        return None
+    content = json.dumps([to, subject, body, invoice])
+    return f"reply:{message_id}:{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}"
+
+
+def wait_for_deliveries(deliveries: List[Future], timeout: Optional[float] = None) -> List[Dict]:
+    """Block until every delivery finished; raises the first delivery error."""
+    return [future.result(timeout=timeout) for future in deliveries]
+
+
+_outboxes: Dict[Optional[str], Outbox] = {}
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """Outbox of the current mailbox, started on first use.
+
+    Gmail throttles per user, so every mailbox gets its own rate limit.
+    """
+    mailbox = current_mailbox()
+    name = mailbox.name if mailbox else None
+    with _outbox_lock:
+        if name not in _outboxes:
+            _outboxes[name] = Outbox()
+        return _outboxes[name]
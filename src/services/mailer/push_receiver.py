@@ -0,0 +1,105 @@
+import base64
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class AdaptiveBackoff:
+    """Polling interval that doubles while idle and snaps back once there is work."""
+
+    def __init__(self, min_interval: float, max_interval: float, factor: float = 2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.factor = factor
+        self.current = min_interval
+
+    def reset(self) -> float:
+        self.current = self.min_interval
+        return self.current
+
+    def next(self) -> float:
+        """Return the delay before the next poll and grow it for the one after."""
+        delay = self.current
+        self.current = min(self.current * self.factor, self.max_interval)
+        return delay
+
+
+class PushReceiver:
+    """Local HTTP endpoint for Gmail notifications delivered by a Pub/Sub push subscription.
+
+    Each valid POST wakes whoever is blocked in ``wait``. Notifications that arrive
+    while the mailer is busy collapse into a single wake-up, since every fetch picks
+    up everything that is new anyway.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8085, token: Optional[str] = None):
+        self.token = token
+        self.notifications = 0
+        self.last_history_id: Optional[str] = None
+        self._event = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):  # pylint: disable=invalid-name
+                query = parse_qs(urlparse(self.path).query)
+                if receiver.token and query.get('token', [None])[0] != receiver.token:
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    envelope = json.loads(self.rfile.read(length))
+                    data = json.loads(base64.b64decode(envelope['message']['data']))
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                receiver.notify(data.get('historyId'))
+                # Any 2xx acknowledges the Pub/Sub message
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+    def notify(self, history_id: Optional[str] = None) -> None:
+        self.notifications += 1
+        self.last_history_id = history_id
+        self._event.set()
+
+    def start(self) -> 'PushReceiver':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='push-receiver', daemon=True)
+        self._thread.start()
+        print(f"[{datetime.now()}] Listening for Gmail push notifications on port {self.port}")
+        return self
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a notification arrives or timeout expires; True if woken by a notification."""
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def register_watch(service, topic_name: str) -> dict:
+    """Ask Gmail to publish INBOX changes to a Pub/Sub topic. Must be renewed at least every 7 days."""
+    return service.users().watch(
+        userId='me',
+        body={'topicName': topic_name, 'labelIds': ['INBOX'], 'labelFilterBehavior': 'INCLUDE'}
+    ).execute()
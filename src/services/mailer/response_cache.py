@@ -0,0 +1,295 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from services.mailer import metrics
+from services.mailer.settings import settings
+from services.mailer.utils.sqlite_db import SQLiteConnections
+
+RESPONSE_CACHE_ENABLED = settings.response_cache_enabled
+RESPONSE_CACHE_PATH = settings.response_cache_path
+RESPONSE_CACHE_TTL = settings.response_cache_ttl
+RESPONSE_CACHE_MAX_ENTRIES = settings.response_cache_max_entries
+
+# Tools that only read; a reply calling any other tool is only reused if it cannot confirm an order
+READ_ONLY_TOOLS = frozenset({'get_api_info', 'get_product_price', 'get_product_prices'})
+# Message fields that differ between otherwise identical calls
+VOLATILE_FIELDS = frozenset({'id', 'response_metadata', 'usage_metadata', 'additional_kwargs'})
+
+_TOOL_CALL_ID = re.compile(r'\b(toolu|call)_[A-Za-z0-9]{8,}\b')
+_PLACEHOLDER_ID = re.compile(r'<<(toolu|call)_\d+>>')
+_WHITESPACE = re.compile(r'(?:\\[nrt]|\s)+')
+_CUSTOMER_PLACEHOLDER = re.compile(r'<<(?:local_part|sender_email|from|email_id|thread_id|name(?:_\d+)?)>>')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    latency REAL NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+"""
+
+# Customer details of the email being handled mapped to their placeholders, see scope
+_email: ContextVar[Optional[Dict[str, str]]] = ContextVar('mailer_cache_email', default=None)
+
+
+def _email_values(email: Dict) -> Dict[str, str]:
+    """Map the customer-specific values of email to the placeholders they are cached under."""
+    sender = email.get('from') or ''
+    name = sender.split('<')[0].strip().strip('"')
+    sender_email = email.get('sender_email') or ''
+    values = {
+        sender_email.split('@')[0]: '<<local_part>>',
+        sender_email: '<<sender_email>>',
+        sender: '<<from>>',
+        email.get('id'): '<<email_id>>',
+        email.get('threadId'): '<<thread_id>>',
+    }
+    for i, part in enumerate(name.split()):
+        values.setdefault(part, f'<<name_{i}>>')
+    values.setdefault(name, '<<name>>')
+    return {value: placeholder for value, placeholder in values.items() if value and len(value) >= 3}
+
+
+def _substitute(text: str, replacements: Dict[str, str]) -> str:
+    """Replace whole-word occurrences of each key of replacements, longest first."""
+    if not replacements:
+        return text
+    pattern = '|'.join(r'(?<!\w)' + re.escape(value) + r'(?!\w)'
+                       for value in sorted(replacements, key=len, reverse=True))
+    return re.sub(pattern, lambda match: replacements[match.group(0)], text)
+
+
+def _number_tool_call_ids(text: str) -> str:
+    """Tool call ids are random per call; number them in order of appearance instead."""
+    numbers: Dict[str, str] = {}
+
+    def number(match: re.Match) -> str:
+        if match.group(0) not in numbers:
+            numbers[match.group(0)] = f'<<{match.group(1)}_{len(numbers)}>>'
+        return numbers[match.group(0)]
+
+    return _TOOL_CALL_ID.sub(number, text)
+
+
+def _fresh_tool_call_ids(text: str) -> str:
+    ids: Dict[str, str] = {}
+    return _PLACEHOLDER_ID.sub(
+        lambda match: ids.setdefault(match.group(0), f'{match.group(1)}_{uuid.uuid4().hex[:24]}'), text)
+
+
+def is_safe_call(call: Dict) -> bool:
+    """True if reusing this tool call cannot send an invoice or confirm an order."""
+    name, args = call.get('name'), call.get('args') or {}
+    if name in READ_ONLY_TOOLS:
+        return True
+    if name == 'send_email':
+        return not args.get('attach_invoice') and not args.get('order_details')
+    if name == 'ExtractedOrder':
+        return not args.get('is_order')
+    return False
+
+
+def _canonical_messages(prompt: str) -> List[Dict]:
+    """The serialized prompt messages without ids, metadata and token counts."""
+    canonical = []
+    for message in json.loads(prompt):
+        kwargs = message.get('kwargs') or {}
+        canonical.append({'type': (message.get('id') or ['unknown'])[-1],
+                          **{k: v for k, v in kwargs.items() if k not in VOLATILE_FIELDS}})
+    return canonical
+
+
+def _current_turn_is_safe(messages: Sequence[Dict]) -> bool:
+    """False once the agent has sent an invoice or called an unknown tool since the latest customer email."""
+    for message in reversed(messages):
+        if message['type'] == 'HumanMessage':
+            return True
+        if not all(is_safe_call(call) for call in message.get('tool_calls') or ()):
+            return False
+    return True
+
+
+class _Pending(NamedTuple):
+    """A lookup that missed, to be stored by the update that follows it."""
+    prompt: str
+    key: str
+    started: float
+
+
+class ResponseCache(BaseCache):
+    """Persistent SQLite cache of chat model replies.
+
+    Chat models use it through their ``cache`` parameter: a hit skips the model
+    call but still runs callbacks. Keys are the prompt with the current email's
+    customer details and tool call ids replaced by placeholders, whitespace
+    collapsed and case folded, so the same question from another customer hits.
+    Stored replies keep the placeholders and are filled in with the current
+    email's details on a hit. Model calls are only cached inside scope(email),
+    and replies that confirm an order or send an invoice are never stored.
+    Entries expire after ``ttl`` seconds; beyond ``max_entries`` the least
+    recently used are evicted.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # The miss lookup left for update to store, per thread
+        self._local = threading.local()
+        self._connections = SQLiteConnections(path, _SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def _get(self, key: str) -> Optional[tuple]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, input_tokens, output_tokens, latency FROM entries "
+                           "WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE entries SET hits = hits + 1, last_used = ? WHERE key = ?", (now, key))
+        return row
+
+    def _put(self, key: str, kind: str, value: str, latency: float, input_tokens: int = 0,
+             output_tokens: int = 0) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, kind, value, input_tokens, output_tokens, latency, "
+            "expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, kind, value, input_tokens, output_tokens, latency, now + self.ttl, now))
+        conn.execute("DELETE FROM entries WHERE expires_at <= ? OR key IN "
+                     "(SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (now, self.max_entries))
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str, values: Dict[str, str]) -> Optional[str]:
+        try:
+            messages = _canonical_messages(prompt)
+        except (ValueError, TypeError, AttributeError):
+            return None
+        if not _current_turn_is_safe(messages):
+            return None
+        text = _number_tool_call_ids(_substitute(json.dumps(messages, sort_keys=True), values))
+        text = _WHITESPACE.sub(' ', text).casefold()
+        return 'llm:' + hashlib.sha256(f"{llm_string}\0{text}".encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        self._local.pending = None
+        values = _email.get()
+        if values is None:
+            return None
+        key = self._key(prompt, llm_string, values)
+        if key is None:
+            metrics.RESPONSE_CACHE.inc(kind='llm', result='skipped')
+            return None
+        row = self._get(key)
+        if row is None:
+            metrics.RESPONSE_CACHE.inc(kind='llm', result='miss')
+            self._local.pending = _Pending(prompt, key, time.perf_counter())
+            return None
+        value, input_tokens, output_tokens, latency = row
+        restored = _substitute(value, {placeholder: json.dumps(v)[1:-1] for v, placeholder in values.items()})
+        if _CUSTOMER_PLACEHOLDER.search(restored):
+            # Stored for an email with details this one lacks; never send a half-filled reply
+            metrics.RESPONSE_CACHE.inc(kind='llm', result='miss')
+            self._local.pending = _Pending(prompt, key, time.perf_counter())
+            return None
+        messages = messages_from_dict(json.loads(_fresh_tool_call_ids(restored)))
+        metrics.RESPONSE_CACHE.inc(kind='llm', result='hit')
+        metrics.CACHE_SAVED_SECONDS.inc(latency, kind='llm')
+        metrics.CACHE_SAVED_TOKENS.inc(input_tokens, type='input')
+        metrics.CACHE_SAVED_TOKENS.inc(output_tokens, type='output')
+        return [ChatGeneration(message=message) for message in messages]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        pending: Optional[_Pending] = getattr(self._local, 'pending', None)
+        self._local.pending = None
+        values = _email.get()
+        if not isinstance(pending, _Pending) or pending.prompt != prompt or values is None:
+            return
+        messages: List[BaseMessage] = [getattr(generation, 'message', None) for generation in return_val]
+        if not messages or any(message is None or not all(is_safe_call(call) for call in
+                                                          getattr(message, 'tool_calls', None) or ())
+                               for message in messages):
+            return
+        usage = [message.usage_metadata or {} for message in messages if getattr(message, 'usage_metadata', None)]
+        stored = [message_to_dict(message.model_copy(update={
+            'id': None, 'response_metadata': {'cache_hit': True},
+            'usage_metadata': {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0}}))
+                  for message in messages]
+        value = _number_tool_call_ids(_substitute(json.dumps(stored, ensure_ascii=False), values))
+        self._put(pending.key, 'llm', value, time.perf_counter() - pending.started,
+                  input_tokens=sum(u.get('input_tokens', 0) for u in usage),
+                  output_tokens=sum(u.get('output_tokens', 0) for u in usage))
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def clear(self, **kwargs: Any) -> None:
+        self._conn().execute("DELETE FROM entries")
+
+
+_lock = threading.Lock()
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The shared response cache, or None if RESPONSE_CACHE is off."""
+    global _cache  # pylint: disable=global-statement
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+@contextmanager
+def scope(email: Dict) -> Iterator[None]:
+    """Allow model replies to be cached and reused while handling email."""
+    token = _email.set(_email_values(email))
+    try:
+        yield
+    finally:
+        _email.reset(token)
+
+
+def cache_stats() -> Dict[str, float]:
+    """Hit rate and savings of this process's model call lookups."""
+    hits = metrics.RESPONSE_CACHE.value(kind='llm', result='hit')
+    lookups = hits + metrics.RESPONSE_CACHE.value(kind='llm', result='miss')
+    return {
+        'hits': hits,
+        'lookups': lookups,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'saved_seconds': metrics.CACHE_SAVED_SECONDS.value(kind='llm'),
+        'saved_input_tokens': metrics.CACHE_SAVED_TOKENS.value(type='input'),
+        'saved_output_tokens': metrics.CACHE_SAVED_TOKENS.value(type='output'),
+    }
+
+
+def format_cache_stats(stats: Dict[str, float]) -> str:
+    return (f"{stats['hits']:.0f}/{stats['lookups']:.0f} model calls from cache ({stats['hit_rate']:.0%}), "
+            f"saved {stats['saved_seconds']:.1f}s and "
+            f"{stats['saved_input_tokens']:.0f} input / {stats['saved_output_tokens']:.0f} output tokens")
@@ -0,0 +1,141 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name)
+    return default if value is None or value == '' else value
+
+
+def _flag(name: str, default: bool) -> bool:
+    value = _env(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = _env(name)
+    return None if value is None else int(value)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Every environment setting of the mailer, parsed once."""
+    # Email handling
+    allowed_customers: Tuple[str, ...]
+    gmail_sync_mode: str
+    gmail_sync_state_path: str
+    gmail_token_path: str
+    gmail_credentials_path: str
+    max_body_chars: int
+    max_concurrency: int
+    order_fast_path: bool
+    # Polling and push notifications
+    check_interval: float
+    poll_max_interval: float
+    push_receiver_port: Optional[int]
+    push_receiver_host: str
+    push_token: Optional[str]
+    gmail_pubsub_topic: Optional[str]
+    push_fallback_interval: float
+    # Conversation checkpoints
+    checkpoint_db_path: str
+    max_history_messages: int
+    thread_idle_seconds: int
+    # Model context
+    prompt_caching: bool
+    input_token_budget: int
+    tool_output_max_tokens: int
+    # Work queue
+    work_queue_path: str
+    work_queue_max_attempts: int
+    work_queue_lease_seconds: float
+    # Pricing API
+    pricing_api_url: str
+    price_cache_ttl: float
+    # Response cache for repeated inquiries
+    response_cache_enabled: bool
+    response_cache_path: str
+    response_cache_ttl: float
+    response_cache_max_entries: int
+    # Outbound mail
+    gmail_send_rate: float
+    gmail_send_burst: int
+    gmail_send_max_attempts: int
+    outbox_workers: int
+    # Multi-mailbox mode
+    mailboxes_path: str
+    mailbox_state_dir: str
+    mailbox_workers: int
+    mailbox_quantum: int
+    # Observability
+    metrics_port: Optional[int]
+    metrics_enabled: bool
+    trace_path: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> 'Settings':
+        metrics_port = _optional_int('METRICS_PORT')
+        return cls(
+            allowed_customers=tuple(a.strip() for a in _env('ALLOWED_CUSTOMERS', '').split(',') if a.strip()),
+            gmail_sync_mode=_env('GMAIL_SYNC_MODE', 'incremental'),
+            gmail_sync_state_path=_env('GMAIL_SYNC_STATE_PATH', 'state/gmail_sync.json'),
+            gmail_token_path=_env('GMAIL_TOKEN_PATH', 'credentials/token.json'),
+            gmail_credentials_path=_env('GMAIL_CREDENTIALS_PATH', 'credentials/credentials.json'),
+            max_body_chars=int(_env('MAX_BODY_CHARS', '20000')),
+            max_concurrency=int(_env('MAX_CONCURRENCY', '4')),
+            order_fast_path=_flag('ORDER_FAST_PATH', True),
+            check_interval=float(_env('CHECK_INTERVAL', '5')),
+            poll_max_interval=float(_env('POLL_MAX_INTERVAL', '60')),
+            push_receiver_port=_optional_int('PUSH_RECEIVER_PORT'),
+            push_receiver_host=_env('PUSH_RECEIVER_HOST', '127.0.0.1'),
+            push_token=_env('PUSH_TOKEN'),
+            gmail_pubsub_topic=_env('GMAIL_PUBSUB_TOPIC'),
+            push_fallback_interval=float(_env('PUSH_FALLBACK_INTERVAL', '300')),
+            checkpoint_db_path=_env('CHECKPOINT_DB_PATH', 'state/checkpoints.sqlite'),
+            max_history_messages=int(_env('MAX_HISTORY_MESSAGES', '20')),
+            thread_idle_seconds=int(_env('THREAD_IDLE_SECONDS', str(7 * 24 * 3600))),
+            prompt_caching=_flag('PROMPT_CACHING', True),
+            input_token_budget=int(_env('INPUT_TOKEN_BUDGET', '30000')),
+            tool_output_max_tokens=int(_env('TOOL_OUTPUT_MAX_TOKENS', '2000')),
+            work_queue_path=_env('WORK_QUEUE_PATH', 'state/work_queue.sqlite'),
+            work_queue_max_attempts=int(_env('WORK_QUEUE_MAX_ATTEMPTS', '5')),
+            work_queue_lease_seconds=float(_env('WORK_QUEUE_LEASE_SECONDS', '600')),
+            pricing_api_url=_env('PRICING_API_URL', 'http://localhost:3001'),
+            price_cache_ttl=float(_env('PRICE_CACHE_TTL', '300')),
+            response_cache_enabled=_flag('RESPONSE_CACHE', True),
+            response_cache_path=_env('RESPONSE_CACHE_PATH', 'state/response_cache.sqlite'),
+            response_cache_ttl=float(_env('RESPONSE_CACHE_TTL', str(24 * 3600))),
+            response_cache_max_entries=int(_env('RESPONSE_CACHE_MAX_ENTRIES', '10000')),
+            gmail_send_rate=float(_env('GMAIL_SEND_RATE', '2')),
+            gmail_send_burst=int(_env('GMAIL_SEND_BURST', '10')),
+            gmail_send_max_attempts=int(_env('GMAIL_SEND_MAX_ATTEMPTS', '6')),
+            outbox_workers=int(_env('OUTBOX_WORKERS', '4')),
+            mailboxes_path=_env('MAILBOXES_PATH', 'credentials/mailboxes.json'),
+            mailbox_state_dir=_env('MAILBOX_STATE_DIR', 'state/mailboxes'),
+            mailbox_workers=int(_env('MAILBOX_WORKERS', '2')),
+            mailbox_quantum=int(_env('MAILBOX_QUANTUM', '4')),
+            metrics_port=metrics_port,
+            metrics_enabled=metrics_port is not None or _flag('METRICS_ENABLED', False),
+            trace_path=_env('TRACE_PATH'),
+        )
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Load .env (without overriding the real environment) and parse it, once per process."""
+    global _settings  # pylint: disable=global-statement
+    with _settings_lock:
+        if _settings is None:
+            load_dotenv()
+            _settings = Settings.from_env()
+        return _settings
+
+
+settings = get_settings()
@@ -0,0 +1,176 @@
+import math
+import multiprocessing
+import queue
+import signal
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from services.mailer.mailboxes import Mailbox
+from services.mailer.settings import settings
+
+MAILBOX_WORKERS = settings.mailbox_workers
+# How often the supervisor checks that its workers are still alive
+CHECK_INTERVAL = 1.0
+# A worker that keeps crashing is restarted at most this often
+RESTART_DELAY = 5.0
+
+
+def rebalance(assignment: Dict[str, int], mailboxes: Sequence[str], slots: Sequence[int]) -> Dict[str, int]:
+    """Assign every mailbox to a slot so loads differ by at most one, moving as few as possible.
+
+    Mailboxes stay where they are unless their slot is gone or holds more than its
+    share; the rest go to the least loaded slots.
+    """
+    if not slots:
+        return {}
+    share = math.ceil(len(mailboxes) / len(slots))
+    load = Counter({slot: 0 for slot in slots})
+    kept = {}
+    for name in sorted(mailboxes):
+        slot = assignment.get(name)
+        if slot in load and load[slot] < share:
+            kept[name] = slot
+            load[slot] += 1
+    for name in sorted(mailboxes):
+        if name not in kept:
+            slot = min(slots, key=lambda s: (load[s], s))
+            kept[name] = slot
+            load[slot] += 1
+    # Keeping up to the rounded-up share can leave a fresh slot short by more than one
+    while max(load.values()) - min(load.values()) > 1:
+        busiest = max(slots, key=lambda s: (load[s], -s))
+        idlest = min(slots, key=lambda s: (load[s], s))
+        name = max(name for name, slot in kept.items() if slot == busiest)
+        kept[name] = idlest
+        load[busiest] -= 1
+        load[idlest] += 1
+    return kept
+
+
+@dataclass
+class _Worker:
+    process: Any
+    control: Any
+    started: float
+
+
+class Supervisor:
+    """Shard mailboxes across a pool of worker processes and keep the pool whole.
+
+    ``target(slot, control, *args)`` runs in each worker process and reads its
+    current list of Mailbox objects from the ``control`` queue; None means stop.
+    When a worker dies its mailboxes move to the surviving workers at once, and
+    the slot is restarted and given its share back.
+    """
+
+    def __init__(self, mailboxes: List[Mailbox], target: Callable, workers: int = MAILBOX_WORKERS,
+                 args: Sequence = (), restart: bool = True):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.mailboxes = {mailbox.name: mailbox for mailbox in mailboxes}
+        self.workers = workers
+        self.restart = restart
+        self.restarts = 0
+        self._target = target
+        self._args = tuple(args)
+        # spawn keeps workers free of the supervisor's threads and locks
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: Dict[int, _Worker] = {}
+        self._assignment: Dict[str, int] = {}
+        self._restart_at: Dict[int, float] = {}
+
+    def _spawn(self, slot: int) -> None:
+        control = self._context.Queue()
+        process = self._context.Process(target=self._target, args=(slot, control, *self._args),
+                                        name=f"mailbox-worker-{slot}", daemon=True)
+        process.start()
+        self._workers[slot] = _Worker(process, control, time.monotonic())
+        print(f"[{datetime.now()}] Started mailbox worker {slot} (pid {process.pid})")
+
+    def _publish(self) -> None:
+        self._assignment = rebalance(self._assignment, list(self.mailboxes), sorted(self._workers))
+        for slot, worker in self._workers.items():
+            worker.control.put([self.mailboxes[name] for name in sorted(self._assignment)
+                                if self._assignment[name] == slot])
+
+    def assignment(self) -> Dict[int, List[str]]:
+        """Mailbox names per live worker slot."""
+        shards = {slot: [] for slot in self._workers}
+        for name, slot in sorted(self._assignment.items()):
+            shards[slot].append(name)
+        return shards
+
+    def pids(self) -> Dict[int, Optional[int]]:
+        return {slot: worker.process.pid for slot, worker in self._workers.items()}
+
+    def start(self) -> 'Supervisor':
+        for slot in range(self.workers):
+            self._spawn(slot)
+        self._publish()
+        return self
+
+    def check(self) -> List[int]:
+        """Move mailboxes off dead workers and restart them; returns the slots that died."""
+        now = time.monotonic()
+        dead = [slot for slot, worker in self._workers.items() if not worker.process.is_alive()]
+        for slot in dead:
+            worker = self._workers.pop(slot)
+            print(f"[{datetime.now()}] Mailbox worker {slot} exited with code {worker.process.exitcode}, "
+                  f"moving its mailboxes to {len(self._workers)} other workers")
+            # A worker that dies right after starting is restarted with a delay so a crash loop cannot spin
+            self._restart_at[slot] = now if now - worker.started >= RESTART_DELAY else now + RESTART_DELAY
+        if dead:
+            self._publish()
+
+        due = [slot for slot, at in self._restart_at.items() if self.restart and now >= at]
+        for slot in due:
+            del self._restart_at[slot]
+            self.restarts += 1
+            self._spawn(slot)
+        if due:
+            self._publish()
+        return dead
+
+    def run(self, interval: float = CHECK_INTERVAL) -> None:
+        # Containers stop with SIGTERM; exit through stop() so workers finish their current emails
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.start()
+        print(f"[{datetime.now()}] Serving {len(self.mailboxes)} mailboxes on {self.workers} workers: "
+              f"{self.assignment()}")
+        try:
+            while True:
+                time.sleep(interval)
+                if self.check():
+                    print(f"[{datetime.now()}] Mailbox assignment: {self.assignment()}")
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        for worker in self._workers.values():
+            try:
+                worker.control.put(None)
+            except (OSError, ValueError):
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in self._workers.values():
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers.clear()
+
+
+def latest_assignment(control, current: Optional[List[Mailbox]], timeout: float = 0.0) -> Optional[List[Mailbox]]:
+    """Return the newest mailbox list sent to a worker, current if nothing new arrived, None to stop."""
+    latest = current
+    try:
+        latest = control.get(timeout=timeout) if timeout > 0 else control.get_nowait()
+        while True:
+            if latest is None:
+                return None
+            latest = control.get_nowait()
+    except queue.Empty:
+        return latest
@@ -0,0 +1,165 @@
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from services.mailer import metrics
+from services.mailer.checkpoint import bound_history
+from services.mailer.settings import settings
+
+PROMPT_CACHING = settings.prompt_caching
+# Approximate input tokens per model call; beyond it the oldest tool outputs are dropped
+INPUT_TOKEN_BUDGET = settings.input_token_budget
+# A single tool output is shortened to about this many tokens
+TOOL_OUTPUT_MAX_TOKENS = settings.tool_output_max_tokens
+# Anthropic caches everything up to a block marked with this, for five minutes
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+CHARS_PER_TOKEN = 4
+# Long strings inside a JSON tool output, such as email bodies, are cut to this length first
+MAX_STRING_CHARS = 500
+
+
+def cache_breakpoint(text: str) -> List[Dict]:
+    """A text content block the prompt up to and including it is cached at."""
+    return [{'type': 'text', 'text': text, 'cache_control': CACHE_CONTROL}]
+
+
+def with_cache_breakpoint(tools: Sequence) -> List:
+    """Tools with the last one marked as a cache breakpoint, so the tool definitions are cached."""
+    tools = list(tools)
+    if tools:
+        last = tools[-1]
+        tools[-1] = last.model_copy(update={'extras': {**(last.extras or {}), 'cache_control': CACHE_CONTROL}})
+    return tools
+
+
+def _truncate_strings(value: Any, limit: int) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + f"... [{len(value) - limit} characters omitted]"
+    if isinstance(value, list):
+        return [_truncate_strings(item, limit) for item in value]
+    if isinstance(value, dict):
+        return {key: _truncate_strings(item, limit) for key, item in value.items()}
+    return value
+
+
+def shrink_tool_output(content: str, max_tokens: int = TOOL_OUTPUT_MAX_TOKENS) -> str:
+    """Shorten a tool output to about max_tokens.
+
+    JSON lists, such as read_emails results, keep their first items with long
+    strings cut; anything else keeps its beginning. A note says what was left out.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(content) <= max_chars:
+        return content
+    try:
+        value = json.loads(content)
+    except ValueError:
+        value = None
+    if isinstance(value, (list, dict)):
+        value = _truncate_strings(value, MAX_STRING_CHARS)
+        text = json.dumps(value)
+        if len(text) <= max_chars:
+            return text
+        if isinstance(value, list):
+            kept = []
+            for item in value:
+                if len(json.dumps(kept + [item])) > max_chars:
+                    break
+                kept.append(item)
+            return json.dumps(kept) + f"\n[{len(value) - len(kept)} more items omitted to stay within the token budget]"
+        content = text
+    return content[:max_chars] + f"\n[{len(content) - max_chars} characters omitted to stay within the token budget]"
+
+
+def _replace_content(message: ToolMessage, content: str) -> ToolMessage:
+    metrics.CONTEXT_TRIMMED_TOKENS.inc((len(message.content) - len(content)) // CHARS_PER_TOKEN)
+    return message.model_copy(update={'content': content})
+
+
+def fit_token_budget(messages: Sequence[BaseMessage], max_input_tokens: int = INPUT_TOKEN_BUDGET,
+                     max_tool_tokens: int = TOOL_OUTPUT_MAX_TOKENS) -> List[BaseMessage]:
+    """Copy of messages whose tool outputs fit the per-output and per-call token budgets.
+
+    Every tool output is shortened to max_tool_tokens. If the whole prompt is still
+    above max_input_tokens, the oldest tool outputs are replaced by a short note
+    until it fits. Messages are never removed, so every tool call keeps its result.
+    """
+    fitted = list(messages)
+    for i, message in enumerate(fitted):
+        if isinstance(message, ToolMessage) and isinstance(message.content, str):
+            shrunk = shrink_tool_output(message.content, max_tool_tokens)
+            if shrunk != message.content:
+                fitted[i] = _replace_content(message, shrunk)
+
+    total = count_tokens_approximately(fitted)
+    for i, message in enumerate(fitted):
+        if total <= max_input_tokens:
+            break
+        if isinstance(message, ToolMessage) and isinstance(message.content, str):
+            note = f"[Output of {message.name or 'the tool'} omitted to stay within the token budget]"
+            if len(note) < len(message.content):
+                fitted[i] = _replace_content(message, note)
+                total = count_tokens_approximately(fitted)
+    return fitted
+
+
+def _mark_last_message(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Put a cache breakpoint on the last message, so the next call of the run reads the conversation from cache.
+
+    A tool output only takes a breakpoint as a list of content blocks, so every tool
+    output is sent as one; otherwise the one marked in this call would look
+    different in the next and the cached prefix would no longer match.
+    """
+    marked = [message.model_copy(update={'content': [{'type': 'text', 'text': message.content}]})
+              if isinstance(message, ToolMessage) and isinstance(message.content, str) and message.content
+              else message for message in messages]
+    if not marked:
+        return marked
+    last = marked[-1]
+    content = last.content
+    if isinstance(content, str) and content:
+        content = cache_breakpoint(content)
+    elif content and isinstance(content, list) and isinstance(content[-1], dict) and content[-1].get('type') == 'text':
+        content = [*content[:-1], {**content[-1], 'cache_control': CACHE_CONTROL}]
+    else:
+        return marked
+    return [*marked[:-1], last.model_copy(update={'content': content})]
+
+
+def budget_history(state: Dict) -> Dict:
+    """pre_model_hook: bound_history, then fit the model input into the token budget.
+
+    Tool outputs are only shortened in what the model sees; the conversation keeps
+    them whole. With PROMPT_CACHING the last message is marked as a cache breakpoint.
+    """
+    update = bound_history(state)
+    model_input = fit_token_budget(update['llm_input_messages'])
+    if PROMPT_CACHING:
+        model_input = _mark_last_message(model_input)
+    return {**update, 'llm_input_messages': model_input}
+
+
+def cache_tokens(usage_metadata: Dict) -> Tuple[int, int]:
+    """Input tokens (read from cache, written to cache) of one model call."""
+    details = usage_metadata.get('input_token_details') or {}
+    written = sum(details.get(key) or 0 for key in
+                  ('cache_creation', 'ephemeral_5m_input_tokens', 'ephemeral_1h_input_tokens'))
+    return details.get('cache_read') or 0, written
+
+
+def prompt_token_usage(messages: Sequence[BaseMessage]) -> Dict[str, int]:
+    """Input tokens of the model calls since the latest user message: total, read from and written to cache."""
+    usage = {'input': 0, 'cache_read': 0, 'cache_creation': 0}
+    for message in reversed(messages):
+        if message.type == 'human':
+            break
+        metadata = getattr(message, 'usage_metadata', None) or {}
+        read, written = cache_tokens(metadata)
+        usage['input'] += metadata.get('input_tokens', 0)
+        usage['cache_read'] += read
+        usage['cache_creation'] += written
+    usage['uncached'] = usage['input'] - usage['cache_read'] - usage['cache_creation']
+    return usage
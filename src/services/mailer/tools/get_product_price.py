@@ -1,26 +1,40 @@
-from langchain_core.tools import tool
-from dotenv import load_dotenv
-import requests
-load_dotenv()
+from typing import Dict, List, Optional
+from langchain_core.tools import StructuredTool, tool
+import httpx
+from services.mailer.utils.pricing_client import pricing_client
 
 
-@tool
-def get_product_price(product_id: str) -> float:
-    """Get the price of a product from the product database."""
+def _get_product_price(product_id: str) -> Optional[float]:
+    """Get the price of a product from the product database. Returns null for unknown products."""
+    return pricing_client.get_price(product_id)
+
+
+async def _aget_product_price(product_id: str) -> Optional[float]:
+    return await pricing_client.aget_price(product_id)
+
+
+def _get_product_prices(product_ids: List[str]) -> Dict[str, Optional[float]]:
+    """Get the prices of several products in one call. Use this for orders with more than one item.
+    Unknown products map to null."""
+    return pricing_client.get_prices(product_ids)
+
 
-    # call fake pricing api
-    response = requests.get(f"http://localhost:3001/price/{product_id}")
-    return response.json()['price']
+async def _aget_product_prices(product_ids: List[str]) -> Dict[str, Optional[float]]:
+    return await pricing_client.aget_prices(product_ids)
+
+
+# The price tools also run natively async, so an async agent run (ainvoke) prices
+# the items of parallel tool calls concurrently instead of on executor threads
+get_product_price = StructuredTool.from_function(
+    _get_product_price, name='get_product_price', coroutine=_aget_product_price)
+get_product_prices = StructuredTool.from_function(
+    _get_product_prices, name='get_product_prices', coroutine=_aget_product_prices)
 
 
 @tool
 def get_api_info() -> dict:
     """Get information about available APIs and their endpoints from the fake pricing API."""
     try:
-        response = requests.get("http://localhost:3001/api-info")
-        return response.json()
-    except requests.RequestException as e:
+        return pricing_client.get_api_info()
+    except httpx.HTTPError as e:
         return {"error": f"Failed to fetch API info: {str(e)}"}
-
-
-
@@ -1,62 +1,256 @@
-import os
 from datetime import datetime
-from typing import Dict, List
-from dotenv import load_dotenv
-from langchain_core.tools import tool
+from email.utils import parseaddr
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from googleapiclient.errors import HttpError
+from services.mailer.mailboxes import current_mailbox
+from services.mailer.metrics import span
+from services.mailer.settings import settings
 from services.mailer.utils.get_gmail_service import get_gmail_service
-load_dotenv()
+from services.mailer.utils.mime_body import extract_body, get_header
+from services.mailer.utils.sync_state import load_history_id, save_history_id
+
+
+def normalize_address(address: str) -> str:
+    """Extract the bare address from "Name <email>" and case-fold it for comparison."""
+    return parseaddr(address)[1].strip().casefold()
 
 
 # Allowed customers configuration
-ALLOWED_CUSTOMERS = os.getenv('ALLOWED_CUSTOMERS').split(',')
+ALLOWED_CUSTOMERS = frozenset(filter(None, (normalize_address(address) for address in settings.allowed_customers)))
+
+
+def allowed_customers() -> FrozenSet[str]:
+    """Normalized allowlist of the current mailbox, ALLOWED_CUSTOMERS without one."""
+    mailbox = current_mailbox()
+    if mailbox is None:
+        return ALLOWED_CUSTOMERS
+    return frozenset(filter(None, (normalize_address(address) for address in mailbox.allowed_customers)))
+
+
+# Gmail accepts up to 100 calls per batch but recommends staying at or below 50
+BATCH_SIZE = 50
+# messages.batchModify accepts at most 1000 ids per call
+MODIFY_CHUNK_SIZE = 1000
+# Only the headers we actually read are requested
+METADATA_HEADERS = ['Subject', 'From']
+
+# Incremental sync only asks Gmail for changes since the last stored historyId
+INCREMENTAL_SYNC = settings.gmail_sync_mode == 'incremental'
+SYNC_STATE_PATH = settings.gmail_sync_state_path
+
+
+def _chunks(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def list_unread_message_ids(service) -> List[str]:
+    """List ids of all unread inbox messages, following pagination."""
+    messages_api = service.users().messages()
+    message_ids = []
+    request = messages_api.list(userId='me', labelIds=['INBOX', 'UNREAD'])
+    while request is not None:
+        results = request.execute()
+        message_ids.extend(m['id'] for m in results.get('messages', []))
+        request = messages_api.list_next(request, results)
+    return message_ids
+
+
+def list_new_message_ids(service, start_history_id: str) -> Tuple[List[str], str]:
+    """List ids of unread inbox messages added since start_history_id.
+
+    Raises HttpError with status 404 when the history id is too old to sync from.
+    """
+    history_api = service.users().history()
+    message_ids = []
+    seen = set()
+    history_id = start_history_id
+    request = history_api.list(
+        userId='me',
+        startHistoryId=start_history_id,
+        historyTypes=['messageAdded'],
+        labelId='INBOX'
+    )
+    while request is not None:
+        results = request.execute()
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added['message']
+                if 'UNREAD' in message.get('labelIds', []) and message['id'] not in seen:
+                    seen.add(message['id'])
+                    message_ids.append(message['id'])
+        history_id = results.get('historyId', history_id)
+        request = history_api.list_next(request, results)
+    return message_ids, history_id
+
+
+def sync_message_ids(service, state_path: str) -> Tuple[List[str], str]:
+    """Return new unread message ids and the historyId to store once they are handled.
+
+    Falls back to a full listing when there is no stored historyId or it has expired.
+    """
+    start_history_id = load_history_id(state_path)
+    if start_history_id is not None:
+        try:
+            return list_new_message_ids(service, start_history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print(f"[{datetime.now()}] History id {start_history_id} expired, running full resync")
+
+    # Read the profile first so nothing arriving during the listing is skipped next time
+    history_id = service.users().getProfile(userId='me').execute()['historyId']
+    return list_unread_message_ids(service), history_id
+
+
+def _batch_get(service, message_ids: List[str], **params) -> Tuple[Dict[str, Dict], List[str]]:
+    """Fetch messages with batch requests, BATCH_SIZE calls per round-trip.
+
+    Returns the fetched messages and the ids whose fetch failed for any reason
+    other than the message being gone (404), e.g. a per-item 429.
+    """
+    messages = {}
+    failed = []
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            print(f"[{datetime.now()}] Error fetching message {request_id}: {str(exception)}")
+            if not (isinstance(exception, HttpError) and exception.resp.status == 404):
+                failed.append(request_id)
+            return
+        messages[request_id] = response
+
+    for chunk in _chunks(message_ids, BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in chunk:
+            batch.add(service.users().messages().get(userId='me', id=message_id, **params), request_id=message_id)
+        batch.execute()
+    return messages, failed
 
-# Tools for the agent
-@tool
-def read_emails() -> List[Dict]:
+
+def fetch_message_metadata(service, message_ids: List[str]) -> Tuple[Dict[str, Dict], List[str]]:
+    """Fetch Subject/From headers and snippet for messages using batch requests.
+
+    Also returns the ids that could not be fetched and should be tried again.
+    """
+    return _batch_get(service, message_ids, format='metadata', metadataHeaders=METADATA_HEADERS)
+
+
+def fetch_message_bodies(service, message_ids: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """Fetch full messages and reduce each to the text the customer just wrote.
+
+    Also returns the ids that could not be fetched and should be tried again.
+    """
+    messages, failed = _batch_get(service, message_ids, format='full')
+    bodies = {}
+    for message_id, message in messages.items():
+        body = extract_body(message.get('payload', {}))
+        bodies[message_id] = body if body is not None else message.get('snippet', '')
+    return bodies, failed
+
+
+def mark_as_read(service, message_ids: List[str]) -> None:
+    """Remove the UNREAD label from messages with as few calls as possible."""
+    for chunk in _chunks(message_ids, MODIFY_CHUNK_SIZE):
+        service.users().messages().batchModify(
+            userId='me',
+            body={'ids': chunk, 'removeLabelIds': ['UNREAD']}
+        ).execute()
+
+
+def fetch_unread_emails(service, incremental: bool = INCREMENTAL_SYNC, state_path: Optional[str] = None,
+                        persist: Optional[Callable[[List[Dict]], Any]] = None) -> List[Dict]:
+    """Fetch unread emails from allowed customers and mark them as read.
+
+    If given, persist is called with the accepted emails before they are marked read,
+    so a crash can never lose a message that Gmail no longer reports as unread.
+    """
+    with span('gmail_fetch'):
+        return _fetch_unread_emails(service, incremental, state_path, persist)
+
+
+def _fetch_unread_emails(service, incremental: bool, state_path: Optional[str],
+                         persist: Optional[Callable[[List[Dict]], Any]]) -> List[Dict]:
+    mailbox = current_mailbox()
+    state_path = state_path or (SYNC_STATE_PATH if mailbox is None else mailbox.sync_state_path)
+    allowed = allowed_customers()
+    history_id = None
+    if incremental:
+        message_ids, history_id = sync_message_ids(service, state_path)
+    else:
+        message_ids = list_unread_message_ids(service)
+    print(f"[{datetime.now()}] Found {len(message_ids)} unread messages")
+    if not message_ids:
+        if history_id is not None:
+            save_history_id(state_path, history_id)
+        return []
+
+    # Headers decide who we answer; full bodies are only downloaded for those emails
+    metadata, failed = fetch_message_metadata(service, message_ids)
+    emails = []
+    for message_id in message_ids:
+        msg = metadata.get(message_id)
+        # History can report messages that were already handled by an earlier full sync
+        if msg is None or 'UNREAD' not in msg.get('labelIds', []):
+            continue
+        headers = msg.get('payload', {}).get('headers', [])
+        sender = get_header(headers, 'From')
+
+        # Extract email address from sender (handles "Name <email@example.com>" format)
+        sender_email = normalize_address(sender)
+
+        # Check if sender is in allowed list
+        if sender_email not in allowed:
+            print(f"[{datetime.now()}] Skipping email from unauthorized sender: {sender_email or sender!r}")
+            continue
+
+        emails.append({
+            'id': message_id,
+            'subject': get_header(headers, 'Subject', '(no subject)'),
+            'from': sender,
+            'sender_email': sender_email,
+            'body': msg.get('snippet', ''),
+        })
+        print(f"[{datetime.now()}] Processed email from allowed sender: {sender_email}")
+
+    if emails:
+        bodies, failed_bodies = fetch_message_bodies(service, [email['id'] for email in emails])
+        # Emails without their body stay unread and are fetched again on the next poll
+        failed = failed + failed_bodies
+        emails = [email for email in emails if email['id'] not in failed_bodies]
+        for email in emails:
+            email['body'] = bodies.get(email['id'], email['body'])
+
+        # Mark all accepted messages as read in one round-trip
+        if persist is not None and emails:
+            persist(emails)
+        mark_as_read(service, [email['id'] for email in emails])
+    if failed and history_id is not None:
+        # Advancing the historyId would hide these from every later poll; the next
+        # sync reports them again, and the ones handled now are no longer UNREAD
+        print(f"[{datetime.now()}] Could not fetch {len(failed)} messages, keeping historyId to retry them")
+        history_id = None
+    if history_id is not None:
+        save_history_id(state_path, history_id)
+    return emails
+
+
+def _read_emails() -> List[Dict]:
     """Read unread emails from Gmail inbox."""
     try:
         print(f"[{datetime.now()}] Attempting to read emails...")
         service = get_gmail_service()
-        results = service.users().messages().list(userId='me', labelIds=['INBOX', 'UNREAD']).execute()
-        messages = results.get('messages', [])
-        
-        print(f"[{datetime.now()}] Found {len(messages)} unread messages")
-        emails = []
-        for message in messages:
-            try:
-                msg = service.users().messages().get(userId='me', id=message['id']).execute()
-                headers = msg['payload']['headers']
-                subject = next(h['value'] for h in headers if h['name'] == 'Subject')
-                sender = next(h['value'] for h in headers if h['name'] == 'From')
-                
-                # Extract email address from sender (handles "Name <email@example.com>" format)
-                sender_email = sender.split('<')[-1].split('>')[0] if '<' in sender else sender
-                
-                # Check if sender is in allowed list
-                if sender_email not in ALLOWED_CUSTOMERS:
-                    print(f"[{datetime.now()}] Skipping email from unauthorized sender: {sender_email}")
-                    continue
-                
-                # Mark as read
-                service.users().messages().modify(
-                    userId='me', 
-                    id=message['id'],
-                    body={'removeLabelIds': ['UNREAD']}
-                ).execute()
-                
-                emails.append({
-                    'id': message['id'],
-                    'subject': subject,
-                    'from': sender,
-                    'sender_email': sender_email,
-                    'snippet': msg['snippet']
-                })
-                print(f"[{datetime.now()}] Processed email from allowed sender: {sender_email}")
-            except Exception as e:
-                print(f"[{datetime.now()}] Error processing individual email: {str(e)}")
-                continue
-        
-        return emails
+        return fetch_unread_emails(service)
     except Exception as e:
         print(f"[{datetime.now()}] Error in read_emails: {str(e)}")
         raise
+
+
+def __getattr__(name: str) -> Any:
+    # The polling loop only needs fetch_unread_emails, so the agent tool (and
+    # langchain with it) is only built when something asks for read_emails
+    if name == 'read_emails':
+        from langchain_core.tools import tool  # pylint: disable=import-outside-toplevel
+        read_emails = globals()['read_emails'] = tool('read_emails')(_read_emails)
+        return read_emails
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
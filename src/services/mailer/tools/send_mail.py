@@ -1,4 +1,3 @@
-import os
 import base64
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -6,50 +5,85 @@ from email.mime.application import MIMEApplication
 from langchain_core.tools import tool
 from datetime import datetime
 from typing import Dict, Optional
-from dotenv import load_dotenv
 from services.mailer.utils.invoice.generate_invoice import generate_invoice, OrderDetails, OrderItem
-from services.mailer.utils.get_gmail_service import get_gmail_service
-load_dotenv()
+from services.mailer.metrics import INVOICES
+from services.mailer.outbox import delivery_key, get_outbox
+from services.mailer.work_queue import get_work_queue
 
 
 @tool
-def send_email(to: str, subject: str, body: str, attach_invoice: Optional[bool] = False, order_details: Optional[Dict] = None) -> str:
-    """Send an email with optional invoice attachment."""
-    service = get_gmail_service()
-    
-    message = MIMEMultipart()
-    message['to'] = to
-    message['subject'] = subject
-    
-    msg = MIMEText(body, 'plain')
-    message.attach(msg)
-    
-    print(f"[{datetime.now()}] Attaching invoice: {attach_invoice}")
-    print(f"[{datetime.now()}] Order details: {order_details}")
-    if attach_invoice and order_details:
-        # Generate invoice PDF
-        print(f"[{datetime.now()}] Generating invoice")
-        try:
-            # Convert items to OrderItem instances
-            items = [OrderItem(**item) for item in order_details.get('items', [])]
-            # Create OrderDetails instance
-            order_model = OrderDetails(
-                customer_name=order_details.get('customer_name'),
-                items=items
-            )
-            invoice_path = generate_invoice(order_model)
-            print(f"[{datetime.now()}] Invoice path: {invoice_path}")
-            with open(invoice_path, 'rb') as f:
-                invoice = MIMEApplication(f.read(), _subtype='pdf')
+def send_email(to: str, subject: str, body: str, attach_invoice: Optional[bool] = False, order_details: Optional[Dict] = None,
+               reply_to_message_id: Optional[str] = None) -> str:
+    """Send an email with optional invoice attachment. Delivery happens in the background and is retried if Gmail throttles.
+    Pass the id of the customer email being answered as reply_to_message_id so an order is never invoiced twice.
+    A reply that already went out in an earlier attempt at the same customer email is not sent again."""
+    # Resolved here, in the mailbox being served; on_delivered runs on an outbox thread
+    work_queue = get_work_queue()
+    # A retried customer email is handled again from the start; skip the replies its earlier attempt delivered
+    reply_key = delivery_key(to, subject, body, bool(attach_invoice and order_details))
+    if reply_key is not None and not work_queue.claim_idempotency_key(reply_key):
+        print(f"[{datetime.now()}] Reply {reply_key} to {to} was already sent, skipping")
+        return "This reply was already sent; not sending it again"
+
+    # Reserve the invoice for this customer email before sending so retries cannot duplicate it
+    invoice_key = None
+    if attach_invoice and order_details and reply_to_message_id:
+        invoice_key = f"invoice:{reply_to_message_id}"
+        if not work_queue.claim_idempotency_key(invoice_key):
+            if reply_key is not None:
+                work_queue.release_idempotency_key(reply_key)
+            print(f"[{datetime.now()}] Invoice for email {reply_to_message_id} was already sent, skipping")
+            return "An invoice for this email was already sent; not sending it again"
+
+    invoice_attached = False
+
+    def build_message() -> Dict:
+        nonlocal invoice_attached
+        message = MIMEMultipart()
+        message['to'] = to
+        message['subject'] = subject
+
+        msg = MIMEText(body, 'plain')
+        message.attach(msg)
+
+        print(f"[{datetime.now()}] Attaching invoice: {attach_invoice}")
+        print(f"[{datetime.now()}] Order details: {order_details}")
+        if attach_invoice and order_details:
+            # Generate invoice PDF
+            print(f"[{datetime.now()}] Generating invoice")
+            try:
+                # Convert items to OrderItem instances
+                items = [OrderItem(**item) for item in order_details.get('items', [])]
+                # Create OrderDetails instance
+                order_model = OrderDetails(
+                    customer_name=order_details.get('customer_name'),
+                    items=items
+                )
+                invoice_pdf = generate_invoice(order_model)
+                invoice = MIMEApplication(invoice_pdf, _subtype='pdf')
                 invoice.add_header('Content-Disposition', 'attachment', filename='invoice.pdf')
                 message.attach(invoice)
-                print(f"[{datetime.now()}] Invoice attached to email")
-            os.remove(invoice_path)  # Clean up
-        except Exception as e:
-            print(f"[{datetime.now()}] Error generating invoice: {str(e)}")
-    
-    raw = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-    service.users().messages().send(userId='me', body={'raw': raw}).execute()
-    return "Email sent successfully"
+                invoice_attached = True
+                print(f"[{datetime.now()}] Invoice attached to email ({len(invoice_pdf)} bytes)")
+            except Exception as e:
+                print(f"[{datetime.now()}] Error generating invoice: {str(e)}")
+
+        return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')}
 
+    def on_delivered(sent: Optional[Dict]) -> None:
+        # Give the reservations back unless the reply, and the invoice with it, actually went out;
+        # this runs before the delivery resolves, so a retry of the email never sees a stale reservation
+        delivered = sent is not None
+        if reply_key is not None and not delivered:
+            work_queue.release_idempotency_key(reply_key)
+        if invoice_key is not None and not (delivered and invoice_attached):
+            work_queue.release_idempotency_key(invoice_key)
+        if delivered and invoice_attached:
+            INVOICES.inc()
 
+    # Rendering and sending happen on the outbox so the agent can carry on meanwhile;
+    # the email handler waits for delivery before marking the customer email done.
+    get_outbox().submit(build_message, description=f"reply to {to}", on_done=on_delivered)
+    if invoice_key is not None:
+        return "Email with invoice queued for delivery"
+    return "Email queued for delivery"
@@ -1,44 +1,166 @@
 import os
-from googleapiclient.discovery import build, Resource
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, TYPE_CHECKING
+
+from services.mailer.mailboxes import current_mailbox
+from services.mailer.settings import settings
+
+# The Google client libraries take a noticeable share of cold start, so they are
+# imported on the first get_gmail_service call rather than with this module.
+# pylint: disable=import-outside-toplevel
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+    from google.oauth2.credentials import Credentials
 
 # Gmail API setup
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+TOKEN_PATH = settings.gmail_token_path
+CREDENTIALS_PATH = settings.gmail_credentials_path
+DISCOVERY_URL = 'https://gmail.googleapis.com/$discovery/rest?version=v1'
+
+# Refresh access tokens this long before they expire so no request races the expiry
+REFRESH_MARGIN = timedelta(minutes=5)
+HTTP_TIMEOUT = 30
+
+# Credentials (one per token file, i.e. per mailbox) and the discovery document are
+# shared process-wide behind _lock. httplib2.Http is not thread-safe, so each thread
+# keeps its own Resource per token file whose keep-alive connections are reused.
+_lock = threading.Lock()
+_credentials: Dict[str, 'Credentials'] = {}
+_discovery_document: Optional[str] = None
+_local = threading.local()
+# Set by use_gmail_service to route callers to a stand-in client; the None key applies to every mailbox
+_overrides: Dict[Optional[str], 'Resource'] = {}
+
+
+def _setup_instructions() -> FileNotFoundError:
+    return FileNotFoundError(
+        "\n1. Go to https://console.cloud.google.com"
+        "\n2. Create Project (or select existing)"
+        "\n3. Enable Gmail API"
+        "\n4. Create Credentials > OAuth Client ID > Desktop App"
+        "\n5. Download JSON and save as 'credentials.json' in this folder"
+    )
+
+
+def _token_path() -> str:
+    mailbox = current_mailbox()
+    return TOKEN_PATH if mailbox is None else mailbox.token_path
+
+
+def _save_token(creds: 'Credentials', token_path: str) -> None:
+    directory = os.path.dirname(token_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(token_path, 'w', encoding='utf-8') as token:
+        token.write(creds.to_json())
+
+
+def _run_oauth_flow(token_path: str) -> 'Credentials':
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    # Check for client secrets file
+    if not os.path.exists(CREDENTIALS_PATH):
+        raise _setup_instructions()
+
+    flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
+    creds = flow.run_local_server(port=0)
+    # Save token for next time
+    _save_token(creds, token_path)
+    return creds
+
+
+def _needs_refresh(creds: 'Credentials') -> bool:
+    if not creds.valid:
+        return True
+    # google-auth stores expiry as a naive UTC datetime
+    return creds.expiry is not None and creds.expiry - REFRESH_MARGIN <= datetime.utcnow()
+
+
+def _refresh_or_reauthorize(creds: Optional['Credentials'], token_path: str) -> 'Credentials':
+    from google.auth.exceptions import RefreshError
+    from google.auth.transport.requests import Request
+
+    if creds is not None and creds.refresh_token:
+        try:
+            creds.refresh(Request())
+            _save_token(creds, token_path)
+            return creds
+        except RefreshError as e:
+            print(f"\nToken refresh failed for {token_path}, starting OAuth flow: {str(e)}")
+    return _run_oauth_flow(token_path)
+
+
+def _get_credentials(token_path: str) -> 'Credentials':
+    from google.oauth2.credentials import Credentials
+
+    with _lock:
+        creds = _credentials.get(token_path)
+        if creds is None and os.path.exists(token_path):
+            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+        if creds is None or _needs_refresh(creds):
+            creds = _refresh_or_reauthorize(creds, token_path)
+        _credentials[token_path] = creds
+        return creds
+
+
+def _get_discovery_document() -> str:
+    global _discovery_document  # pylint: disable=global-statement
+    import httplib2
+    from googleapiclient.discovery_cache import get_static_doc
+
+    with _lock:
+        if _discovery_document is None:
+            document = get_static_doc('gmail', 'v1')
+            if document is None:
+                _, content = httplib2.Http(timeout=HTTP_TIMEOUT).request(DISCOVERY_URL)
+                document = content.decode('utf-8')
+            _discovery_document = document
+        return _discovery_document
+
+
+def use_gmail_service(service: Optional['Resource'], mailbox: Optional[str] = None) -> None:
+    """Make get_gmail_service return this client (e.g. a local fake); None restores OAuth.
+
+    With a mailbox name the client is only used while serving that mailbox.
+    """
+    if service is None:
+        _overrides.pop(mailbox, None)
+    else:
+        _overrides[mailbox] = service
+
+
+def reset_gmail_service() -> None:
+    """Drop cached credentials and clients, e.g. after rotating token.json."""
+    with _lock:
+        _credentials.clear()
+    _local.__dict__.clear()
+
 
 # Type ignore for Gmail API dynamic methods
 # pylint: disable=no-member
-def get_gmail_service() -> Resource:
-    """Get Gmail service using simple OAuth."""
+def get_gmail_service() -> 'Resource':
+    """Get a cached Gmail service for the current mailbox, refreshing the OAuth token ahead of expiry."""
+    mailbox = current_mailbox()
+    override = _overrides.get(mailbox.name if mailbox else None, _overrides.get(None))
+    if override is not None:
+        return override
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+
     try:
-        token_path = 'credentials/token.json'
-        creds_path = 'credentials/credentials.json'
-        # Look for existing token
-        if os.path.exists(token_path):
-            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-            if not creds.expired:
-                return build('gmail', 'v1', credentials=creds)
-            
-        # Check for client secrets file
-        if not os.path.exists(creds_path):
-            raise FileNotFoundError(
-                "\n1. Go to https://console.cloud.google.com"
-                "\n2. Create Project (or select existing)"
-                "\n3. Enable Gmail API"
-                "\n4. Create Credentials > OAuth Client ID > Desktop App"
-                "\n5. Download JSON and save as 'credentials.json' in this folder"
-            )
-        
-        # Start OAuth flow
-        flow = InstalledAppFlow.from_client_secrets_file(creds_path, SCOPES)
-        creds = flow.run_local_server(port=0)
-       
-        # Save token for next time
-        with open(token_path, 'w') as token:
-            token.write(creds.to_json())
-            
-        return build('gmail', 'v1', credentials=creds)
-        
+        token_path = _token_path()
+        creds = _get_credentials(token_path)
+        services = _local.__dict__.setdefault('services', {})
+        cached_creds, service = services.get(token_path, (None, None))
+        if service is None or cached_creds is not creds:
+            http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            service = build_from_document(_get_discovery_document(), http=http)
+            services[token_path] = (creds, service)
+        return service
+
     except Exception as e:
         print(f"\nError: {str(e)}")
         if isinstance(e, FileNotFoundError):
@@ -1,9 +1,20 @@
 from datetime import datetime
-from typing import  List
+from decimal import Decimal
+from io import BytesIO
+from typing import  List, TYPE_CHECKING
 from pydantic import BaseModel
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+if TYPE_CHECKING:
+    from reportlab.pdfgen import canvas
+
+# Layout (points). Item rows run from ITEMS_TOP down to BOTTOM_MARGIN on every page.
+COLUMNS = (50, 300, 400, 500)
+LINE_HEIGHT = 20
+TABLE_HEADER_Y = 600
+ITEMS_TOP = TABLE_HEADER_Y - LINE_HEIGHT
+BOTTOM_MARGIN = 72
+LAYOUT_FORM = "invoice_layout"
+CENTS = Decimal("0.01")
 
 class OrderItem(BaseModel):
     description: str
@@ -14,52 +25,84 @@ class OrderDetails(BaseModel):
     customer_name: str
     items: List[OrderItem]
 
-def create_invoice_pdf(order_details: OrderDetails) -> str:
+def _define_layout(c: 'canvas.Canvas', order_details: OrderDetails, now: datetime) -> None:
+    """Record the static page header once as a form XObject that every page reuses."""
+    c.beginForm(LAYOUT_FORM)
+    # Add company header
+    c.setFont("Helvetica-Bold", 24)
+    c.drawString(50, 750, "Your Company Name")
+
+    # Add invoice details
+    c.setFont("Helvetica", 12)
+    c.drawString(50, 700, f"Invoice Date: {now.strftime('%Y-%m-%d')}")
+    c.drawString(50, 680, f"Invoice #: INV-{now.strftime('%Y%m%d%H%M')}")
+    c.drawString(50, 660, f"Customer: {order_details.customer_name}")
+
+    # Add table header
+    for x, title in zip(COLUMNS, ("Item Description", "Quantity", "Price", "Total")):
+        c.drawString(x, TABLE_HEADER_Y, title)
+    c.endForm()
+
+def _start_page(c: 'canvas.Canvas', page_number: int) -> float:
+    c.doForm(LAYOUT_FORM)
+    c.setFont("Helvetica", 12)
+    if page_number > 1:
+        c.drawString(COLUMNS[3], 750, f"Page {page_number}")
+    return ITEMS_TOP
+
+def create_invoice_pdf(order_details: OrderDetails) -> bytes:
+    """Internal function to handle PDF generation logic. Renders in memory and returns the PDF bytes.
+
+    Line items flow across as many pages as needed and the total is accumulated in
+    the same pass with exact decimal arithmetic.
+    """
+    # reportlab is only loaded once the first invoice is rendered
+    from reportlab.pdfgen import canvas  # pylint: disable=import-outside-toplevel,redefined-outer-name
+    from reportlab.lib.pagesizes import letter  # pylint: disable=import-outside-toplevel
+
     try:
-        """Internal function to handle PDF generation logic."""
-        filename = f"invoice_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        print(f"[{datetime.now()}] Creating invoice PDF: {filename}")
-        c = canvas.Canvas(filename, pagesize=letter)
-        # Add company header
-        c.setFont("Helvetica-Bold", 24)
-        c.drawString(50, 750, "Your Company Name")
-        
-        # Add invoice details
-        c.setFont("Helvetica", 12)
-        c.drawString(50, 700, f"Invoice Date: {datetime.now().strftime('%Y-%m-%d')}")
-        c.drawString(50, 680, f"Invoice #: INV-{datetime.now().strftime('%Y%m%d%H%M')}")
-        c.drawString(50, 660, f"Customer: {order_details.customer_name}")
-        
-        # Add order items
-        y = 600
-        total = 0
-        c.drawString(50, y, "Item Description")
-        c.drawString(300, y, "Quantity")
-        c.drawString(400, y, "Price")
-        c.drawString(500, y, "Total")
-        
-        y -= 20
-        print(f"[{datetime.now()}] Drawing items")
+        print(f"[{datetime.now()}] Creating invoice PDF for {order_details.customer_name}")
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=letter)
+        _define_layout(c, order_details, datetime.now())
+
+        page_number = 1
+        y = _start_page(c, page_number)
+        total = Decimal(0)
+        print(f"[{datetime.now()}] Drawing {len(order_details.items)} items")
         for item in order_details.items:
-            c.drawString(50, y, item.description)
-            c.drawString(300, y, str(item.quantity))
-            c.drawString(400, y, f"${item.price:.2f}")
-            item_total = item.quantity * item.price
-            c.drawString(500, y, f"${item_total:.2f}")
+            if y < BOTTOM_MARGIN:
+                c.showPage()
+                page_number += 1
+                y = _start_page(c, page_number)
+            price = Decimal(str(item.price))
+            item_total = (price * item.quantity).quantize(CENTS)
+            c.drawString(COLUMNS[0], y, item.description)
+            c.drawString(COLUMNS[1], y, str(item.quantity))
+            c.drawString(COLUMNS[2], y, f"${price:.2f}")
+            c.drawString(COLUMNS[3], y, f"${item_total:.2f}")
             total += item_total
-            y -= 20
-        
-        # Add total
-            c.drawString(400, y-20, "Total:")
-            c.drawString(500, y-20, f"${total:.2f}")
-            
-            c.save()
-            return filename
+            y -= LINE_HEIGHT
+
+        # Add total, on a fresh page if the last one is full
+        if y - LINE_HEIGHT < BOTTOM_MARGIN:
+            c.showPage()
+            page_number += 1
+            y = _start_page(c, page_number) + LINE_HEIGHT
+        c.drawString(COLUMNS[2], y - LINE_HEIGHT, "Total:")
+        c.drawString(COLUMNS[3], y - LINE_HEIGHT, f"${total:.2f}")
+
+        c.save()
+        return buffer.getvalue()
     except Exception as e:
         print(f"[{datetime.now()}] Error generating invoice: {e}")
         raise e
 
-def generate_invoice(order_details: OrderDetails) -> str:
-    """Generate an invoice PDF for the order."""
-    print(f"[{datetime.now()}] Generating invoice {order_details}")
-    return create_invoice_pdf(order_details)
+def generate_invoice(order_details: OrderDetails) -> bytes:
+    """Generate an invoice PDF for the order and return its bytes."""
+    # Imported here so the standalone invoice CLI does not need the services package
+    from services.mailer.metrics import span  # pylint: disable=import-outside-toplevel
+    print(f"[{datetime.now()}] Generating invoice for {order_details.customer_name} "
+          f"({len(order_details.items)} items)")
+    with span('invoice_render'):
+        return create_invoice_pdf(order_details)
@@ -1,19 +1,112 @@
 import argparse
 import json
+import os
+import statistics
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
 from generate_invoice import OrderDetails, create_invoice_pdf
 
+
+def write_invoice(order_data: OrderDetails) -> str:
+    """Render the invoice and save it in the current directory."""
+    filename = f"invoice_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    with open(filename, 'wb') as f:
+        f.write(create_invoice_pdf(order_data))
+    return filename
+
+def read_orders(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (name, raw JSON) pairs from a JSONL file or a directory of .json files."""
+    if os.path.isdir(path):
+        for entry in sorted(os.listdir(path)):
+            if entry.endswith('.json'):
+                with open(os.path.join(path, entry), 'r') as f:
+                    yield os.path.splitext(entry)[0], f.read()
+        return
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                yield f"{stem}_{line_number}", line
+
+def _quiet_worker():
+    # Per-invoice progress prints would drown the batch report
+    sys.stdout = open(os.devnull, 'w')
+
+def render_order(job: Tuple[str, str]) -> Tuple[str, Optional[bytes], float, Optional[str]]:
+    """Render one order in a worker process; failures come back as an error message."""
+    name, raw = job
+    start = time.perf_counter()
+    try:
+        order_data = OrderDetails.model_validate_json(raw)
+        return name, create_invoice_pdf(order_data), time.perf_counter() - start, None
+    except Exception as e:
+        return name, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+def run_batch(path: str, workers: int, out_dir: str, zip_path: Optional[str]) -> int:
+    jobs = list(read_orders(path))
+    if not jobs:
+        print(f"No orders found in {path}")
+        return 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    archive = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) if zip_path else None
+    if archive is None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    latencies, failures = [], []
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_quiet_worker) as executor:
+            for name, pdf, latency, error in executor.map(render_order, jobs, chunksize=chunksize):
+                latencies.append(latency)
+                if error is not None:
+                    failures.append((name, error))
+                elif archive is not None:
+                    archive.writestr(f"{name}.pdf", pdf)
+                else:
+                    with open(os.path.join(out_dir, f"{name}.pdf"), 'wb') as f:
+                        f.write(pdf)
+    finally:
+        if archive is not None:
+            archive.close()
+    elapsed = time.perf_counter() - start
+
+    for name, error in failures:
+        print(f"FAILED {name}: {error}")
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"Rendered {len(jobs) - len(failures)}/{len(jobs)} invoices to {zip_path or out_dir} "
+          f"with {workers} workers in {elapsed:.2f}s ({len(jobs) / elapsed:.1f} invoices/s)")
+    print(f"Per-invoice latency: p50 {quantiles[49] * 1000:.1f} ms, "
+          f"p95 {quantiles[94] * 1000:.1f} ms, p99 {quantiles[98] * 1000:.1f} ms")
+    return 1 if failures else 0
+
 def main():
-    parser = argparse.ArgumentParser(description='Generate an invoice PDF from order details')
-    parser.add_argument('--order', type=str, required=True, 
-                       help='Order details in JSON format or path to JSON file')
-    
+    parser = argparse.ArgumentParser(description='Generate invoice PDFs from order details')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--order', type=str,
+                        help='Order details in JSON format or path to JSON file')
+    source.add_argument('--batch', type=str,
+                        help='JSONL file with one order per line, or a directory of order .json files')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes for --batch (default: CPU count)')
+    parser.add_argument('--out-dir', type=str, default='invoices',
+                        help='Directory for --batch output PDFs')
+    parser.add_argument('--zip', type=str, default=None,
+                        help='Write --batch output into this zip file instead of --out-dir')
+
     args = parser.parse_args()
-    
+
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.workers, args.out_dir, args.zip))
+
     try:
         # Try to parse as direct JSON string
         order_json = json.loads(args.order)
         order_data = OrderDetails.model_validate(order_json)
-        filename = create_invoice_pdf(order_data)  # Use the internal function directly
+        filename = write_invoice(order_data)
         print(f"Invoice generated successfully: {filename}")
     except json.JSONDecodeError:
         # If not valid JSON, try to read from file
@@ -21,11 +114,11 @@ def main():
             with open(args.order, 'r') as f:
                 order_json = json.load(f)
                 order_data = OrderDetails.model_validate(order_json)
-                filename = create_invoice_pdf(order_data)  # Use the internal function directly
+                filename = write_invoice(order_data)
                 print(f"Invoice generated successfully: {filename}")
         except:
             print("Error: Please provide valid JSON data or a path to a JSON file")
             exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,140 @@
+import base64
+import binascii
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from services.mailer.settings import settings
+
+# Longest body handed to the agent (about 5k tokens); quoted history is already stripped
+MAX_BODY_CHARS = settings.max_body_chars
+
+# A line that introduces quoted history; everything from it on is dropped
+_QUOTE_HEADER = re.compile(
+    r'^\s*(On .{1,200}wrote:|-{2,}\s*Original Message\s*-{2,}|-{2,}\s*Forwarded message\s*-{2,}'
+    r'|From:\s.+|_{10,})\s*$',
+    re.IGNORECASE,
+)
+# Signature delimiter ("-- ") and common client footers
+_SIGNATURE = re.compile(r'^(--\s?|Sent from my \w+.*|Get Outlook for \w+.*)$', re.IGNORECASE)
+_BLANK_LINES = re.compile(r'\n{3,}')
+_CHARSET = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+
+def get_header(headers: List[Dict], name: str, default: str = '') -> str:
+    """Case-insensitive header lookup that tolerates missing headers."""
+    name = name.lower()
+    for header in headers or []:
+        if header.get('name', '').lower() == name:
+            return header.get('value', default)
+    return default
+
+
+def decode_base64url(data: str) -> bytes:
+    """Decode Gmail's unpadded base64url body data."""
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class _TextExtractor(HTMLParser):
+    _BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'table', 'blockquote'}
+    _SKIP_TAGS = {'style', 'script', 'head'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip = 0
+        self._quote = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TAGS:
+            self._skip += 1
+        elif tag == 'blockquote' or (tag == 'div' and ('class', 'gmail_quote') in attrs):
+            self._quote += 1
+        if tag in self._BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag == 'blockquote' and self._quote:
+            self._quote -= 1
+        if tag in self._BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip and not self._quote:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Reduce an HTML body to its visible text, leaving out quoted blocks."""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    lines = (' '.join(line.split()) for line in ''.join(parser.parts).splitlines())
+    return '\n'.join(lines)
+
+
+def strip_quoted_text(text: str) -> str:
+    """Drop quoted reply history and the signature, keeping only what the customer just wrote."""
+    kept = []
+    for line in text.splitlines():
+        stripped = line.rstrip()
+        if (kept and _QUOTE_HEADER.match(stripped)) or _SIGNATURE.match(stripped):
+            break
+        if stripped.startswith('>'):
+            continue
+        kept.append(stripped)
+    return _BLANK_LINES.sub('\n\n', '\n'.join(kept)).strip()
+
+
+def _find_text_parts(payload: Dict) -> Dict[str, Dict]:
+    """Return the first text/plain and text/html leaf parts, skipping attachments."""
+    found: Dict[str, Dict] = {}
+    stack = [payload]
+    while stack and len(found) < 2:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            # Reversed so the stack visits parts in document order
+            stack.extend(reversed(children))
+            continue
+        mime_type = part.get('mimeType', '')
+        is_attachment = part.get('filename') or 'attachmentId' in part.get('body', {})
+        if mime_type in ('text/plain', 'text/html') and not is_attachment and mime_type not in found:
+            found[mime_type] = part
+    return found
+
+
+def _decode_part(part: Dict) -> str:
+    data = part.get('body', {}).get('data')
+    if not data:
+        return ''
+    match = _CHARSET.search(get_header(part.get('headers', []), 'Content-Type'))
+    charset = match.group(1) if match else 'utf-8'
+    try:
+        raw = decode_base64url(data)
+    except (binascii.Error, ValueError):
+        return ''
+    try:
+        return raw.decode(charset, errors='replace')
+    except LookupError:
+        return raw.decode('utf-8', errors='replace')
+
+
+def extract_body(payload: Dict, max_chars: int = MAX_BODY_CHARS) -> Optional[str]:
+    """Return the new text of a Gmail ``format='full'`` message payload, or None if it has none.
+
+    Prefers text/plain over text/html, only decodes the chosen part and never touches
+    attachment data.
+    """
+    parts = _find_text_parts(payload)
+    if not parts:
+        return None
+    text = _decode_part(parts['text/plain']) if 'text/plain' in parts else ''
+    if not text.strip() and 'text/html' in parts:
+        text = html_to_text(_decode_part(parts['text/html']))
+    text = strip_quoted_text(text.replace('\r\n', '\n'))
+    if len(text) > max_chars:
+        text = text[:max_chars].rstrip() + '\n[truncated]'
+    return text
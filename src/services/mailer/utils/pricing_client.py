@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from services.mailer.metrics import span
+from services.mailer.settings import settings
+from services.mailer.utils.cache import TTLCache
+
+PRICING_API_URL = settings.pricing_api_url
+PRICE_CACHE_TTL = settings.price_cache_ttl
+TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+API_INFO_KEY = ('api-info',)
+
+
+def _unique(product_ids: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(product_ids))
+
+
+class PricingClient:
+    """Keep-alive client for the pricing API with a TTL/LRU price cache.
+
+    Sync methods share one pooled ``httpx.Client``; the ``a``-prefixed coroutines
+    share an ``httpx.AsyncClient`` per event loop so lookups can run concurrently.
+    Unknown products map to ``None``.
+    """
+
+    def __init__(self, base_url: str = PRICING_API_URL, cache: Optional[TTLCache] = None):
+        self.base_url = base_url
+        self.cache = cache or TTLCache(maxsize=1024, ttl=PRICE_CACHE_TTL)
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._api_info: Optional[dict] = None
+        self._api_info_etag: Optional[str] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(base_url=self.base_url, timeout=TIMEOUT, limits=LIMITS)
+            return self._client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(base_url=self.base_url, timeout=TIMEOUT, limits=LIMITS)
+                self._async_clients[loop] = client
+            return client
+
+    @staticmethod
+    def _parse_price(response: httpx.Response) -> Optional[float]:
+        if response.status_code in (404, 422):
+            return None
+        response.raise_for_status()
+        return response.json()['price']
+
+    def get_price(self, product_id: str) -> Optional[float]:
+        price = self.cache.get(product_id)
+        if price is None:
+            with span('pricing_api'):
+                price = self._parse_price(self.client.get(f"/price/{product_id}"))
+            if price is not None:
+                self.cache.set(product_id, price)
+        return price
+
+    def _store_prices(self, product_ids: List[str], payload: Dict) -> Dict[str, Optional[float]]:
+        prices: Dict[str, Optional[float]] = dict.fromkeys(product_ids)
+        for item in payload['prices']:
+            prices[item['product_id']] = item['price']
+            self.cache.set(item['product_id'], item['price'])
+        return prices
+
+    def _split_cached(self, product_ids: Iterable[str]):
+        prices, missing = {}, []
+        for product_id in _unique(product_ids):
+            price = self.cache.get(product_id)
+            if price is None:
+                missing.append(product_id)
+            prices[product_id] = price
+        return prices, missing
+
+    def get_prices(self, product_ids: Iterable[str]) -> Dict[str, Optional[float]]:
+        """Price several products, fetching all cache misses in one POST /prices request."""
+        prices, missing = self._split_cached(product_ids)
+        if missing:
+            with span('pricing_api'):
+                response = self.client.post("/prices", json={"product_ids": missing})
+                response.raise_for_status()
+            prices.update(self._store_prices(missing, response.json()))
+        return prices
+
+    async def aget_price(self, product_id: str) -> Optional[float]:
+        price = self.cache.get(product_id)
+        if price is None:
+            with span('pricing_api'):
+                response = await self._async_client().get(f"/price/{product_id}")
+                price = self._parse_price(response)
+            if price is not None:
+                self.cache.set(product_id, price)
+        return price
+
+    async def aget_prices(self, product_ids: Iterable[str]) -> Dict[str, Optional[float]]:
+        prices, missing = self._split_cached(product_ids)
+        if missing:
+            with span('pricing_api'):
+                response = await self._async_client().post("/prices", json={"product_ids": missing})
+                response.raise_for_status()
+            prices.update(self._store_prices(missing, response.json()))
+        return prices
+
+    def get_api_info(self) -> dict:
+        info = self.cache.get(API_INFO_KEY)
+        if info is None:
+            # Revalidate an expired copy with its ETag instead of downloading it again
+            headers = {"If-None-Match": self._api_info_etag} if self._api_info_etag else {}
+            with span('pricing_api'):
+                response = self.client.get("/api-info", headers=headers)
+            if response.status_code == 304:
+                info = self._api_info
+            else:
+                response.raise_for_status()
+                info = response.json()
+                self._api_info = info
+                self._api_info_etag = response.headers.get("ETag")
+            self.cache.set(API_INFO_KEY, info)
+        return info
+
+    def invalidate(self, product_id: Optional[str] = None) -> None:
+        """Forget one cached price, or every cached response when no id is given."""
+        self.cache.invalidate(product_id)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            # Async clients can only be closed from their own loop; drop them for GC
+            self._async_clients.clear()
+
+
+# Shared by all tools and worker threads
+pricing_client = PricingClient()
@@ -0,0 +1,31 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteConnections:
+    """Connections to a SQLite database in WAL mode, one per thread, opened on first use.
+
+    The database file and its directory are created with schema, so any number of
+    threads and processes can share it.
+    """
+
+    def __init__(self, path: str, schema: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        conn = self.get()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
+
+    def get(self) -> sqlite3.Connection:
+        """This thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: every statement is its own transaction unless wrapped
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,23 @@
+import json
+import os
+from typing import Optional
+
+
+def load_history_id(path: str) -> Optional[str]:
+    """Return the last synced Gmail historyId, or None if no sync has happened yet."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('history_id')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_history_id(path: str, history_id: str) -> None:
+    """Persist the Gmail historyId atomically so a crash never leaves a torn file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'history_id': str(history_id)}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,246 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from services.mailer.mailboxes import current_mailbox
+from services.mailer.settings import settings
+from services.mailer.utils.sqlite_db import SQLiteConnections
+
+WORK_QUEUE_PATH = settings.work_queue_path
+MAX_ATTEMPTS = settings.work_queue_max_attempts
+# A claimed message is handed to another worker if not finished within this time
+LEASE_SECONDS = settings.work_queue_lease_seconds
+BASE_BACKOFF_SECONDS = 30.0
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    message_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    lease_owner TEXT,
+    sender TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (state, available_at);
+CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (state, lease_until);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+"""
+# Columns added after the first release, with the index that needs them
+_MIGRATIONS = (("lease_owner", "TEXT"), ("sender", "TEXT"))
+_SENDER_INDEX = "CREATE INDEX IF NOT EXISTS jobs_sender ON jobs (sender, state)"
+_renewer_lock = threading.Lock()
+
+
+class WorkQueue:
+    """Durable SQLite (WAL) queue of fetched emails awaiting agent processing.
+
+    Messages move pending -> in_progress -> done, or back to pending with exponential
+    backoff on failure until MAX_ATTEMPTS, then failed. A message whose lease
+    expires after its last attempt also ends up failed. Claims are single atomic
+    UPDATE statements, so any number of threads and processes can drain one
+    database file. Each thread uses its own connection.
+
+    Every WorkQueue instance owns the leases it claims and renews them in the
+    background while they are held, so an email waiting behind another one of its
+    sender or retrying a send is never handed to a second worker. complete and fail
+    only apply to a lease this instance still owns. No email is claimed while
+    another instance works on one from the same sender, so one customer's
+    conversation is never handled by two processes at once.
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, base_backoff: float = BASE_BACKOFF_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.owner = uuid.uuid4().hex
+        self._connections = SQLiteConnections(path, _SCHEMA)
+        self._migrate()
+        self._renewer: Optional[threading.Thread] = None
+
+    def _migrate(self) -> None:
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, kind in _MIGRATIONS:
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+        conn.execute(_SENDER_INDEX)
+
+    def _conn(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def enqueue(self, message_id: str, payload: Dict) -> bool:
+        """Add a message unless it is already known; returns True if it was new."""
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO jobs (message_id, payload, state, available_at, updated_at, sender) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (message_id, json.dumps(payload), PENDING, time.time(), time.time(), payload.get('sender_email')),
+        )
+        return cur.rowcount == 1
+
+    def enqueue_many(self, emails: Iterable[Dict]) -> int:
+        """Durably add emails keyed by their Gmail id in one transaction; returns how many were new."""
+        now = time.time()
+        conn = self._conn()
+        before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (message_id, payload, state, available_at, updated_at, sender) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((email['id'], json.dumps(email), PENDING, now, now, email.get('sender_email')) for email in emails),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+    def claim(self) -> Optional[Dict]:
+        """Lease the oldest available message and return its payload, or None if nothing is ready.
+
+        Messages whose lease expired (e.g. their worker crashed) are claimable again,
+        unless they already used up max_attempts: those move to failed, so an email
+        that keeps crashing its worker is not retried forever.
+        """
+        now = time.time()
+        conn = self._conn()
+        cur = conn.execute(
+            "UPDATE jobs SET state = ?, lease_until = NULL, lease_owner = NULL, last_error = ?, updated_at = ? "
+            "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+            (FAILED, f"Lease expired after {self.max_attempts} attempts", now, IN_PROGRESS, now, self.max_attempts),
+        )
+        if cur.rowcount:
+            print(f"[{datetime.now()}] {cur.rowcount} emails failed: lease expired after "
+                  f"{self.max_attempts} attempts")
+        # Emails of a sender another instance is working on wait; this instance's own
+        # dispatcher already runs a sender's emails one at a time
+        row = conn.execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_until = ?, lease_owner = ?, updated_at = ? "
+            "WHERE message_id = COALESCE("
+            "  (SELECT message_id FROM jobs AS job WHERE state = ? AND available_at <= ? AND NOT EXISTS ("
+            "     SELECT 1 FROM jobs AS busy WHERE busy.sender = job.sender AND busy.state = ?"
+            "     AND busy.lease_until >= ? AND busy.lease_owner != ?"
+            "   ) ORDER BY available_at LIMIT 1),"
+            "  (SELECT message_id FROM jobs WHERE state = ? AND lease_until < ? AND attempts < ? LIMIT 1)"
+            ") RETURNING payload",
+            (IN_PROGRESS, now + self.lease_seconds, self.owner, now,
+             PENDING, now, IN_PROGRESS, now, self.owner,
+             IN_PROGRESS, now, self.max_attempts),
+        ).fetchone()
+        if row is None:
+            return None
+        self._start_renewer()
+        return json.loads(row[0])
+
+    def _start_renewer(self) -> None:
+        with _renewer_lock:
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_leases, name='work-queue-leases', daemon=True)
+                self._renewer.start()
+
+    def _renew_leases(self) -> None:
+        """Extend every lease this instance holds a few times per lease period, for as long as the process lives."""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self.renew_leases()
+            except sqlite3.Error as e:
+                print(f"[{datetime.now()}] Could not renew work queue leases: {e}")
+
+    def renew_leases(self) -> int:
+        """Push back the expiry of every lease this instance holds; returns how many were renewed."""
+        return self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE state = ? AND lease_owner = ?",
+            (time.time() + self.lease_seconds, IN_PROGRESS, self.owner),
+        ).rowcount
+
+    def _lost_lease(self, message_id: str) -> None:
+        print(f"[{datetime.now()}] Lease on email {message_id} was lost to another worker; leaving it to them")
+
+    def complete(self, message_id: str) -> bool:
+        """Mark a message this instance holds done; False if its lease was lost meanwhile."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET state = ?, lease_until = NULL, lease_owner = NULL, last_error = NULL, updated_at = ? "
+            "WHERE message_id = ? AND state = ? AND lease_owner = ?",
+            (DONE, time.time(), message_id, IN_PROGRESS, self.owner),
+        )
+        if cur.rowcount == 0:
+            self._lost_lease(message_id)
+        return cur.rowcount == 1
+
+    def fail(self, message_id: str, error: str) -> Optional[str]:
+        """Schedule a retry with exponential backoff, or give up after max_attempts.
+
+        Returns the new state, or None if this instance no longer holds the lease.
+        """
+        conn = self._conn()
+        row = conn.execute("SELECT attempts FROM jobs WHERE message_id = ? AND state = ? AND lease_owner = ?",
+                           (message_id, IN_PROGRESS, self.owner)).fetchone()
+        if row is None:
+            self._lost_lease(message_id)
+            return None
+        attempts = row[0]
+        now = time.time()
+        if attempts >= self.max_attempts:
+            state, available_at = FAILED, now
+        else:
+            # Jitter keeps retries from many workers from landing at the same moment
+            delay = self.base_backoff * 2 ** (attempts - 1)
+            state, available_at = PENDING, now + delay * random.uniform(0.8, 1.2)
+        cur = conn.execute(
+            "UPDATE jobs SET state = ?, available_at = ?, lease_until = NULL, lease_owner = NULL, last_error = ?, "
+            "updated_at = ? WHERE message_id = ? AND state = ? AND lease_owner = ?",
+            (state, available_at, error, now, message_id, IN_PROGRESS, self.owner),
+        )
+        if cur.rowcount == 0:
+            self._lost_lease(message_id)
+            return None
+        return state
+
+    def claim_idempotency_key(self, key: str) -> bool:
+        """Atomically reserve a side effect such as sending an invoice; False if it was already reserved."""
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO idempotency_keys (key, created_at) VALUES (?, ?)", (key, time.time())
+        )
+        return cur.rowcount == 1
+
+    def release_idempotency_key(self, key: str) -> None:
+        """Give a reservation back when the side effect did not happen, so a retry may perform it."""
+        self._conn().execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {PENDING: 0, IN_PROGRESS: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+
+_queues: Dict[str, WorkQueue] = {}
+_queue_lock = threading.Lock()
+
+
+def get_work_queue() -> WorkQueue:
+    """Process-wide queue of the current mailbox (WORK_QUEUE_PATH without one), opened on first use."""
+    mailbox = current_mailbox()
+    path = WORK_QUEUE_PATH if mailbox is None else mailbox.work_queue_path
+    with _queue_lock:
+        if path not in _queues:
+            _queues[path] = WorkQueue(path)
+        return _queues[path]
@@ -135,9 +135,10 @@ checkpointer = MemorySaver()
 # Note that we're (optionally) passing the memory when compiling the graph
 app = workflow.compile(checkpointer=checkpointer)
 
-# Use the agent
-final_state = app.invoke(
-    {"messages": [{"role": "user", "content": "what is the weather in Miami"}]},
-    config={"configurable": {"thread_id": 42}}
-)
-print(final_state["messages"][-1].content)
\ No newline at end of file
+if __name__ == "__main__":
+    # Use the agent
+    final_state = app.invoke(
+        {"messages": [{"role": "user", "content": "what is the weather in Miami"}]},
+        config={"configurable": {"thread_id": 42}}
+    )
+    print(final_state["messages"][-1].content)